@@ -1,13 +1,20 @@
 """
 Chat API routes
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
+from datetime import datetime
 from pydantic import BaseModel
-from app.database.database import get_db
+import logging
+from app.core.config import settings
+from app.core.logging_config import log_context
+from app.database.database import get_async_db, track_queries
 from app.services.chat_service import ChatService
 from app.models.chat import Chat, Message
+import llm_tracing
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/chats", tags=["chats"])
 
@@ -21,7 +28,8 @@ class ChatResponse(BaseModel):
     id: int
     document_id: Optional[int]
     title: Optional[str]
-    created_at: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -36,8 +44,8 @@ class MessageResponse(BaseModel):
     chat_id: int
     role: str
     content: str
-    sources: Optional[dict] = None
-    created_at: str
+    sources: Optional[List[Any]] = None  # Only when include_sources=true in listings
+    created_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -46,15 +54,16 @@ class QueryRequest(BaseModel):
     """Query request model"""
     query: str
     document_id: Optional[int] = None
+    use_history: Optional[bool] = None  # Multi-turn mode; defaults to CHAT_HISTORY_ENABLED
 
 @router.post("/", response_model=ChatResponse)
 async def create_chat(
     chat_data: ChatCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new chat"""
     service = ChatService(db)
-    chat = service.create_chat(
+    chat = await service.create_chat(
         document_id=chat_data.document_id,
         title=chat_data.title
     )
@@ -63,64 +72,91 @@ async def create_chat(
 @router.get("/", response_model=List[ChatResponse])
 async def get_chats(
     document_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    before_id: Optional[int] = Query(None, description="Id of the last chat of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE, description="Page size; all chats if neither limit nor before_id is given"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all chats, optionally filtered by document"""
+    """Get chats, most recently active first, optionally filtered by document"""
+    if limit is None and before_id is not None:
+        limit = settings.CHATS_PAGE_SIZE
     service = ChatService(db)
-    if document_id:
-        chats = service.get_chats_by_document(document_id)
-    else:
-        chats = service.get_all_chats()
-    return chats
+    return await service.get_chats(document_id=document_id, before_id=before_id, limit=limit)
 
 @router.get("/{chat_id}", response_model=ChatResponse)
-async def get_chat(chat_id: int, db: Session = Depends(get_db)):
+async def get_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get chat by ID"""
     service = ChatService(db)
-    chat = service.get_chat(chat_id)
+    chat = await service.get_chat(chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
 
 @router.get("/{chat_id}/messages", response_model=List[MessageResponse])
-async def get_messages(chat_id: int, db: Session = Depends(get_db)):
-    """Get all messages for a chat"""
+async def get_messages(
+    chat_id: int,
+    before_id: Optional[int] = Query(None, description="Id of the oldest message already loaded"),
+    limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE, description="Page size; all messages if neither limit nor before_id is given"),
+    include_sources: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the latest messages of a chat in chronological order"""
+    if limit is None and before_id is not None:
+        limit = settings.MESSAGES_PAGE_SIZE
     service = ChatService(db)
-    chat = service.get_chat(chat_id)
+    chat = await service.get_chat(chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    messages = service.get_messages(chat_id)
+    messages = await service.get_messages(
+        chat_id,
+        before_id=before_id,
+        limit=limit,
+        include_sources=include_sources
+    )
     return messages
 
 @router.post("/{chat_id}/query", response_model=MessageResponse)
 async def process_query(
     chat_id: int,
     request: QueryRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Process a query and generate response"""
-    service = ChatService(db)
-    chat = service.get_chat(chat_id)
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
+    with track_queries() as db_stats, log_context(chat_id=chat_id, stage="chat"):
+        service = ChatService(db)
+        chat = await service.get_chat(chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        
+        # Use document_id from request or chat
+        document_id = request.document_id or chat.document_id
+        
+        message = await service.process_query(
+            chat_id=chat_id,
+            query=request.query,
+            document_id=document_id,
+            use_history=request.use_history,
+            chat=chat
+        )
     
-    # Use document_id from request or chat
-    document_id = request.document_id or chat.document_id
-    
-    message = await service.process_query(
-        chat_id=chat_id,
-        query=request.query,
-        document_id=document_id
+    llm_tracing.set_attributes(db_statements=db_stats["statements"], db_ms=round(db_stats["seconds"] * 1000, 1))
+    logger.info(
+        f"Query in chat {chat_id}: DB {db_stats['statements']} statements, "
+        f"{db_stats['commits']} commits, {db_stats['seconds'] * 1000:.1f} ms",
+        extra={
+            "chat_id": chat_id,
+            "db_statements": db_stats["statements"],
+            "db_commits": db_stats["commits"],
+            "db_ms": round(db_stats["seconds"] * 1000, 1)
+        }
     )
-    
     return message
 
 @router.delete("/{chat_id}")
-async def delete_chat(chat_id: int, db: Session = Depends(get_db)):
+async def delete_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a chat"""
     service = ChatService(db)
-    success = service.delete_chat(chat_id)
+    success = await service.delete_chat(chat_id)
     if not success:
         raise HTTPException(status_code=404, detail="Chat not found")
     return {"message": "Chat deleted successfully"}
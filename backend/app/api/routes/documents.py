@@ -3,15 +3,17 @@ Document API routes
 """
 import os
 import logging
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.services.document_service import DocumentService
 from app.services.pageindex_service import PageIndexService
 from app.models.document import Document, DocumentStatus
 from app.core.config import settings
+from app.core.logging_config import log_context
+import llm_tracing
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +33,28 @@ class DocumentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DocumentSummary(BaseModel):
+    """Document list item"""
+    id: int
+    filename: str
+    status: str
+    created_at: str
+    updated_at: Optional[str]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check with weak comparison"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Загружает и индексирует PDF документ
@@ -68,7 +87,7 @@ async def upload_document(
         file_path = document_service.save_uploaded_file(file_content, file.filename)
         
         # Создание записи в БД
-        document = document_service.create_document(
+        document = await document_service.create_document(
             filename=file.filename,
             file_path=file_path
         )
@@ -77,8 +96,7 @@ async def upload_document(
         background_tasks.add_task(
             index_document_task,
             document_id=document.id,
-            file_path=file_path,
-            db=db
+            file_path=file_path
         )
         
         logger.info(f"Документ {document.id} загружен, индексация запущена в фоне")
@@ -100,21 +118,30 @@ async def upload_document(
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке документа: {str(e)}")
 
-@router.get("/", response_model=List[DocumentResponse])
-async def get_documents(db: Session = Depends(get_db)):
-    """Получить список всех документов"""
+@router.get("/", response_model=List[DocumentSummary])
+async def get_documents(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """
+    Получить список всех документов (id, имя, статус, даты).
+    
+    Поддерживает ETag/If-None-Match: пока список не изменился, опрос
+    получает 304 без выборки документов.
+    """
     try:
         document_service = DocumentService(db)
-        documents = document_service.get_all_documents()
+        # Версия читается до списка: при гонке ETag окажется старее данных
+        # и клиент просто перезапросит список при следующем опросе
+        etag = await document_service.get_documents_etag()
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
         
+        documents = await document_service.list_documents()
+        response.headers.update(headers)
         return [
-            DocumentResponse(
+            DocumentSummary(
                 id=doc.id,
                 filename=doc.filename,
-                file_path=doc.file_path,
-                index_path=doc.index_path,
                 status=doc.status.value,
-                error_message=doc.error_message,
                 created_at=doc.created_at.isoformat() if doc.created_at else "",
                 updated_at=doc.updated_at.isoformat() if doc.updated_at else None
             )
@@ -125,11 +152,11 @@ async def get_documents(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Ошибка при получении документов: {str(e)}")
 
 @router.get("/{document_id}", response_model=DocumentResponse)
-async def get_document(document_id: int, db: Session = Depends(get_db)):
+async def get_document(document_id: int, db: AsyncSession = Depends(get_async_db)):
     """Получить документ по ID"""
     try:
         document_service = DocumentService(db)
-        document = document_service.get_document(document_id)
+        document = await document_service.get_document(document_id)
         
         if not document:
             raise HTTPException(status_code=404, detail="Документ не найден")
@@ -150,12 +177,22 @@ async def get_document(document_id: int, db: Session = Depends(get_db)):
         logger.error(f"Ошибка при получении документа: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при получении документа: {str(e)}")
 
+@router.get("/{document_id}/profile")
+async def get_indexing_profile(document_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Профиль последней индексации: время, LLM-запросы и токены по этапам PageIndex"""
+    document = await DocumentService(db).get_document(document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Документ не найден")
+    if not document.indexing_profile:
+        raise HTTPException(status_code=404, detail="Профиль индексации не записан (PAGEINDEX_PROFILE=false или индексация не завершена)")
+    return document.indexing_profile
+
 @router.delete("/{document_id}")
-async def delete_document(document_id: int, db: Session = Depends(get_db)):
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_async_db)):
     """Удалить документ"""
     try:
         document_service = DocumentService(db)
-        success = document_service.delete_document(document_id)
+        success = await document_service.delete_document(document_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Документ не найден")
@@ -167,31 +204,37 @@ async def delete_document(document_id: int, db: Session = Depends(get_db)):
         logger.error(f"Ошибка при удалении документа: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при удалении документа: {str(e)}")
 
-def index_document_task(document_id: int, file_path: str, db: Session):
+def run_indexing(file_path: str, document_id: int) -> dict:
+    """Синхронная индексация PageIndex - выполняется в отдельном потоке"""
+    return PageIndexService().index_document(
+        pdf_path=file_path,
+        document_id=document_id
+    )
+
+async def index_document_task(document_id: int, file_path: str):
     """
     Фоновая задача для индексации документа
     """
-    from app.database.database import SessionLocal
+    # document_id и stage попадают во все записи лога индексации, в том числе из потока PageIndex;
+    # индексация - отдельная трасса, а не продолжение уже завершенного запроса загрузки
+    with log_context(document_id=document_id, stage="indexing"), \
+            llm_tracing.span("document.index", new_trace=True, document_id=document_id):
+        await _index_document(document_id, file_path)
+
+async def _index_document(document_id: int, file_path: str):
+    from app.database.database import AsyncSessionLocal
     from app.api.routes.websocket import get_connection_manager
     import asyncio
     
     # Создаем новую сессию БД для фоновой задачи
-    db_session = SessionLocal()
+    db_session = AsyncSessionLocal()
     document_service = DocumentService(db_session)
-    pageindex_service = PageIndexService()
     connection_manager = get_connection_manager()
     
-    def send_ws_message(message: dict):
+    async def send_ws_message(message: dict):
         """Вспомогательная функция для отправки WebSocket сообщений"""
         try:
-            # Используем asyncio для отправки в синхронном контексте
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # Если цикл уже запущен, создаем задачу
-                asyncio.create_task(connection_manager.broadcast_to_document(document_id, message))
-            else:
-                # Если цикл не запущен, запускаем его
-                loop.run_until_complete(connection_manager.broadcast_to_document(document_id, message))
+            await connection_manager.broadcast_to_document(document_id, message)
         except Exception as ws_error:
             logger.debug(f"Не удалось отправить WebSocket сообщение: {ws_error}")
     
@@ -199,7 +242,7 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         logger.info(f"Начало индексации документа {document_id}: {file_path}")
         
         # Отправляем начальный статус через WebSocket
-        send_ws_message({
+        await send_ws_message({
             "type": "indexing_status",
             "status": "indexing",
             "message": "Начало индексации документа...",
@@ -207,7 +250,7 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         })
         
         # Обновляем статус на INDEXING
-        document_service.update_document_status(
+        await document_service.update_document_status(
             document_id=document_id,
             status=DocumentStatus.INDEXING
         )
@@ -218,23 +261,21 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         logger.info(f"Начало индексации документа {document_id}. Это может занять несколько минут для больших файлов...")
         
         # Отправляем прогресс
-        send_ws_message({
+        await send_ws_message({
             "type": "indexing_status",
             "status": "indexing",
             "message": "Извлечение структуры документа...",
             "progress": 10
         })
         
-        result = pageindex_service.index_document(
-            pdf_path=file_path,
-            document_id=document_id
-        )
+        # PageIndex работает синхронно - выносим в поток, чтобы не блокировать event loop
+        result = await asyncio.to_thread(run_indexing, file_path, document_id)
         
         elapsed_time = time.time() - start_time
         logger.info(f"Индексация документа {document_id} заняла {elapsed_time:.2f} секунд ({elapsed_time/60:.2f} минут)")
         
         # Отправляем успешный статус
-        send_ws_message({
+        await send_ws_message({
             "type": "indexing_status",
             "status": "ready",
             "message": f"Индексация завершена успешно за {elapsed_time/60:.1f} минут",
@@ -242,10 +283,11 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         })
         
         # Обновляем статус на READY
-        document_service.update_document_status(
+        await document_service.update_document_status(
             document_id=document_id,
             status=DocumentStatus.READY,
-            index_path=result["index_path"]
+            index_path=result["index_path"],
+            indexing_profile=result.get("profile")
         )
         
         logger.info(f"Индексация документа {document_id} завершена успешно")
@@ -257,7 +299,7 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         logger.error(traceback.format_exc())
         
         # Отправляем ошибку через WebSocket
-        send_ws_message({
+        await send_ws_message({
             "type": "indexing_status",
             "status": "error",
             "message": error_msg,
@@ -266,7 +308,7 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         
         # Обновляем статус на ERROR
         try:
-            document_service.update_document_status(
+            await document_service.update_document_status(
                 document_id=document_id,
                 status=DocumentStatus.ERROR,
                 error_message=error_msg[:500]  # Ограничиваем длину сообщения об ошибке
@@ -277,4 +319,4 @@ def index_document_task(document_id: int, file_path: str, db: Session):
         raise Exception(error_msg)
     
     finally:
-        db_session.close()
+        await db_session.close()
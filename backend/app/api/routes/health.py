@@ -1,11 +1,24 @@
 """
 Health check routes
 """
-from fastapi import APIRouter
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.logging_config import LOG_FILE
+from app.services.log_reader import tail_lines, read_since
 from app.services.ollama_service import OllamaService
+from app.services.warmup_service import get_model_warmer
+from app.services.answer_cache import get_answer_cache
+from app.services.semantic_cache import get_semantic_cache
+from ollama_pool import pools_status
+from llm_scheduler import scheduler_status
 
 router = APIRouter(prefix="/api/health", tags=["health"])
 
+LOG_STREAM_POLL_INTERVAL = 0.5  # Секунд между проверками новых строк
+LOG_STREAM_KEEPALIVE = 15  # Комментарий-пинг, чтобы прокси не закрывали тихое соединение
+
 @router.get("/")
 async def health_check():
     """Basic health check"""
@@ -23,29 +36,97 @@ async def ollama_health_check():
     return {
         "status": "healthy" if is_available else "unavailable",
         "ollama_available": is_available,
-        "model": service.model
+        "model": service.model,
+        "model_warmup": await get_model_warmer().get_status() if is_available else None,
+        "pools": pools_status(),
+        "scheduler": scheduler_status()
+    }
+
+@router.get("/cache")
+async def cache_stats():
+    """Answer cache statistics"""
+    return {
+        **get_answer_cache().get_stats(),
+        "semantic": get_semantic_cache().get_stats()
     }
 
 @router.get("/logs")
-async def get_logs(lines: int = 100):
-    """Get recent backend logs"""
-    from pathlib import Path
-    import os
-    
-    log_file = Path(__file__).parent.parent.parent / "logs" / "backend.log"
+async def get_logs(
+    lines: int = Query(100, ge=1, le=10000),
+    since_offset: Optional[int] = Query(None, ge=0, description="Offset from a previous response: return only newer lines"),
+    file_id: Optional[int] = Query(None, description="file_id from the same response: detects rotation")
+):
+    """
+    Get recent backend logs.
     
-    if not log_file.exists():
+    Without since_offset returns the last `lines` lines; with it - the lines
+    written since that offset (follow mode). Pass the returned `offset`
+    and `file_id` back to continue.
+    """
+    if not LOG_FILE.exists():
         return {"logs": [], "message": "Log file not found"}
     
     try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            recent_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
-            return {
-                "logs": recent_lines,
-                "total_lines": len(all_lines),
-                "returned_lines": len(recent_lines)
-            }
+        rotated = False
+        if since_offset is None:
+            recent_lines, offset, current_id = await asyncio.to_thread(tail_lines, str(LOG_FILE), lines)
+        else:
+            recent_lines, offset, rotated, current_id = await asyncio.to_thread(
+                read_since, str(LOG_FILE), since_offset, file_id
+            )
+        return {
+            "logs": recent_lines,
+            "returned_lines": len(recent_lines),
+            "offset": offset,
+            "file_id": current_id,
+            "rotated": rotated
+        }
     except Exception as e:
         return {"error": str(e), "logs": []}
 
+@router.get("/logs/stream")
+async def stream_logs(request: Request, since_offset: Optional[int] = Query(None, ge=0)):
+    """
+    Live tail of the backend log as Server-Sent Events.
+    
+    Every event carries the new lines (one `data:` field per line) and
+    "file_id:offset" after them as the event id, so EventSource resumes from
+    Last-Event-ID after a reconnect, also across a log rotation.
+    """
+    if not LOG_FILE.exists():
+        raise HTTPException(status_code=404, detail="Log file not found")
+    
+    file_id = None
+    last_event_id = request.headers.get("last-event-id") or ""
+    if since_offset is None:
+        event_file_id, _, event_offset = last_event_id.rpartition(":")
+        if event_offset.isdigit() and (not event_file_id or event_file_id.isdigit()):
+            since_offset = int(event_offset)
+            file_id = int(event_file_id) if event_file_id else None
+    if since_offset is None:
+        _, since_offset, file_id = await asyncio.to_thread(tail_lines, str(LOG_FILE), 0)
+    
+    async def events():
+        offset, current_id = since_offset, file_id
+        idle = 0.0
+        while not await request.is_disconnected():
+            try:
+                new_lines, offset, _, current_id = await asyncio.to_thread(read_since, str(LOG_FILE), offset, current_id)
+            except FileNotFoundError:  # между переименованием при ротации и созданием нового файла
+                new_lines = []
+            if new_lines:
+                idle = 0.0
+                data = "".join(f"data: {line}\n" for line in (raw.rstrip("\r\n") for raw in new_lines))
+                yield f"id: {current_id}:{offset}\n{data}\n"
+                continue
+            if idle >= LOG_STREAM_KEEPALIVE:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(LOG_STREAM_POLL_INTERVAL)
+            idle += LOG_STREAM_POLL_INTERVAL
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
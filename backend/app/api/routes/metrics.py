@@ -0,0 +1,45 @@
+"""
+Prometheus metrics endpoint
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.services.answer_cache import get_answer_cache
+from app.services.semantic_cache import get_semantic_cache
+import llm_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+def _cache_stats():
+    return (("answer", get_answer_cache().get_stats()), ("semantic", get_semantic_cache().get_stats()))
+
+
+def _cache_lookups():
+    return [
+        sample
+        for name, stats in _cache_stats()
+        for sample in (((name, "hit"), stats["hits"]), ((name, "miss"), stats["misses"]))
+    ]
+
+
+llm_metrics.register_callback(
+    "answer_cache_lookups_total",
+    "Обращения к кэшам ответов: hit / miss (hit rate = hit / (hit + miss))",
+    "counter",
+    ("cache", "result"),
+    _cache_lookups
+)
+llm_metrics.register_callback(
+    "answer_cache_entries",
+    "Записей в кэшах ответов",
+    "gauge",
+    ("cache",),
+    lambda: [((name,), stats["entries"]) for name, stats in _cache_stats()]
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics in the Prometheus text format"""
+    # Content-Type заголовком: media_type Starlette дописал бы второй charset
+    return Response(llm_metrics.render(), headers={"Content-Type": llm_metrics.CONTENT_TYPE})
@@ -0,0 +1,29 @@
+"""
+LLM usage routes: aggregates over the llm_calls accounting table
+"""
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.database import get_async_db
+from app.services.llm_accounting import get_llm_accounting
+
+router = APIRouter(prefix="/api/usage", tags=["usage"])
+
+@router.get("/")
+async def get_usage(
+    group_by: str = Query("caller,model", description="Comma-separated: caller, model, document_id, backend, day"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    caller: Optional[str] = None,
+    document_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """LLM calls, tokens and model seconds per group (records reach the table within LLM_ACCOUNTING_FLUSH_INTERVAL)"""
+    accounting = get_llm_accounting()
+    names = [name.strip() for name in group_by.split(",") if name.strip()]
+    try:
+        rows = await accounting.aggregate(db, names, since=since, until=until, caller=caller, document_id=document_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": names, "rows": rows, "accounting": accounting.get_stats()}
@@ -0,0 +1,181 @@
+"""
+Logging configuration
+
+Records go through a QueueHandler: the logging call only puts the record on
+a queue, and a QueueListener thread formats and writes it. The file gets
+one JSON object per line with structured fields (document_id, chat_id,
+caller, stage, latency_ms, ...), the console gets the usual text format.
+Identical hot-path messages repeated within LOG_DEDUP_WINDOW seconds are
+dropped before they reach the queue and counted in the next one.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.core.config import settings
+
+LOG_DIR = Path(__file__).parent.parent.parent / "logs"
+LOG_FILE = LOG_DIR / "backend.log"
+TRACE_FILE = LOG_DIR / "traces.jsonl"
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Атрибуты, которые есть у любой LogRecord: все остальные - структурные поля из extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+# Поля текущего запроса или задачи, добавляются ко всем записям в блоке log_context()
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields):
+    """with log_context(document_id=1, stage="indexing"): ... - fields for every record in the block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _llm_context() -> Dict[str, Any]:
+    # Атрибуты LLM-запроса (caller, document_id) - только если pageindex_ollama уже загружен
+    module = sys.modules.get("pageindex_ollama")
+    return module.get_llm_context() if module is not None else {}
+
+
+def _trace_id() -> Optional[str]:
+    module = sys.modules.get("llm_tracing")
+    return module.current_trace_id() if module is not None else None
+
+
+class ContextFilter(logging.Filter):
+    """Copies log_context() and llm_context() fields and the trace id onto the record in the calling thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in {**_llm_context(), **_log_context.get()}.items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        trace_id = _trace_id()
+        if trace_id is not None and not hasattr(record, "trace_id"):
+            record.trace_id = trace_id
+        return True
+
+
+class DeduplicateFilter(logging.Filter):
+    """
+    Drops a record identical (logger, level, text) to one logged less than
+    ``window`` seconds ago. The next record that gets through reports how
+    many were dropped. Errors and records with structured fields (extra=...,
+    i.e. measurements) are never dropped.
+    """
+
+    def __init__(self, window: float, max_level: int = logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.max_level = max_level
+        self._seen: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or not _RECORD_ATTRS.issuperset(vars(record)):
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > 1000:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+        if suppressed:
+            record.msg = f"{record.getMessage()} (повторялось еще {suppressed} раз)"
+            record.args = None
+            record.repeated = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, structured fields, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    """QueueHandler that keeps structured fields and the traceback as separate attributes"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Log to the console and to logs/backend.log (rotated by size) through a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+    LOG_DIR.mkdir(exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=settings.LOG_MAX_BYTES,
+        backupCount=settings.LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter() if settings.LOG_JSON else logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler()  # Also log to console
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler = _RecordQueueHandler(queue.SimpleQueue())
+    if settings.LOG_DEDUP_WINDOW > 0:
+        # До ContextFilter: поля контекста не должны выглядеть как extra
+        queue_handler.addFilter(DeduplicateFilter(settings.LOG_DEDUP_WINDOW))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.INFO)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
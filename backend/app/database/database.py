@@ -2,39 +2,247 @@
 Database configuration and session management
 """
 import logging
-from sqlalchemy import create_engine
+import sys
+import time
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, Delete, Insert, Update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+# Async drivers for the sync URLs accepted in DATABASE_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    """sqlite:///db -> sqlite+aiosqlite:///db, postgresql://... -> postgresql+asyncpg://..."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.drivername in ASYNC_DRIVERS.values() or backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def sqlite_pragmas(mmap_size: int) -> list:
+    """PRAGMAs of the tuned SQLite profile"""
+    return [
+        # WAL: readers do not block the writer and the writer does not block readers
+        "PRAGMA journal_mode=WAL",
+        # In WAL mode NORMAL is still safe against corruption, fsync only at checkpoints
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={mmap_size}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+def _apply_sqlite_pragmas(engine, mmap_size: int):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(mmap_size):
+            cursor.execute(pragma)
+        cursor.close()
+
+def uses_sqlite_tuning(url: str, profile: str) -> bool:
+    """Tuned SQLite profile (WAL) needs a database file: an in-memory database is per connection"""
+    parsed = make_url(url)
+    return (
+        parsed.get_backend_name() == "sqlite"
+        and profile == "tuned"
+        and parsed.database not in (None, "", ":memory:")
+    )
+
+def sqlite_connect_args(url: str) -> dict:
+    """sqlite3 waits up to `timeout` seconds for a lock instead of failing with 'database is locked'"""
+    if make_url(url).get_backend_name() != "sqlite":
+        return {}
+    return {"timeout": settings.SQLITE_BUSY_TIMEOUT / 1000}
+
+# Per-request DB statistics, see track_queries()
+_query_stats: contextvars.ContextVar = contextvars.ContextVar("db_query_stats", default=None)
+
+@contextmanager
+def track_queries():
+    """with track_queries() as stats: ... - count statements, commits and DB time in the block"""
+    stats = {"statements": 0, "commits": 0, "seconds": 0.0}
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+def _tracing():
+    # Спаны запросов - только если корневой модуль трассировки уже загружен
+    return sys.modules.get("llm_tracing")
+
+def _install_query_timing(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _query_stats.get() is not None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+        tracing = _tracing()
+        if tracing is not None:
+            conn.info.setdefault("query_spans", []).append(
+                tracing.start_span("db.query", statement=statement[:200], executemany=executemany)
+            )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _query_stats.get()
+        starts = conn.info.get("query_start")
+        if stats is not None and starts:
+            stats["statements"] += 1
+            stats["seconds"] += time.perf_counter() - starts.pop()
+        spans = conn.info.get("query_spans")
+        if spans:
+            _tracing().end_span(spans.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute не вызывается для упавшего запроса
+        conn = exception_context.connection
+        if conn is None:
+            return
+        starts = conn.info.get("query_start")
+        if starts:
+            starts.pop()
+        spans = conn.info.get("query_spans")
+        if spans:
+            _tracing().end_span(spans.pop(), exception_context.original_exception)
+
+    @event.listens_for(engine, "commit")
+    def commit(conn):
+        stats = _query_stats.get()
+        if stats is not None:
+            stats["commits"] += 1
+
+def server_pool_args(url: str) -> dict:
+    """Pool settings for server databases (PostgreSQL); SQLite pools are configured by its profile"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def create_sync_engine(url: str, profile: str = "default"):
+    """Sync engine: schema setup at startup and scripts"""
+    connect_args = sqlite_connect_args(url)
+    if connect_args:
+        connect_args["check_same_thread"] = False
+    sync_engine = create_engine(url, connect_args=connect_args, **server_pool_args(url))
+    _install_query_timing(sync_engine)
+    if uses_sqlite_tuning(url, profile):
+        _apply_sqlite_pragmas(sync_engine, settings.SQLITE_MMAP_SIZE)
+    return sync_engine
+
+def create_async_engines(url: str, profile: str = "default"):
+    """
+    (reader, writer) async engines. With the tuned SQLite profile the reader
+    gets a connection pool and all writes go through a single connection, so
+    writers queue in the pool instead of contending for the file lock.
+    Otherwise both are the same engine.
+    """
+    async_url = get_async_database_url(url)
+    connect_args = sqlite_connect_args(url)
+    if not uses_sqlite_tuning(url, profile):
+        read_engine = create_async_engine(async_url, connect_args=connect_args, **server_pool_args(url))
+        _install_query_timing(read_engine.sync_engine)
+        return read_engine, read_engine
+
+    # aiosqlite defaults to NullPool (a new connection and thread per checkout)
+    read_engine = create_async_engine(
+        async_url,
+        connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SQLITE_READ_POOL_SIZE,
+        max_overflow=settings.SQLITE_READ_POOL_MAX_OVERFLOW
+    )
+    write_engine = create_async_engine(
+        async_url,
+        connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        # Очередь писателей ждет в пуле, а не в busy_timeout SQLite: по истечении -
+        # sqlalchemy.exc.TimeoutError, API отвечает 503
+        pool_timeout=settings.SQLITE_BUSY_TIMEOUT / 1000
+    )
+    for async_engine_ in (read_engine, write_engine):
+        _apply_sqlite_pragmas(async_engine_.sync_engine, settings.SQLITE_MMAP_SIZE)
+        _install_query_timing(async_engine_.sync_engine)
+    return read_engine, write_engine
+
+def create_async_session_factory(read_engine, write_engine):
+    """
+    Async session factory routing flushes and DML to the writer engine.
+    After the first write the session stays on the writer until commit or
+    rollback, so it reads its own uncommitted rows.
+    """
+
+    class RoutingSession(Session):
+        _writing = False
+
+        def get_bind(self, mapper=None, clause=None, **kwargs):
+            if self._writing or self._flushing or isinstance(clause, (Insert, Update, Delete)):
+                self._writing = True
+                return write_engine.sync_engine
+            return read_engine.sync_engine
+
+    @event.listens_for(RoutingSession, "after_transaction_end")
+    def release_writer(session, transaction):
+        # Только внешняя транзакция (commit, rollback, close), не SAVEPOINT
+        if transaction.parent is None:
+            session._writing = False
+
+    # expire_on_commit=False: attributes stay readable after commit without lazy loads
+    return async_sessionmaker(
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+engine = create_sync_engine(settings.DATABASE_URL, settings.SQLITE_PROFILE)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engines: all request handling, so DB I/O does not block the event loop
+async_engine, async_write_engine = create_async_engines(settings.DATABASE_URL, settings.SQLITE_PROFILE)
+AsyncSessionLocal = create_async_session_factory(async_engine, async_write_engine)
+
 # Base class for models
 Base = declarative_base()
 
 def get_db():
-    """Dependency for getting database session"""
+    """Dependency for getting a sync database session"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
-    """Initialize database - create all tables"""
+    """Initialize database - create tables and apply pending migrations"""
+    from app.database.migrations import migrate
     try:
-        Base.metadata.create_all(bind=engine)
+        migrate(engine, Base.metadata)
         logging.info("Database tables created/verified successfully")
     except Exception as e:
         logging.error(f"Error initializing database: {e}")
         import traceback
         logging.error(traceback.format_exc())
         raise
-
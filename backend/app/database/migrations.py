@@ -0,0 +1,159 @@
+"""
+Versioned schema migrations, applied at startup
+
+Each migration has a version number and an upgrade function that takes a
+connection inside a transaction. Applied versions are recorded in the
+schema_migrations table. A new database is created from the models and
+stamped with the latest version; an existing one gets the migrations it has
+not seen yet, in order. Everything runs in one transaction under a lock,
+so a failed migration leaves the schema as it was and concurrently
+starting replicas migrate one after another.
+
+Migrations must not import the models: they describe the schema as it was
+at their version. They are written to be safe on databases that were
+patched before versioning existed (columns added by hand etc.).
+
+    python -m app.database.migrations          # apply pending migrations
+    python -m app.database.migrations --status
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+# Ключ pg_advisory_xact_lock: реплики API не применяют миграции одновременно
+_PG_LOCK_KEY = 7_140_238
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def add_column(conn: Connection, table: str, column: str, ddl_type: str):
+    """ALTER TABLE ... ADD COLUMN, skipped if the column is already there"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index(conn: Connection, name: str, table: str, expressions: str):
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({expressions})"))
+
+
+def _chat_summary_columns(conn: Connection):
+    # Раньше добавлялись при старте через _add_missing_columns
+    add_column(conn, "chats", "summary", "TEXT")
+    add_column(conn, "chats", "summary_message_id", "INTEGER")
+
+
+def _listing_indexes(conn: Connection):
+    # Внешние ключи и статус: без них списки чатов, сообщений и документов - полный скан
+    create_index(conn, "ix_messages_chat_id_id", "messages", "chat_id, id")
+    create_index(conn, "ix_chats_document_id", "chats", "document_id")
+    create_index(conn, "ix_chats_activity_id", "chats", "coalesce(updated_at, created_at) DESC, id DESC")
+    create_index(conn, "ix_documents_status", "documents", "status")
+
+
+def _indexing_profile_column(conn: Connection):
+    add_column(conn, "documents", "indexing_profile", "JSONB" if conn.dialect.name == "postgresql" else "JSON")
+
+
+def _llm_calls_indexes(conn: Connection):
+    # Саму таблицу llm_calls создает create_all перед миграциями, как любую новую таблицу
+    create_index(conn, "ix_llm_calls_created_at", "llm_calls", "created_at")
+    create_index(conn, "ix_llm_calls_document_id", "llm_calls", "document_id")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "chat summary columns", _chat_summary_columns),
+    Migration(2, "foreign key, status and listing indexes", _listing_indexes),
+    Migration(3, "documents.indexing_profile", _indexing_profile_column),
+    Migration(4, "llm_calls accounting indexes", _llm_calls_indexes),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+def _ensure_migrations_table(conn: Connection):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def _lock(conn: Connection):
+    """Serialize migrating processes: API replicas may start at the same time"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # sqlite3 не начинает транзакцию перед DDL сам; IMMEDIATE сразу берет блокировку записи
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _record(conn: Connection, migration: Migration):
+    conn.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (:version, :description)"),
+        {"version": migration.version, "description": migration.description}
+    )
+
+
+def applied_versions(conn: Connection) -> List[int]:
+    if not inspect(conn).has_table(MIGRATIONS_TABLE):
+        return []
+    return [row[0] for row in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE} ORDER BY version"))]
+
+
+def migrate(engine: Engine, metadata) -> List[int]:
+    """
+    Bring the database to the latest schema in one locked transaction.
+    A database without tables is created from the models and stamped;
+    otherwise missing tables are created and pending migrations run in
+    order. Returns the versions applied.
+    """
+    applied = []
+    with engine.begin() as conn:
+        _lock(conn)
+        existing_tables = set(inspect(conn).get_table_names()) - {MIGRATIONS_TABLE}
+        metadata.create_all(bind=conn)
+        _ensure_migrations_table(conn)
+        done = set(applied_versions(conn))
+        for migration in MIGRATIONS:
+            if migration.version in done:
+                continue
+            if existing_tables:
+                migration.upgrade(conn)
+                applied.append(migration)
+            _record(conn, migration)
+    for migration in applied:
+        logger.info(f"Applied migration {migration.version}: {migration.description}")
+    if not existing_tables:
+        logger.info(f"Created database schema at version {HEAD}")
+    return [migration.version for migration in applied]
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database.database import Base, engine
+    import app.models  # noqa: F401  # регистрация моделей в Base.metadata
+
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("--status", action="store_true", help="show applied and pending migrations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.status:
+        migrate(engine, Base.metadata)
+    with engine.connect() as conn:
+        done = set(applied_versions(conn))
+    for migration in MIGRATIONS:
+        print(f"{'applied' if migration.version in done else 'pending'}  {migration.version:3d}  {migration.description}")
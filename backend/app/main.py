@@ -1,33 +1,21 @@
 """
 FastAPI main application
 """
+import asyncio
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from app.core.config import settings
+from app.core.logging_config import LOG_FILE, TRACE_FILE, setup_logging
 from app.database.database import init_db
 from app.api.routes import documents, health
 
 # Configure logging to both console and file
-import os
-from pathlib import Path
-
-# Create logs directory
-log_dir = Path(__file__).parent.parent / "logs"
-log_dir.mkdir(exist_ok=True)
-log_file = log_dir / "backend.log"
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file, encoding='utf-8'),
-        logging.StreamHandler()  # Also log to console
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
-logger.info(f"Logging to file: {log_file}")
+logger.info(f"Logging to file: {LOG_FILE}")
 
 app = FastAPI(
     title="PageIndex Chat API",
@@ -45,6 +33,16 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+@app.exception_handler(PoolTimeoutError)
+async def db_pool_timeout(request: Request, exc: PoolTimeoutError):
+    """No free DB connection in time (e.g. queue to the single SQLite writer): overload, not a bug"""
+    logger.warning(f"DB pool timeout on {request.method} {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "База данных перегружена, повторите запрос позже"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include routers
 app.include_router(health.router)
 app.include_router(documents.router)
@@ -57,6 +55,46 @@ app.include_router(chat.router)
 from app.api.routes import websocket
 app.include_router(websocket.router)
 
+# LLM call accounting aggregates
+from app.api.routes import usage
+app.include_router(usage.router)
+
+# Prometheus metrics
+if settings.METRICS_ENABLED:
+    from app.api.routes import metrics
+    app.include_router(metrics.router)
+
+# Tracing: a root span per HTTP request, trace id in the X-Trace-Id response header
+import llm_tracing
+llm_tracing.configure_tracing(
+    exporter=settings.TRACING_EXPORTER.lower(),
+    path=str(TRACE_FILE),
+    sample_rate=settings.TRACING_SAMPLE_RATE,
+    max_bytes=settings.LOG_MAX_BYTES,
+    backup_count=settings.LOG_BACKUP_COUNT
+)
+
+TRACE_HEADER = "X-Trace-Id"
+UNTRACED_PREFIXES = ("/metrics", "/api/health")  # Опросы мониторинга не засоряют трассы
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Root span for every API request; continues an incoming W3C traceparent"""
+    if not llm_tracing.is_enabled() or request.url.path.startswith(UNTRACED_PREFIXES):
+        return await call_next(request)
+    with llm_tracing.span(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"  # шаблон пути: спаны одного endpoint группируются
+        span.set_attributes(**{"http.status_code": response.status_code})
+        response.headers[TRACE_HEADER] = span.trace_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
@@ -71,6 +109,36 @@ async def startup_event():
         logger.error(traceback.format_exc())
         print(f"[ERROR] Database initialization failed: {e}")
         # Don't exit - allow server to start even if DB init fails
+    
+    # LLM call accounting: records are buffered and written to llm_calls in batches
+    if settings.LLM_ACCOUNTING_ENABLED:
+        from app.services.llm_accounting import get_llm_accounting
+        from pageindex_ollama import set_call_recorder
+        get_llm_accounting().start()
+        set_call_recorder(get_llm_accounting().record)
+    
+    # PageIndex is imported and patched lazily; preload it in the background after startup
+    if settings.PAGEINDEX_PRELOAD:
+        from app.services.pageindex_service import preload_pageindex
+        preload_pageindex()
+    
+    # Preload the Ollama model in the background - startup doesn't wait for it
+    if settings.OLLAMA_WARMUP_ENABLED:
+        from app.services.warmup_service import get_model_warmer
+        get_model_warmer().start()
+        logger.info(f"Model warm-up started for {settings.OLLAMA_MODEL}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and close database connections"""
+    from app.services.warmup_service import get_model_warmer
+    from app.services.llm_accounting import get_llm_accounting
+    from app.database.database import async_engine, async_write_engine
+    await get_model_warmer().stop()
+    await asyncio.to_thread(get_llm_accounting().stop)  # дописывает буфер учета LLM-запросов
+    await async_engine.dispose()
+    if async_write_engine is not async_engine:
+        await async_write_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -1,8 +1,9 @@
 # Models module
 from app.models.document import Document
 from app.models.chat import Chat, Message
+from app.models.llm_call import LlmCall
 
-__all__ = ["Document", "Chat", "Message"]
+__all__ = ["Document", "Chat", "Message", "LlmCall"]
 
 
 
@@ -1,7 +1,8 @@
 """
 Chat and Message models
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.database import Base
@@ -19,12 +20,20 @@ class Chat(Base):
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)
     title = Column(String, nullable=True)
+    summary = Column(Text, nullable=True)  # Rolling summary of older messages
+    summary_message_id = Column(Integer, nullable=True)  # Last message folded into summary
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        Index("ix_chats_document_id", "document_id"),
+        # Список чатов: сортировка по последней активности, keyset по (activity, id)
+        Index("ix_chats_activity_id", func.coalesce(updated_at, created_at).desc(), id.desc()),
+    )
+    
     def __repr__(self):
         return f"<Chat(id={self.id}, document_id={self.document_id}, title='{self.title}')>"
 
@@ -36,12 +45,17 @@ class Message(Base):
     chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
-    sources = Column(JSON, nullable=True)  # Sources from document
+    sources = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)  # Sources from document
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     chat = relationship("Chat", back_populates="messages")
     
+    __table_args__ = (
+        # Сообщения чата по порядку и keyset-пагинация по id без сортировки
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+    )
+    
     def __repr__(self):
         return f"<Message(id={self.id}, chat_id={self.chat_id}, role='{self.role}')>"
 
@@ -1,7 +1,8 @@
 """
 Document model
 """
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Enum, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from app.database.database import Base
 import enum
@@ -21,8 +22,9 @@ class Document(Base):
     filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     index_path = Column(String, nullable=True)
-    status = Column(Enum(DocumentStatus), default=DocumentStatus.UPLOADING)
+    status = Column(Enum(DocumentStatus), default=DocumentStatus.UPLOADING, index=True)
     error_message = Column(String, nullable=True)
+    indexing_profile = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)  # Время и LLM-запросы по этапам (PAGEINDEX_PROFILE)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
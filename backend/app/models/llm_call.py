@@ -0,0 +1,33 @@
+"""
+LLM call accounting model
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Index
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class LlmCall(Base):
+    """One request to the model (append-only, written in batches by LlmAccounting)"""
+    __tablename__ = "llm_calls"
+    
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    caller = Column(String, nullable=False)  # indexing, search, answer, summary, other
+    document_id = Column(Integer, nullable=True)  # Без внешнего ключа: учет переживает удаление документа
+    model = Column(String, nullable=False)
+    backend = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Float, nullable=False)
+    prompt_eval_ms = Column(Float, nullable=True)  # Время модели по данным Ollama (нативный API)
+    eval_ms = Column(Float, nullable=True)
+    finish_reason = Column(String, nullable=True)  # stop, length, error
+    retries = Column(Integer, nullable=False, default=0)  # Номер попытки в функциях LLM-запросов PageIndex (0 - первая)
+    cache_hit = Column(Boolean, nullable=False, default=False)  # Ответ без запроса к модели (кэш, объединение)
+    
+    __table_args__ = (
+        Index("ix_llm_calls_created_at", "created_at"),
+        Index("ix_llm_calls_document_id", "document_id"),
+    )
+    
+    def __repr__(self):
+        return f"<LlmCall(id={self.id}, caller='{self.caller}', model='{self.model}', latency_ms={self.latency_ms})>"
@@ -1,7 +1,8 @@
 # Services module
+import sys
+from pathlib import Path
 
-
-
-
-
-
+# Корень проекта (pageindex_ollama.py, PageIndex) должен быть в sys.path
+project_root = Path(__file__).parent.parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
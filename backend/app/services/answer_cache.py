@@ -0,0 +1,133 @@
+"""
+Answer cache for document questions
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return _SPACES_RE.sub(" ", question.strip().lower()).rstrip(" ?!.")
+
+
+def index_fingerprint(index_path: str) -> str:
+    """Cheap version of an index file: changes whenever the file is rewritten"""
+    stat = os.stat(index_path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _hash(value: Any) -> str:
+    data = value if isinstance(value, str) else json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory LRU cache of final answers.
+
+    At temperature 0 the answer is determined by the document index, the
+    retrieved context, the chat history, the question and the model, so the
+    key is built from exactly these. Entries expire after ``ttl`` seconds,
+    the least recently used ones are evicted above ``max_entries``, and all
+    entries of a document are dropped when it is re-indexed or deleted.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def make_key(
+        self,
+        document_id: int,
+        index_path: str,
+        context: str,
+        question: str,
+        model: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple:
+        """Cache key; raises OSError if the index file is missing"""
+        return (
+            document_id,
+            index_fingerprint(index_path),
+            _hash([context, history or []]),
+            normalize_question(question),
+            model
+        )
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Tuple, content: str, sources: Optional[List[Dict]] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), {"content": content, "sources": sources})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_document(self, document_id: int) -> int:
+        """Drop all answers for a document (after re-indexing or deletion)"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == document_id]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+        if keys:
+            logger.info(f"Answer cache: dropped {len(keys)} entries for document {document_id}")
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+# Global answer cache
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.ANSWER_CACHE_TTL
+)
+
+def get_answer_cache() -> AnswerCache:
+    """Get the answer cache instance"""
+    return answer_cache
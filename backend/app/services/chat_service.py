@@ -1,84 +1,177 @@
 """
 Chat service for managing chats and messages
 """
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Dict, Tuple
+from datetime import datetime, timezone
 from app.models.chat import Chat, Message, MessageRole
 from app.models.document import Document
 from app.services.ollama_service import OllamaService
 from app.services.pageindex_service import PageIndexService
+from app.services.memory_service import ConversationMemory
+from app.services.answer_cache import get_answer_cache
+from app.services.semantic_cache import get_semantic_cache
+from app.services.llm_accounting import get_llm_accounting
+from app.core.config import settings
+from pageindex_ollama import llm_context
+import llm_tracing
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Последняя активность чата: updated_at появляется только после первого сообщения
+CHAT_ACTIVITY = func.coalesce(Chat.updated_at, Chat.created_at)
+
+# Колонки списков: без summary чата и без sources сообщений
+CHAT_LIST_COLUMNS = (Chat.id, Chat.document_id, Chat.title, Chat.created_at, Chat.updated_at)
+MESSAGE_LIST_COLUMNS = (Message.id, Message.chat_id, Message.role, Message.content, Message.created_at)
+
 class ChatService:
     """Service for chat management"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.ollama_service = OllamaService()
         self.pageindex_service = PageIndexService()
+        self.memory = ConversationMemory(db, self.ollama_service)
     
-    def create_chat(self, document_id: Optional[int] = None, title: Optional[str] = None) -> Chat:
+    async def create_chat(self, document_id: Optional[int] = None, title: Optional[str] = None) -> Chat:
         """Create a new chat"""
         chat = Chat(
             document_id=document_id,
             title=title or "New Chat"
         )
         self.db.add(chat)
-        self.db.commit()
-        self.db.refresh(chat)
+        await self.db.commit()
+        await self.db.refresh(chat)
         return chat
     
-    def get_chat(self, chat_id: int) -> Optional[Chat]:
+    async def get_chat(self, chat_id: int) -> Optional[Chat]:
         """Get chat by ID"""
-        return self.db.query(Chat).filter(Chat.id == chat_id).first()
-    
-    def get_chats_by_document(self, document_id: int) -> List[Chat]:
-        """Get all chats for a document"""
-        return self.db.query(Chat).filter(Chat.document_id == document_id).all()
+        return await self.db.get(Chat, chat_id)
     
-    def get_all_chats(self) -> List[Chat]:
-        """Get all chats"""
-        return self.db.query(Chat).order_by(Chat.updated_at.desc()).all()
+    async def get_chats(
+        self,
+        document_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Row]:
+        """
+        One page of chats, most recently active first (all chats if ``limit`` is None).
+        
+        Keyset pagination: pass the id of the last chat of the previous page
+        as ``before_id``. Rows carry only the list columns, not the summary.
+        """
+        query = select(*CHAT_LIST_COLUMNS)
+        if document_id is not None:
+            query = query.where(Chat.document_id == document_id)
+        if before_id is not None:
+            # Ключ курсора сравнивается в SQL: без округления дат при обмене с Python
+            cursor = select(CHAT_ACTIVITY).where(Chat.id == before_id).scalar_subquery()
+            query = query.where(or_(
+                CHAT_ACTIVITY < cursor,
+                and_(CHAT_ACTIVITY == cursor, Chat.id < before_id)
+            ))
+        query = query.order_by(CHAT_ACTIVITY.desc(), Chat.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self.db.execute(query)
+        return list(result)
     
-    def add_message(
+    async def add_message(
         self,
         chat_id: int,
         role: MessageRole,
         content: str,
-        sources: Optional[Dict] = None
+        sources: Optional[Dict] = None,
+        chat: Optional[Chat] = None
     ) -> Message:
         """Add a message to chat"""
-        message = Message(
-            chat_id=chat_id,
-            role=role.value,
-            content=content,
-            sources=sources
-        )
-        self.db.add(message)
+        messages = await self.add_messages(chat_id, [(role, content, sources)], chat=chat)
+        return messages[0]
+    
+    async def add_messages(
+        self,
+        chat_id: int,
+        entries: List[Tuple[MessageRole, str, Optional[Dict]]],
+        chat: Optional[Chat] = None
+    ) -> List[Message]:
+        """
+        Add several messages in one transaction: one INSERT per message,
+        one UPDATE of chats.updated_at and a single commit. Pass an already
+        loaded chat to avoid selecting it again.
+        """
+        messages = [
+            Message(chat_id=chat_id, role=role.value, content=content, sources=sources)
+            for role, content, sources in entries
+        ]
+        self.db.add_all(messages)
         
         # Update chat updated_at
-        chat = self.get_chat(chat_id)
-        if chat:
-            from datetime import datetime
-            chat.updated_at = datetime.utcnow()
-        
-        self.db.commit()
-        self.db.refresh(message)
-        return message
+        now = datetime.now(timezone.utc)
+        if chat is not None:
+            chat.updated_at = now
+        else:
+            await self.db.execute(update(Chat).where(Chat.id == chat_id).values(updated_at=now))
+        
+        # id and created_at come back from INSERT ... RETURNING - no refresh needed
+        await self.db.commit()
+        return messages
+    
+    async def get_messages(
+        self,
+        chat_id: int,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        include_sources: bool = False
+    ) -> List[Row]:
+        """
+        The latest ``limit`` messages older than ``before_id`` (all if ``limit`` is None), in chronological order.
+        
+        Walks the (chat_id, id) index backwards, so a page costs the same
+        regardless of chat length. ``sources`` JSON is loaded only on request.
+        """
+        columns = MESSAGE_LIST_COLUMNS + ((Message.sources,) if include_sources else ())
+        query = select(*columns).where(Message.chat_id == chat_id)
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        query = query.order_by(Message.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self.db.execute(query)
+        return list(reversed(result.all()))
+    
+    @llm_tracing.traced("chat.save_question")
+    async def _save_question(self, chat_id: int, chat: Optional[Chat], query: str) -> Message:
+        """Persist the question before the LLM call: it survives a disconnect or crash during generation"""
+        return await self.add_message(chat_id, MessageRole.USER, query, chat=chat)
     
-    def get_messages(self, chat_id: int) -> List[Message]:
-        """Get all messages for a chat"""
-        return self.db.query(Message).filter(
-            Message.chat_id == chat_id
-        ).order_by(Message.created_at.asc()).all()
+    @llm_tracing.traced("chat.save_answer")
+    async def _save_answer(self, chat_id: int, chat: Optional[Chat], content: str, sources) -> Message:
+        """Persist the assistant message"""
+        return await self.add_message(chat_id, MessageRole.ASSISTANT, content, sources=sources, chat=chat)
     
+    def _account_cache_hit(self, document_id: Optional[int]):
+        """Answer served from a cache: an accounted LLM call that cost no model time"""
+        get_llm_accounting().record({
+            "caller": "answer",
+            "document_id": document_id,
+            "model": self.ollama_service.model,
+            "latency_ms": 0.0,
+            "finish_reason": "stop",
+            "cache_hit": True
+        })
+    
+    @llm_tracing.traced("chat.process_query")
     async def process_query(
         self,
         chat_id: int,
         query: str,
-        document_id: Optional[int] = None
+        document_id: Optional[int] = None,
+        use_history: Optional[bool] = None,
+        chat: Optional[Chat] = None
     ) -> Message:
         """
         Process a user query and generate response
@@ -87,27 +180,71 @@ class ChatService:
             chat_id: Chat ID
             query: User query
             document_id: Optional document ID for context
+            use_history: Include previous messages (defaults to CHAT_HISTORY_ENABLED)
+            chat: Already loaded chat (saves a SELECT)
         
         Returns:
             Assistant message with response
         """
-        # Add user message
-        user_message = self.add_message(chat_id, MessageRole.USER, query)
+        if chat is None:
+            chat = await self.get_chat(chat_id)
+        
+        # Question first, in one transaction with chats.updated_at: the answer may never come
+        user_message = await self._save_question(chat_id, chat, query)
         
         # If document is provided, search in document
         context = ""
         sources = None
+        document = None
+        if document_id:
+            document = await self.db.get(Document, document_id)
+        document_ready = bool(document and document.index_path and document.status.value == "ready")
+        
+        # Return the read connection to the pool before any LLM call (history summary included)
+        await self.db.commit()
+        
+        # Load conversation history for multi-turn mode; get_history ends its own read before the summary LLM call
+        if use_history is None:
+            use_history = settings.CHAT_HISTORY_ENABLED
+        history = []
+        if use_history:
+            if chat:
+                try:
+                    with llm_tracing.span("chat.load_history"), llm_context(caller="summary", document_id=document_id, sticky_key=f"chat:{chat_id}"):
+                        history = await self.memory.get_history(chat, exclude_message_id=user_message.id)
+                except Exception as e:
+                    logger.error(f"Error loading chat history: {e}")
+                    history = []
+        llm_tracing.set_attributes(chat_id=chat_id, document_id=document_id, history_messages=len(history))
+        
+        # Semantic cache: paraphrases of questions already answered for this document
+        semantic_cache = get_semantic_cache()
+        question_vector = None
+        if document_ready and not history and semantic_cache.available:
+            with llm_tracing.span("cache.semantic_lookup"):
+                question_vector = await semantic_cache.embed(query)
+                cached = None
+                if question_vector is not None:
+                    try:
+                        cached = semantic_cache.lookup(document.id, document.index_path, self.ollama_service.model, question_vector)
+                    except OSError as e:
+                        logger.warning(f"Semantic cache disabled for this query: {e}")
+                        question_vector = None
+            if cached:
+                llm_tracing.set_attributes(cache_hit="semantic")
+                self._account_cache_hit(document_id)
+                logger.info(f"Semantic cache hit for chat {chat_id} (similarity {cached['similarity']:.3f}): {cached['question'][:50]}")
+                return await self._save_answer(chat_id, chat, cached["content"], cached["sources"])
         
         if document_id:
             try:
-                # Get document
-                document = self.db.query(Document).filter(Document.id == document_id).first()
-                if document and document.index_path and document.status.value == "ready":
+                if document_ready:
                     # Search in document tree using reasoning-based search
-                    search_result = await self.pageindex_service.search_tree(
-                        document.index_path,
-                        query
-                    )
+                    with llm_context(caller="search", document_id=document_id):
+                        search_result = await self.pageindex_service.search_tree(
+                            document.index_path,
+                            query
+                        )
                     
                     # Extract context and sources from search result
                     context = search_result.get("context", "")
@@ -131,30 +268,59 @@ class ChatService:
                 context = ""
                 sources = None
         
+        # Answer cache: same index, context, history and question give the same answer
+        cache_key = None
+        if settings.ANSWER_CACHE_ENABLED and context and document and document.index_path:
+            try:
+                cache_key = get_answer_cache().make_key(
+                    document.id,
+                    document.index_path,
+                    context,
+                    query,
+                    self.ollama_service.model,
+                    history
+                )
+            except OSError as e:
+                logger.warning(f"Answer cache disabled for this query: {e}")
+            cached = get_answer_cache().get(cache_key) if cache_key else None
+            if cached:
+                llm_tracing.set_attributes(cache_hit="answer")
+                self._account_cache_hit(document_id)
+                logger.info(f"Answer cache hit for chat {chat_id}, document {document_id}")
+                return await self._save_answer(chat_id, chat, cached["content"], cached["sources"])
+        
         # Generate response using Ollama
         try:
-            if context:
-                response_content = await self.ollama_service.generate_with_context(
-                    context=context,
-                    question=query
-                )
-            else:
-                response_content = await self.ollama_service.generate_response(
-                    prompt=f"Ответь на вопрос: {query}"
+            # Ответы привязаны к чату: префикс с историей переиспользуется между ходами
+            with llm_context(caller="answer", document_id=document_id, sticky_key=f"chat:{chat_id}"):
+                if context:
+                    response_content = await self.ollama_service.generate_with_context(
+                        context=context,
+                        question=query,
+                        history=history
+                    )
+                else:
+                    response_content = await self.ollama_service.generate_chat(
+                        history + [{"role": "user", "content": f"Ответь на вопрос: {query}"}]
+                    )
+            if cache_key:
+                get_answer_cache().put(cache_key, response_content, sources)
+            if question_vector is not None and context:
+                semantic_cache.put(
+                    document.id,
+                    document.index_path,
+                    self.ollama_service.model,
+                    question_vector,
+                    query,
+                    response_content,
+                    sources
                 )
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             response_content = f"Извините, произошла ошибка при генерации ответа: {str(e)}"
         
         # Add assistant message
-        assistant_message = self.add_message(
-            chat_id,
-            MessageRole.ASSISTANT,
-            response_content,
-            sources=sources
-        )
-        
-        return assistant_message
+        return await self._save_answer(chat_id, chat, response_content, sources)
     
     def _extract_context_from_structure(self, structure: Dict, query: str) -> str:
         """Extract relevant context from document structure"""
@@ -201,14 +367,14 @@ class ChatService:
         
         return sources[:5]  # Limit to 5 sources
     
-    def delete_chat(self, chat_id: int) -> bool:
+    async def delete_chat(self, chat_id: int) -> bool:
         """Delete a chat and all its messages"""
-        chat = self.get_chat(chat_id)
+        chat = await self.get_chat(chat_id)
         if not chat:
             return False
         
-        self.db.delete(chat)
-        self.db.commit()
+        await self.db.delete(chat)
+        await self.db.commit()
         return True
 
 
@@ -3,22 +3,32 @@ Document service for managing documents
 """
 import os
 import shutil
+import hashlib
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.document import Document, DocumentStatus
 from app.core.config import settings
+from app.services.answer_cache import get_answer_cache
+from app.services.semantic_cache import get_semantic_cache
+import pageindex_profiler
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Колонки списка документов: то, что нужно для опроса статусов
+DOCUMENT_LIST_COLUMNS = (Document.id, Document.filename, Document.status, Document.created_at, Document.updated_at)
+
 class DocumentService:
     """Service for document management"""
     
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def create_document(
+    async def create_document(
         self,
         filename: str,
         file_path: str
@@ -30,43 +40,73 @@ class DocumentService:
             status=DocumentStatus.UPLOADING
         )
         self.db.add(document)
-        self.db.commit()
-        self.db.refresh(document)
+        await self.db.commit()
+        await self.db.refresh(document)
         return document
     
-    def get_document(self, document_id: int) -> Optional[Document]:
+    async def get_document(self, document_id: int) -> Optional[Document]:
         """Get document by ID"""
-        return self.db.query(Document).filter(Document.id == document_id).first()
+        return await self.db.get(Document, document_id)
     
-    def get_all_documents(self) -> List[Document]:
-        """Get all documents"""
-        return self.db.query(Document).order_by(Document.created_at.desc()).all()
+    async def list_documents(self) -> List[Row]:
+        """All documents, newest first, with the list columns only"""
+        result = await self.db.execute(
+            select(*DOCUMENT_LIST_COLUMNS).order_by(Document.created_at.desc(), Document.id.desc())
+        )
+        return list(result)
     
-    def update_document_status(
+    async def get_documents_etag(self) -> str:
+        """
+        Version of the document list as a weak ETag, from one aggregate query.
+        
+        Count and max(id) change on upload and deletion, the latest
+        updated_at/created_at on every status change.
+        """
+        count, max_id, last_change = (await self.db.execute(
+            select(
+                func.count(Document.id),
+                func.max(Document.id),
+                func.max(func.coalesce(Document.updated_at, Document.created_at))
+            )
+        )).one()
+        version = f"{count}:{max_id}:{last_change}"
+        return f'W/"{hashlib.blake2b(version.encode(), digest_size=8).hexdigest()}"'
+    
+    async def update_document_status(
         self,
         document_id: int,
         status: DocumentStatus,
         index_path: Optional[str] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        indexing_profile: Optional[dict] = None
     ) -> Document:
         """Update document status"""
-        document = self.get_document(document_id)
+        document = await self.get_document(document_id)
         if not document:
             raise ValueError(f"Document {document_id} not found")
         
         document.status = status
+        # Явно и с микросекундами: CURRENT_TIMESTAMP в SQLite - с точностью до секунды,
+        # и два перехода статуса за секунду не изменили бы ETag списка
+        document.updated_at = datetime.now(timezone.utc)
         if index_path:
             document.index_path = index_path
+        if status in (DocumentStatus.INDEXING, DocumentStatus.READY):
+            # Re-indexing: cached answers were built from the old index
+            get_answer_cache().invalidate_document(document_id)
+            get_semantic_cache().invalidate_document(document_id)
         if error_message:
             document.error_message = error_message
+        if indexing_profile is not None:
+            document.indexing_profile = indexing_profile
         
-        self.db.commit()
-        self.db.refresh(document)
+        await self.db.commit()
+        await self.db.refresh(document)
         return document
     
-    def delete_document(self, document_id: int) -> bool:
+    async def delete_document(self, document_id: int) -> bool:
         """Delete document and its files"""
-        document = self.get_document(document_id)
+        document = await self.get_document(document_id)
         if not document:
             return False
         
@@ -76,12 +116,18 @@ class DocumentService:
                 os.remove(document.file_path)
             if document.index_path and os.path.exists(document.index_path):
                 os.remove(document.index_path)
+                profile_path = pageindex_profiler.report_path(document.index_path)
+                if profile_path.exists():
+                    profile_path.unlink()
         except Exception as e:
             logger.error(f"Failed to delete files for document {document_id}: {e}")
         
+        get_answer_cache().invalidate_document(document_id)
+        get_semantic_cache().invalidate_document(document_id)
+        
         # Delete from database
-        self.db.delete(document)
-        self.db.commit()
+        await self.db.delete(document)
+        await self.db.commit()
         return True
     
     def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
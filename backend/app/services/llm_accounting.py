@@ -0,0 +1,238 @@
+"""
+Accounting of every LLM call (append-only table llm_calls)
+
+pageindex_ollama passes one record per request to record(), which only
+appends it to an in-memory buffer; a background thread writes the buffer
+with one multi-row INSERT every LLM_ACCOUNTING_FLUSH_INTERVAL seconds (or
+as soon as LLM_ACCOUNTING_BATCH_SIZE records are waiting), so the hot path
+never waits for the database. Aggregates for capacity planning - calls,
+tokens, model seconds by caller, model, document or day - are GROUP BY
+queries over the table.
+"""
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, func, case, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.database.database import engine
+from app.models.document import Document
+from app.models.llm_call import LlmCall
+import llm_metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = (
+    "caller", "document_id", "model", "backend", "prompt_tokens", "completion_tokens", "latency_ms",
+    "prompt_eval_ms", "eval_ms", "finish_reason", "retries", "cache_hit", "created_at",
+)
+
+# Допустимые группировки агрегатов
+GROUP_COLUMNS = {
+    "caller": LlmCall.caller,
+    "model": LlmCall.model,
+    "document_id": LlmCall.document_id,
+    "backend": LlmCall.backend,
+    "day": func.date(LlmCall.created_at),
+}
+
+
+class LlmAccounting:
+    """Buffered writer of llm_calls plus aggregate queries"""
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 2.0, max_pending: int = 100000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # deque с maxlen: при переполнении самая старая запись вытесняется за O(1)
+        self._pending: deque = deque(maxlen=max_pending)
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = True
+        self.written = 0
+        self.dropped = 0
+        self.flush_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return not self._stopped
+
+    def start(self):
+        """Start the writer thread (after init_db: the table must exist)"""
+        if self._thread is not None:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="llm-accounting", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write what is buffered and stop the writer thread"""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def record(self, record: Dict[str, Any]):
+        """Queue one call record (cheap, safe from any thread); ignored while stopped"""
+        if self._stopped:
+            return
+        row = {field: record.get(field) for field in RECORD_FIELDS}
+        row["created_at"] = row["created_at"] or datetime.now(timezone.utc)
+        row["retries"] = row["retries"] or 0
+        row["cache_hit"] = bool(row["cache_hit"])
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                # БД недоступна дольше, чем помещается в буфер: теряем самые старые записи
+                self.dropped += 1
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._pending) < self.batch_size and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self) -> int:
+        """Write buffered records in batches; on error they stay buffered for the next attempt"""
+        written = 0
+        while True:
+            with self._condition:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return written
+            try:
+                with engine.begin() as conn:
+                    conn.execute(LlmCall.__table__.insert(), batch)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.warning(f"Не удалось записать {len(batch)} записей учета LLM-запросов: {e}")
+                with self._condition:
+                    # Возвращаем пачку в начало буфера; не поместившиеся - самые старые - теряются
+                    room = self.max_pending - len(self._pending)
+                    kept = batch[len(batch) - room:] if room < len(batch) else batch
+                    self.dropped += len(batch) - len(kept)
+                    self._pending.extendleft(reversed(kept))
+                return written
+            written += len(batch)
+            self.written += len(batch)
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    async def aggregate(
+        self,
+        db: AsyncSession,
+        group_by: List[str],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        caller: Optional[str] = None,
+        document_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Totals per group: calls, failures, cache hits, tokens, latency and model time"""
+        unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown group_by: {', '.join(unknown)} (allowed: {', '.join(GROUP_COLUMNS)})")
+        groups = [GROUP_COLUMNS[name].label(name) for name in group_by]
+        # Время модели: по данным Ollama, для OpenAI-совместимого API - полная задержка запроса
+        model_ms = case(
+            (LlmCall.cache_hit, literal(0.0)),
+            else_=func.coalesce(LlmCall.prompt_eval_ms + LlmCall.eval_ms, LlmCall.latency_ms)
+        )
+        query = select(
+            *groups,
+            func.count().label("calls"),
+            func.sum(case((LlmCall.finish_reason == "error", 1), else_=0)).label("failures"),
+            func.sum(case((LlmCall.cache_hit, 1), else_=0)).label("cache_hits"),
+            # Повторные попытки: по строке на попытку, retries - ее номер (первая - 0)
+            func.sum(case((LlmCall.retries > 0, 1), else_=0)).label("retries"),
+            func.coalesce(func.sum(LlmCall.prompt_tokens), 0).label("prompt_tokens"),
+            func.coalesce(func.sum(LlmCall.completion_tokens), 0).label("completion_tokens"),
+            func.avg(LlmCall.latency_ms).label("avg_latency_ms"),
+            func.sum(model_ms).label("model_ms"),
+        )
+        if since is not None:
+            query = query.where(LlmCall.created_at >= since)
+        if until is not None:
+            query = query.where(LlmCall.created_at < until)
+        if caller:
+            query = query.where(LlmCall.caller == caller)
+        if document_id is not None:
+            query = query.where(LlmCall.document_id == document_id)
+        if groups:
+            query = query.group_by(*groups).order_by(func.sum(model_ms).desc())
+
+        rows = []
+        for row in (await db.execute(query)).mappings():
+            item = {name: row[name] for name in group_by}
+            if "day" in item and item["day"] is not None:
+                item["day"] = str(item["day"])
+            item.update(
+                calls=row["calls"],
+                failures=int(row["failures"] or 0),
+                cache_hits=int(row["cache_hits"] or 0),
+                retries=int(row["retries"] or 0),
+                prompt_tokens=int(row["prompt_tokens"]),
+                completion_tokens=int(row["completion_tokens"]),
+                avg_latency_ms=round(row["avg_latency_ms"] or 0, 1),
+                model_seconds=round((row["model_ms"] or 0) / 1000, 3),
+            )
+            rows.append(item)
+        if "document_id" in group_by:
+            await self._add_per_page(db, rows)
+        return rows
+
+    async def _add_per_page(self, db: AsyncSession, rows: List[Dict[str, Any]]):
+        """Model seconds per page for documents with an indexing profile (PAGEINDEX_PROFILE)"""
+        ids = {row["document_id"] for row in rows if row["document_id"] is not None}
+        if not ids:
+            return
+        result = await db.execute(select(Document.id, Document.indexing_profile).where(Document.id.in_(ids)))
+        pages = {
+            document_id: (profile or {}).get("pages")
+            for document_id, profile in result.all()
+        }
+        for row in rows:
+            page_count = pages.get(row["document_id"])
+            row["pages"] = page_count
+            row["model_seconds_per_page"] = round(row["model_seconds"] / page_count, 3) if page_count else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "pending": self.pending(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flush_errors": self.flush_errors,
+        }
+
+# Global accounting writer
+llm_accounting = LlmAccounting(
+    batch_size=settings.LLM_ACCOUNTING_BATCH_SIZE,
+    flush_interval=settings.LLM_ACCOUNTING_FLUSH_INTERVAL,
+    max_pending=settings.LLM_ACCOUNTING_MAX_PENDING
+)
+
+def get_llm_accounting() -> LlmAccounting:
+    """Get the LLM accounting instance"""
+    return llm_accounting
+
+llm_metrics.register_callback(
+    "llm_accounting_pending_records", "Записи учета LLM-запросов, ожидающие записи в БД", "gauge", (),
+    lambda: [((), llm_accounting.pending())]
+)
+llm_metrics.register_callback(
+    "llm_accounting_dropped_total", "Записи учета, потерянные при переполнении буфера", "counter", (),
+    lambda: [((), llm_accounting.dropped)]
+)
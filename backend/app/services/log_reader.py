@@ -0,0 +1,82 @@
+"""
+Reading the backend log without loading the whole file
+
+Offsets are byte positions in the current log file and always point just
+past a newline, so a client can resume exactly where it stopped. Every
+read also returns the file id (inode): after rotation the id changes, or
+the new file is shorter than a stale offset, and reading restarts from
+the beginning of the new file.
+"""
+import os
+from typing import List, Optional, Tuple
+
+BLOCK_SIZE = 64 * 1024
+MAX_READ_BYTES = 1024 * 1024
+
+
+def _decode(lines: List[bytes]) -> List[str]:
+    return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+def _file_id(f) -> int:
+    """Identity of the open file: survives appends, changes when the log is rotated"""
+    return os.fstat(f.fileno()).st_ino
+
+
+def tail_lines(path: str, count: int, block_size: int = BLOCK_SIZE) -> Tuple[List[str], int, int]:
+    """
+    Last ``count`` complete lines, the offset after them and the file id.
+
+    Reads blocks backwards from the end until it has seen enough newlines,
+    so memory is proportional to the lines returned, not to the file. A
+    trailing line that is still being written is left for the next read.
+    """
+    with open(path, "rb") as f:
+        file_id = _file_id(f)
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        blocks = []
+        newlines = 0
+        # count + 1 переводов строк: граница перед первой из count строк
+        while position > 0 and newlines <= count:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+
+    data = b"".join(reversed(blocks))
+    complete = data.rfind(b"\n") + 1
+    offset = position + complete
+    lines = data[:complete].splitlines(keepends=True)
+    if position > 0 and lines:
+        lines = lines[1:]  # начало первой строки осталось в непрочитанной части
+    return _decode(lines[-count:] if count else []), offset, file_id
+
+
+def read_since(
+    path: str,
+    offset: int,
+    file_id: Optional[int] = None,
+    max_bytes: int = MAX_READ_BYTES
+) -> Tuple[List[str], int, bool, int]:
+    """
+    Complete lines written after ``offset``: (lines, next offset, rotated, file id).
+    Pass the file id of the previous read, otherwise rotation is detected only
+    when the new file is still shorter than ``offset``. Returns at most about
+    ``max_bytes``; call again with the next offset and file id.
+    """
+    with open(path, "rb") as f:
+        current_id = _file_id(f)
+        size = os.fstat(f.fileno()).st_size
+        rotated = offset > size or (file_id is not None and file_id != current_id)
+        if rotated:
+            offset = 0
+        f.seek(offset)
+        data = f.read(max_bytes)
+
+    complete = data.rfind(b"\n") + 1
+    if complete == 0 and len(data) == max_bytes:
+        complete = len(data)  # строка длиннее max_bytes: отдаем частями
+    return _decode(data[:complete].splitlines(keepends=True)), offset + complete, rotated, current_id
@@ -0,0 +1,111 @@
+"""
+Conversation memory for multi-turn chats
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional
+from app.models.chat import Chat, Message
+from app.services.ollama_service import OllamaService
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ConversationMemory:
+    """
+    Token-budgeted chat history with a rolling summary.
+
+    Messages that are not yet folded into ``Chat.summary`` are sent verbatim.
+    When they exceed ``CHAT_HISTORY_MAX_TOKENS`` the oldest ones are folded
+    into the summary until the remainder fits into half of the budget. Between
+    folds the history only grows at the end, so the prompt prefix stays the
+    same from turn to turn and Ollama can reuse its KV cache.
+    """
+
+    def __init__(self, db: AsyncSession, ollama_service: OllamaService):
+        self.db = db
+        self.ollama_service = ollama_service
+        self.max_tokens = settings.CHAT_HISTORY_MAX_TOKENS
+
+    async def get_history(self, chat: Chat, exclude_message_id: Optional[int] = None) -> List[Dict[str, str]]:
+        """Build chat messages (summary + recent turns) to prepend to the prompt"""
+        messages = await self._get_unsummarized_messages(chat, exclude_message_id)
+        # Сообщения уже в памяти: завершаем чтение, чтобы запрос summary к LLM не держал соединение пула
+        await self.db.commit()
+        token_counts = [self._count_tokens(m.content) for m in messages]
+
+        if sum(token_counts) > self.max_tokens:
+            # Сворачиваем самые старые сообщения в summary
+            keep_from = self._tail_start(token_counts, self.max_tokens // 2)
+            if await self._fold_into_summary(chat, messages[:keep_from]):
+                messages = messages[keep_from:]
+            else:
+                # Summary не обновился: прежний summary плюс столько последних сообщений, сколько влезает в бюджет
+                messages = messages[self._tail_start(token_counts, self.max_tokens):]
+
+        history = []
+        if chat.summary:
+            history.append({
+                "role": "system",
+                "content": f"Краткое содержание предыдущей части разговора:\n{chat.summary}"
+            })
+        history.extend({"role": m.role, "content": m.content} for m in messages)
+        return history
+
+    @staticmethod
+    def _tail_start(token_counts: List[int], budget: int) -> int:
+        """Index of the first message of the longest tail that fits into budget"""
+        start = len(token_counts)
+        used = 0
+        while start > 0 and used + token_counts[start - 1] <= budget:
+            start -= 1
+            used += token_counts[start]
+        return start
+
+    async def _get_unsummarized_messages(self, chat: Chat, exclude_message_id: Optional[int]) -> List[Message]:
+        """Messages newer than the last one folded into the summary"""
+        query = select(Message).where(Message.chat_id == chat.id)
+        if chat.summary_message_id:
+            query = query.where(Message.id > chat.summary_message_id)
+        if exclude_message_id:
+            query = query.where(Message.id != exclude_message_id)
+        result = await self.db.scalars(query.order_by(Message.id.asc()))
+        return list(result)
+
+    async def _fold_into_summary(self, chat: Chat, messages: List[Message]) -> bool:
+        """Incrementally update the rolling summary with older messages; False if the summary request failed"""
+        if not messages:
+            return True
+
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        prompt = f"""Обнови краткое содержание разговора пользователя с ассистентом.
+
+Текущее краткое содержание:
+{chat.summary or "(пока нет)"}
+
+Новые сообщения:
+{transcript}
+
+Верни только обновленное краткое содержание. Сохрани факты, имена, числа и вопросы пользователя, которые могут понадобиться для следующих ответов."""
+
+        try:
+            summary = await self.ollama_service.generate_response(
+                prompt,
+                max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS
+            )
+        except Exception as e:
+            # Не обновляем summary_message_id, чтобы повторить при следующем запросе
+            logger.error(f"Failed to update chat {chat.id} summary: {e}")
+            return False
+
+        # Короткая отдельная транзакция: только UPDATE чата после ответа модели
+        chat.summary = summary.strip()
+        chat.summary_message_id = messages[-1].id
+        await self.db.commit()
+        logger.info(f"Chat {chat.id}: folded {len(messages)} messages into summary")
+        return True
+
+    def _count_tokens(self, text: str) -> int:
+        """Count tokens with the shared cached encoder"""
+        from pageindex_ollama import count_tokens
+        return count_tokens(text, settings.OLLAMA_MODEL)
@@ -1,14 +1,47 @@
 """
 Ollama service for LLM interactions
 """
-import openai
 from typing import Optional, List, Dict
 from app.core.config import settings
+from app.services.prompts import build_answer_messages
+from pageindex_ollama import chat_completion_async, set_ollama_options, set_llm_provider, make_provider, get_llm_provider, native_base_url
+from ollama_pool import configure_pools
+from llm_scheduler import configure_scheduler, INTERACTIVE, SEARCH, INDEXING
+import llm_tracing
 import httpx
 import logging
 
 logger = logging.getLogger(__name__)
 
+def configure_ollama_client():
+    """Apply the LLM provider, request options, backend pools and request scheduler from settings"""
+    set_llm_provider(make_provider(settings.LLM_PROVIDER, settings.OLLAMA_USE_NATIVE_API))
+    set_ollama_options(
+        keep_alive=settings.OLLAMA_KEEP_ALIVE,
+        num_ctx=settings.OLLAMA_NUM_CTX,
+        coalesce_requests=settings.LLM_COALESCE_REQUESTS,
+        base_url=settings.OLLAMA_BASE_URL,
+        model=settings.OLLAMA_MODEL,
+        fast_token_count=settings.PAGEINDEX_FAST_TOKEN_COUNT
+    )
+    base_urls = settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL]
+    configure_pools(
+        settings.OLLAMA_CHAT_BASE_URLS or base_urls,
+        settings.OLLAMA_INDEXING_BASE_URLS or base_urls,
+        failure_threshold=settings.OLLAMA_BACKEND_FAILURE_THRESHOLD,
+        retry_after=settings.OLLAMA_BACKEND_RETRY_AFTER
+    )
+    configure_scheduler(
+        settings.LLM_MAX_CONCURRENCY,
+        {
+            INTERACTIVE: settings.LLM_INTERACTIVE_CONCURRENCY,
+            SEARCH: settings.LLM_SEARCH_CONCURRENCY,
+            INDEXING: settings.LLM_INDEXING_CONCURRENCY
+        }
+    )
+
+configure_ollama_client()
+
 class OllamaService:
     """Service for interacting with Ollama"""
     
@@ -16,18 +49,14 @@ class OllamaService:
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = settings.OLLAMA_MODEL
         self.timeout = settings.OLLAMA_TIMEOUT
-        
-        # Create OpenAI-compatible client
-        self.client = openai.OpenAI(
-            api_key="ollama",  # Not used, but required for compatibility
-            base_url=self.base_url
-        )
+        self.keep_alive = settings.OLLAMA_KEEP_ALIVE
+        self.num_ctx = settings.OLLAMA_NUM_CTX
     
     async def check_connection(self) -> bool:
         """Check if Ollama is available"""
         try:
             async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.base_url.replace('/v1', '')}/api/tags")
+                response = await client.get(f"{native_base_url(self.base_url)}{get_llm_provider().health_path}")
                 return response.status_code == 200
         except Exception as e:
             logger.error(f"Ollama connection check failed: {e}")
@@ -41,39 +70,53 @@ class OllamaService:
         max_tokens: Optional[int] = None
     ) -> str:
         """Generate response from Ollama"""
+        return await self.generate_chat(
+            [{"role": "user", "content": prompt}],
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    
+    async def generate_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """Generate response for a list of chat messages"""
         try:
             model = model or self.model
             
-            response = self.client.chat.completions.create(
+            result = await chat_completion_async(
+                messages,
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                timeout=self.timeout,
+                keep_alive=self.keep_alive,
+                num_ctx=self.num_ctx
             )
             
-            return response.choices[0].message.content
+            return result.content
         except Exception as e:
             logger.error(f"Ollama generation failed: {e}")
             raise
     
+    @llm_tracing.traced("ollama.generate_with_context")
     async def generate_with_context(
         self,
         context: str,
         question: str,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
     ) -> str:
         """Generate response with context"""
-        prompt = f"""На основе следующего контекста из документа ответьте на вопрос пользователя.
-
-Контекст:
-{context}
-
-Вопрос: {question}
-
-Дайте точный и полный ответ, используя информацию из предоставленного контекста.
-Если информации недостаточно, укажите это."""
-        
-        return await self.generate_response(prompt, model=model)
+        # Инструкции и история идут перед контекстом и вопросом,
+        # чтобы префикс промпта совпадал между ходами
+        messages = build_answer_messages(context, question, history=history)
+        llm_tracing.set_attributes(context_chars=len(context), history_messages=len(history or []))
+        return await self.generate_chat(messages, model=model)
     
     def get_available_models(self) -> List[str]:
         """Get list of available Ollama models"""
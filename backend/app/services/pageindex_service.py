@@ -3,95 +3,76 @@ PageIndex service for document indexing and search
 """
 import os
 import json
-import sys
+import asyncio
+import importlib
+import time
+import threading
 import logging
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Dict, Optional, Any
 from app.core.config import settings
+from app.services.prompts import build_tree_search_prompt
+import llm_metrics
+import llm_tracing
+import pageindex_profiler
+from pageindex_ollama import approx_count_tokens
+# Настройки запросов и пулы бэкендов применяются при импорте ollama_service
+import app.services.ollama_service  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
-# Добавляем путь к корню проекта в sys.path
-project_root = Path(__file__).parent.parent.parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
+# PageIndex (tiktoken, PyMuPDF) импортируется и подключается к pageindex_ollama
+# при первой индексации или поиске, а не при импорте модуля: запуск API и /api/health
+# не ждут ни тяжелых импортов, ни проверки доступности Ollama
+page_index_main = None
+config = None
+extract_json = None  # utils.extract_json того же пакета PageIndex, что и page_index_main
+_pageindex_lock = threading.Lock()
 
-# КРИТИЧНО: Патчим PageIndex для Ollama ПЕРЕД импортом
-try:
-    from pageindex_ollama import patch_pageindex_for_ollama, check_ollama_connection
-    
-    logger.info(f"🔧 Начинаю патчинг PageIndex для Ollama (модель: {settings.OLLAMA_MODEL})")
+def load_pageindex():
+    """Import PageIndex once; returns (page_index_main, config)"""
+    global page_index_main, config, extract_json
+    if page_index_main is None:
+        with _pageindex_lock:
+            if page_index_main is None:
+                start = time.perf_counter()
+                main, config, extract_json = _import_pageindex()
+                # page_index_main - признак загрузки для проверок без блокировки, присваивается последним
+                page_index_main = main
+                logger.info(f"PageIndex загружен за {time.perf_counter() - start:.2f} с")
+    return page_index_main, config
+
+def preload_pageindex():
+    """Load PageIndex in a background thread so the first request does not wait for it"""
+    def run():
+        try:
+            load_pageindex()
+        except Exception as e:
+            logger.error(f"❌ Фоновая загрузка PageIndex не удалась: {e}")
+    threading.Thread(target=run, name="pageindex-preload", daemon=True).start()
+
+def _import_pageindex():
+    """Import PageIndex with its LLM calls bound to pageindex_ollama; returns (page_index_main, config, extract_json)"""
+    from pageindex_ollama import bind_pageindex
     
-    # Проверяем и патчим
-    if not patch_pageindex_for_ollama(
-        base_url=settings.OLLAMA_BASE_URL,
-        model=settings.OLLAMA_MODEL
-    ):
-        logger.error("❌ Не удалось настроить PageIndex для Ollama")
-        raise RuntimeError("Не удалось настроить PageIndex для Ollama")
+    # Локальный подмодуль PageIndex, иначе установленный пакет pageindex
+    for package in ("PageIndex.pageindex", "pageindex"):
+        try:
+            bind_pageindex(package)
+            break
+        except ImportError as e:
+            import_error = e
     else:
-        logger.info(f"✅ PageIndex успешно патчен для Ollama (модель: {settings.OLLAMA_MODEL})")
-except ImportError as e:
-    logger.error(f"❌ Не удалось импортировать pageindex_ollama: {e}")
-    raise
-except Exception as e:
-    logger.error(f"❌ Ошибка при патчинге PageIndex: {e}")
-    import traceback
-    logger.error(traceback.format_exc())
-    raise
-
-# КРИТИЧНО: Импортируем PageIndex ПОСЛЕ патчинга, но патчим еще раз после импорта
-# так как "from .utils import *" копирует функции в пространство имен модуля
-try:
-    # Пытаемся импортировать из локального PageIndex
-    from PageIndex.pageindex import page_index_main, config
+        logger.error(f"❌ Не удалось импортировать PageIndex: {import_error}")
+        raise import_error
     
-    # КРИТИЧНО: Патчим page_index модуль ПОСЛЕ импорта, так как он использует "from .utils import *"
-    # и функции копируются в его пространство имен при импорте
-    try:
-        import PageIndex.pageindex.page_index as page_index_module
-        from pageindex_ollama import get_ollama_settings
-        
-        ollama_settings = get_ollama_settings()
-        if ollama_settings.get('patched'):
-            logger.info("🔄 Применяю дополнительный патчинг к page_index модулю после импорта...")
-            
-            # Получаем патченные функции из utils (они уже должны быть пропатчены)
-            import PageIndex.pageindex.utils as utils_module
-            
-            # Копируем патченные функции из utils в page_index
-            if hasattr(utils_module, 'ChatGPT_API'):
-                page_index_module.ChatGPT_API = utils_module.ChatGPT_API
-                logger.info("✅ ChatGPT_API скопирована из utils в page_index")
-            if hasattr(utils_module, 'ChatGPT_API_async'):
-                page_index_module.ChatGPT_API_async = utils_module.ChatGPT_API_async
-                logger.info("✅ ChatGPT_API_async скопирована из utils в page_index")
-            if hasattr(utils_module, 'ChatGPT_API_with_finish_reason'):
-                page_index_module.ChatGPT_API_with_finish_reason = utils_module.ChatGPT_API_with_finish_reason
-                logger.info("✅ ChatGPT_API_with_finish_reason скопирована из utils в page_index")
-            
-            # Проверяем, что патчинг применился
-            if hasattr(page_index_module, 'ChatGPT_API'):
-                # Проверяем, что функция действительно патчена (не оригинальная)
-                func_code = getattr(page_index_module.ChatGPT_API, '__code__', None)
-                if func_code and 'patched' in str(func_code):
-                    logger.info("✅ Патчинг page_index модуля подтвержден")
-                else:
-                    logger.warning("⚠️ Функция в page_index может быть не патчена")
-        else:
-            logger.warning("⚠️ Патчинг не был выполнен, пропускаем дополнительный патчинг page_index")
-    except Exception as e:
-        logger.warning(f"⚠️ Не удалось дополнительно патчить page_index модуль: {e}")
-        import traceback
-        logger.debug(traceback.format_exc())
-        
-except ImportError:
-    # Если не получилось, пробуем напрямую
-    try:
-        from pageindex import page_index_main, config
-    except ImportError as e:
-        logger.error(f"❌ Не удалось импортировать PageIndex: {e}")
-        raise
+    pageindex = importlib.import_module(package)
+    if settings.PAGEINDEX_PROFILE:
+        wrapped = pageindex_profiler.instrument_pageindex(importlib.import_module(f"{package}.page_index"))
+        logger.info(f"Профилирование индексации по этапам: обернуто функций PageIndex: {wrapped}")
+    utils = importlib.import_module(f"{package}.utils")
+    return pageindex.page_index_main, pageindex.config, utils.extract_json
 
 class PageIndexService:
     """Service for PageIndex document indexing and search"""
@@ -99,10 +80,6 @@ class PageIndexService:
     def __init__(self):
         self.index_dir = Path(settings.INDEX_DIR)
         self.index_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Проверяем подключение к Ollama
-        if not check_ollama_connection(settings.OLLAMA_BASE_URL):
-            logger.warning("⚠️  Ollama недоступен! Убедитесь, что Ollama запущен.")
     
     def index_document(
         self,
@@ -120,7 +97,6 @@ class PageIndexService:
             Словарь с результатами индексации
         """
         try:
-            import os
             if not os.path.exists(pdf_path):
                 raise FileNotFoundError(f"PDF файл не найден: {pdf_path}")
             
@@ -130,9 +106,25 @@ class PageIndexService:
             logger.info(f"Используемая модель Ollama: {settings.OLLAMA_MODEL}")
             
             # Проверяем подключение к Ollama перед началом
-            from pageindex_ollama import check_ollama_connection
-            if not check_ollama_connection(settings.OLLAMA_BASE_URL):
-                raise ConnectionError("Ollama недоступен! Убедитесь, что Ollama запущен и доступен по адресу " + settings.OLLAMA_BASE_URL)
+            from pageindex_ollama import check_ollama_connection, preload_model, llm_context
+            from ollama_pool import get_pool, INDEXING_POOL
+            indexing_urls = [b.base_url for b in get_pool(INDEXING_POOL).backends]
+            available_urls = [url for url in indexing_urls if check_ollama_connection(url)]
+            if not available_urls:
+                raise ConnectionError("Ollama недоступен! Убедитесь, что Ollama запущен и доступен по адресу " + ", ".join(indexing_urls))
+            
+            # Загружаем модель в фоне, пока PageIndex разбирает PDF,
+            # чтобы первый LLM-запрос индексации не ждал загрузки модели
+            for url in available_urls:
+                threading.Thread(
+                    target=preload_model,
+                    args=(settings.OLLAMA_MODEL,),
+                    kwargs={"base_url": url},
+                    daemon=True
+                ).start()
+            
+            # Первая индексация загружает PageIndex (если не успела фоновая загрузка)
+            page_index_main, config = load_pageindex()
             
             # Настройка опций PageIndex
             opt = config(
@@ -155,12 +147,15 @@ class PageIndexService:
             logger.info("  4. Построение дерева структуры")
             
             # Индексируем документ
-            import time
             start_time = time.time()
             
             try:
-                result = page_index_main(pdf_path, opt)
+                # Запросы индексации идут в пул индексации, с привязкой к документу
+                with llm_context(caller="indexing", document_id=document_id or pdf_path), \
+                        (pageindex_profiler.profile_indexing() if settings.PAGEINDEX_PROFILE else nullcontext()) as profile:
+                    result = page_index_main(pdf_path, opt)
             except Exception as indexing_error:
+                llm_metrics.INDEXING_SECONDS.observe(time.time() - start_time, "error")
                 logger.error(f"Ошибка при вызове page_index_main: {indexing_error}")
                 import traceback
                 logger.error(traceback.format_exc())
@@ -168,6 +163,7 @@ class PageIndexService:
             
             elapsed_time = time.time() - start_time
             logger.info(f"Индексация завершена за {elapsed_time:.2f} секунд ({elapsed_time/60:.2f} минут)")
+            llm_metrics.INDEXING_SECONDS.observe(elapsed_time, "ok")
             
             # Валидация результата
             if not result:
@@ -200,14 +196,30 @@ class PageIndexService:
             
             # Логируем статистику
             structure = result.get('structure', [])
+            page_count = 0
             if structure:
                 node_count = self._count_nodes(structure)
                 logger.info(f"Создано узлов в дереве: {node_count}")
+                page_count = self._count_pages(structure)
+                if page_count:
+                    llm_metrics.INDEXING_SECONDS_PER_PAGE.observe(elapsed_time / page_count)
+            
+            report = None
+            if profile is not None:
+                report = profile.report(pages=page_count or None)
+                profile_path = pageindex_profiler.report_path(index_path)
+                with open(profile_path, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2)
+                logger.info(
+                    f"Профиль индексации: {pageindex_profiler.format_report(report)}",
+                    extra={"indexing_profile": str(profile_path)}
+                )
             
             return {
                 "success": True,
                 "index_path": str(index_path),
-                "structure": result
+                "structure": result,
+                "profile": report
             }
             
         except FileNotFoundError:
@@ -230,6 +242,19 @@ class PageIndexService:
                     count += self._count_nodes(node['nodes'])
         return count
     
+    def _count_pages(self, structure: list) -> int:
+        """Число страниц документа: наибольший end_index среди узлов"""
+        pages = 0
+        for node in structure:
+            if isinstance(node, dict):
+                end_index = node.get('end_index')
+                if isinstance(end_index, int):
+                    pages = max(pages, end_index)
+                if 'nodes' in node:
+                    pages = max(pages, self._count_pages(node['nodes']))
+        return pages
+    
+    @llm_tracing.traced("index.load")
     def load_index(self, index_path: str) -> Dict[str, Any]:
         """
         Загружает индекс из файла
@@ -241,12 +266,16 @@ class PageIndexService:
             Словарь с данными индекса
         """
         try:
+            start = time.perf_counter()
             with open(index_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                index_data = json.load(f)
+            llm_metrics.INDEX_LOAD_SECONDS.observe(time.perf_counter() - start)
+            return index_data
         except Exception as e:
             logger.error(f"Ошибка при загрузке индекса: {e}")
             raise
     
+    @llm_tracing.traced("pageindex.search_tree")
     async def search_tree(
         self,
         index_path: str,
@@ -283,53 +312,45 @@ class PageIndexService:
                     "sources": []
                 }
             
-            # Создаем упрощенную версию дерева без текста для поиска
-            tree_without_text = self._remove_fields_from_tree(structure.copy(), fields=['text'])
-            
-            # Формируем промпт для tree search
-            import json
-            search_prompt = f"""
-You are given a question and a tree structure of a document.
-Each node contains a node id, node title, and a corresponding summary.
-Your task is to find all nodes that are likely to contain the answer to the question.
-
-Question: {query}
-
-Document tree structure:
-{json.dumps(tree_without_text, indent=2, ensure_ascii=False)}
-
-Please reply in the following JSON format:
-{{
-    "thinking": "<Your thinking process on which nodes are relevant to the question>",
-    "node_list": ["node_id_1", "node_id_2", ..., "node_id_n"]
-}}
-Directly return the final JSON structure. Do not output anything else.
-"""
-            
-            # Проверяем размер дерева - если слишком большое, обрезаем для промпта
-            tree_json = json.dumps(tree_without_text, indent=2, ensure_ascii=False)
-            max_tree_size = 50000  # Ограничение размера дерева в промпте
+            with llm_tracing.span("tree_search.build_prompt"):
+                # Создаем упрощенную версию дерева без текста для поиска
+                tree_without_text = self._remove_fields_from_tree(structure.copy(), fields=['text'])
             
-            if len(tree_json) > max_tree_size:
-                logger.warning(f"Дерево слишком большое ({len(tree_json)} символов), обрезаем для промпта")
-                # Берем только верхние уровни дерева
-                tree_without_text = self._truncate_tree_for_search(tree_without_text, max_depth=2)
+                # Проверяем размер дерева - если слишком большое, обрезаем для промпта
                 tree_json = json.dumps(tree_without_text, indent=2, ensure_ascii=False)
+                max_tree_size = 50000  # Ограничение размера дерева в промпте
+            
+                if len(tree_json) > max_tree_size:
+                    logger.warning(f"Дерево слишком большое ({len(tree_json)} символов), обрезаем для промпта")
+                    # Берем только верхние уровни дерева
+                    tree_without_text = self._truncate_tree_for_search(tree_without_text, max_depth=2)
+                    tree_json = json.dumps(tree_without_text, indent=2, ensure_ascii=False)
+                    llm_metrics.TREE_SEARCH_TRUNCATED.inc()
+            
+                # Формируем промпт для tree search: дерево документа - стабильный префикс,
+                # вопрос - в конце, чтобы Ollama переиспользовала KV-кэш между запросами
+                search_prompt = build_tree_search_prompt(tree_json, query)
+                prompt_tokens = approx_count_tokens(search_prompt)
+            llm_metrics.TREE_SEARCH_PROMPT_TOKENS.observe(prompt_tokens)
+            llm_tracing.set_attributes(prompt_tokens_approx=prompt_tokens, tree_chars=len(tree_json))
             
             # Выполняем tree search через Ollama
-            from pageindex_ollama import get_ollama_settings, check_ollama_connection
-            ollama_settings = get_ollama_settings()
-            model = ollama_settings.get('model', settings.OLLAMA_MODEL)
+            from pageindex_ollama import pageindex_chat_async, llm_context
+            from ollama_pool import is_pool_available
             
-            # Проверяем подключение к Ollama
-            if not check_ollama_connection(settings.OLLAMA_BASE_URL):
+            # Проверяем доступность Ollama по состоянию пула (без лишнего HTTP-запроса)
+            if not is_pool_available():
                 logger.warning("Ollama недоступен, используем keyword search")
                 return self._simple_keyword_search(structure, query)
             
-            # Используем патченную функцию ChatGPT_API
+            # Асинхронный вызов с повторами, как ChatGPT_API_async в PageIndex: ожидание
+            # слота в планировщике LLM-запросов не должно блокировать event loop
             try:
-                from PageIndex.pageindex.utils import ChatGPT_API
-                tree_search_result = ChatGPT_API(model=model, prompt=search_prompt)
+                if page_index_main is None:
+                    # Первый поиск до фоновой загрузки: импорт PageIndex не блокирует event loop
+                    await asyncio.to_thread(load_pageindex)
+                with llm_context(caller="search"):
+                    tree_search_result = await pageindex_chat_async(prompt=search_prompt)
                 
                 # Проверяем, что результат не пустой
                 if not tree_search_result or tree_search_result == "Error":
@@ -343,7 +364,6 @@ Directly return the final JSON structure. Do not output anything else.
             
             # Парсим результат
             try:
-                from PageIndex.pageindex.utils import extract_json
                 tree_search_json = extract_json(tree_search_result)
             except Exception as e:
                 logger.error(f"Ошибка при парсинге результата tree search: {e}")
@@ -0,0 +1,50 @@
+"""
+Prompt templates
+
+Static content (instructions, document tree) goes first and the per-query
+part goes last. Consecutive prompts for the same document then share a long
+common prefix, and Ollama reuses the KV cache it computed for that prefix
+instead of evaluating the whole tree again.
+"""
+from typing import List, Dict, Optional
+
+TREE_SEARCH_PROMPT = """You are given a tree structure of a document and a question.
+Each node contains a node id, node title, and a corresponding summary.
+Your task is to find all nodes that are likely to contain the answer to the question.
+
+Document tree structure:
+{tree_json}
+
+Question: {query}
+
+Please reply in the following JSON format:
+{{
+    "thinking": "<Your thinking process on which nodes are relevant to the question>",
+    "node_list": ["node_id_1", "node_id_2", ..., "node_id_n"]
+}}
+Directly return the final JSON structure. Do not output anything else.
+"""
+
+ANSWER_SYSTEM_PROMPT = """Вы отвечаете на вопросы пользователя на основе контекста из документа.
+Дайте точный и полный ответ, используя информацию из предоставленного контекста.
+Если информации недостаточно, укажите это."""
+
+ANSWER_PROMPT = """Контекст:
+{context}
+
+Вопрос: {question}"""
+
+def build_tree_search_prompt(tree_json: str, query: str) -> str:
+    """Tree search prompt: document tree first, question last"""
+    return TREE_SEARCH_PROMPT.format(tree_json=tree_json, query=query)
+
+def build_answer_messages(
+    context: str,
+    question: str,
+    history: Optional[List[Dict[str, str]]] = None
+) -> List[Dict[str, str]]:
+    """Answer messages: static instructions, chat history, then context and question"""
+    messages = [{"role": "system", "content": ANSWER_SYSTEM_PROMPT}]
+    messages.extend(history or [])
+    messages.append({"role": "user", "content": ANSWER_PROMPT.format(context=context, question=question)})
+    return messages
@@ -0,0 +1,194 @@
+"""
+Semantic cache: answers for paraphrased questions on the same document
+"""
+import threading
+import time
+import httpx
+from typing import Optional, Dict, Any, List
+from app.core.config import settings
+from app.services.answer_cache import index_fingerprint
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional: without it the semantic cache is off
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class _DocumentEntries:
+    """Normalized question embeddings of one document, one row per cached answer"""
+
+    def __init__(self, index_version: str, dimensions: int):
+        self.index_version = index_version
+        self.matrix = np.empty((0, dimensions), dtype=np.float32)
+        self.created_at: List[float] = []
+        self.answers: List[Dict[str, Any]] = []
+
+    def drop_rows(self, rows: List[int]):
+        keep = np.ones(len(self.answers), dtype=bool)
+        keep[rows] = False
+        self.matrix = self.matrix[keep]
+        self.created_at = [t for t, k in zip(self.created_at, keep) if k]
+        self.answers = [a for a, k in zip(self.answers, keep) if k]
+
+
+class SemanticCache:
+    """
+    Per-document cache of answers looked up by question embedding.
+
+    Question embeddings of a document are kept in a NumPy matrix of unit
+    vectors, so a lookup is one matrix-vector product. A question whose
+    cosine similarity to a cached one reaches ``threshold`` gets the cached
+    answer and sources. Only questions without chat history are cached:
+    with history the answer depends on the conversation, not only on the
+    question. Entries of a document are dropped when its index changes.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries_per_document: int = 500,
+        ttl: float = 86400,
+        embed_model: str = "nomic-embed-text"
+    ):
+        self.threshold = threshold
+        self.max_entries_per_document = max_entries_per_document
+        self.ttl = ttl
+        self.embed_model = embed_model
+        self._documents: Dict[int, _DocumentEntries] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.embedding_errors = 0
+        self.disabled_reason: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return settings.SEMANTIC_CACHE_ENABLED and np is not None and self.disabled_reason is None
+
+    @staticmethod
+    def _model_missing(error: Exception) -> bool:
+        """The server has no such embedding model (404 / "model ... not found")"""
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code == 404:
+                return True
+            try:
+                message = error.response.text
+            except Exception:
+                message = ""
+        else:
+            message = str(error)
+        return "not found" in message.lower()
+
+    async def embed(self, question: str) -> Optional["np.ndarray"]:
+        """Unit-length embedding of a question, None if the embedding model is unavailable"""
+        from pageindex_ollama import embed_async
+        try:
+            vectors = await embed_async([question.strip()], self.embed_model)
+        except Exception as e:
+            self.embedding_errors += 1
+            if self._model_missing(e):
+                # Модели нет - без нее каждый вопрос только ждал бы ошибку
+                with self._lock:
+                    first = self.disabled_reason is None
+                    self.disabled_reason = f"embedding model '{self.embed_model}' not found"
+                if first:
+                    logger.warning(
+                        f"Semantic cache disabled: embedding model '{self.embed_model}' not found "
+                        f"(ollama pull {self.embed_model} and restart to enable): {e}"
+                    )
+            else:
+                logger.warning(f"Semantic cache: failed to embed question with '{self.embed_model}': {e}")
+            return None
+        vector = np.asarray(vectors[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, document_id: int, index_path: str, model: str, vector: "np.ndarray") -> Optional[Dict[str, Any]]:
+        """Cached answer for the most similar question above the threshold"""
+        version = f"{index_fingerprint(index_path)}:{model}"
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is None or entries.index_version != version or entries.matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            self._expire(entries)
+            if not entries.answers:
+                self.misses += 1
+                return None
+
+            similarities = entries.matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return {**entries.answers[best], "similarity": float(similarities[best])}
+
+    def put(
+        self,
+        document_id: int,
+        index_path: str,
+        model: str,
+        vector: "np.ndarray",
+        question: str,
+        content: str,
+        sources: Optional[List[Dict]] = None
+    ):
+        version = f"{index_fingerprint(index_path)}:{model}"
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is None or entries.index_version != version or entries.matrix.shape[1] != vector.shape[0]:
+                entries = _DocumentEntries(version, vector.shape[0])
+                self._documents[document_id] = entries
+
+            self._expire(entries)
+            overflow = len(entries.answers) + 1 - self.max_entries_per_document
+            if overflow > 0:
+                entries.drop_rows(list(range(overflow)))
+
+            entries.matrix = np.vstack([entries.matrix, vector[np.newaxis, :]])
+            entries.created_at.append(time.monotonic())
+            entries.answers.append({"question": question, "content": content, "sources": sources})
+
+    def _expire(self, entries: _DocumentEntries):
+        now = time.monotonic()
+        expired = [i for i, created in enumerate(entries.created_at) if now - created > self.ttl]
+        if expired:
+            entries.drop_rows(expired)
+
+    def invalidate_document(self, document_id: int):
+        """Drop all answers for a document (after re-indexing or deletion)"""
+        with self._lock:
+            self._documents.pop(document_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.available,
+                "threshold": self.threshold,
+                "documents": len(self._documents),
+                "entries": sum(len(e.answers) for e in self._documents.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "embedding_errors": self.embedding_errors,
+                "disabled_reason": self.disabled_reason
+            }
+
+# Global semantic cache
+semantic_cache = SemanticCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries_per_document=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_DOCUMENT,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    embed_model=settings.OLLAMA_EMBED_MODEL
+)
+
+def get_semantic_cache() -> SemanticCache:
+    """Get the semantic cache instance"""
+    return semantic_cache
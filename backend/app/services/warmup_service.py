@@ -0,0 +1,154 @@
+"""
+Background model warm-up for Ollama
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+from app.core.config import settings
+from pageindex_ollama import preload_model_async, get_loaded_models_async
+from ollama_pool import get_all_backend_urls, set_backend_health
+
+logger = logging.getLogger(__name__)
+
+class BackendWarmState:
+    """Warm-up state of one Ollama backend"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.state = "cold"  # cold | warming | warm | error
+        self.loaded = False
+        self.last_warmed_at: Optional[datetime] = None
+        self.last_load_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "state": self.state,
+            "loaded": self.loaded,
+            "last_warmed_at": self.last_warmed_at.isoformat() if self.last_warmed_at else None,
+            "last_load_seconds": self.last_load_seconds,
+            "last_error": self.last_error
+        }
+
+class ModelWarmer:
+    """
+    Keeps the configured Ollama model loaded on every backend.
+
+    The first warm-up runs as a background task, so the API starts serving
+    requests immediately. After that each backend is checked every
+    OLLAMA_WARMUP_INTERVAL seconds and the model is loaded again if Ollama
+    unloaded it. The checks also update backend health in the pools.
+    """
+
+    def __init__(self):
+        self.model = settings.OLLAMA_MODEL
+        self.interval = settings.OLLAMA_WARMUP_INTERVAL
+        self.backends: Dict[str, BackendWarmState] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _backend_states(self) -> List[BackendWarmState]:
+        urls = get_all_backend_urls() or [settings.OLLAMA_BASE_URL]
+        for url in urls:
+            if url not in self.backends:
+                self.backends[url] = BackendWarmState(url)
+        return [self.backends[url] for url in urls]
+
+    def start(self):
+        """Start the warm-up loop without waiting for it"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the warm-up loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.gather(*(self.check_and_warm(backend) for backend in self._backend_states()))
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def check_and_warm(self, backend: BackendWarmState):
+        """Load the model on a backend unless it is already loaded"""
+        try:
+            if await self._is_loaded(backend):
+                backend.state = "warm"
+                return
+        except Exception as e:
+            backend.state = "error"
+            backend.last_error = str(e)
+            set_backend_health(backend.base_url, False, str(e))
+            logger.warning(f"Ollama backend {backend.base_url} check failed: {e}")
+            return
+        await self.warm(backend)
+
+    async def warm(self, backend: BackendWarmState):
+        """Load the model into Ollama memory"""
+        backend.state = "warming"
+        start = time.perf_counter()
+        try:
+            await preload_model_async(self.model, base_url=backend.base_url, keep_alive=settings.OLLAMA_KEEP_ALIVE)
+        except Exception as e:
+            backend.state = "error"
+            backend.last_error = str(e)
+            logger.warning(f"Failed to preload model '{self.model}' on {backend.base_url}: {e}")
+            return
+
+        backend.state = "warm"
+        backend.loaded = True
+        backend.last_error = None
+        backend.last_warmed_at = datetime.now(timezone.utc)
+        backend.last_load_seconds = time.perf_counter() - start
+        logger.info(f"Model '{self.model}' preloaded on {backend.base_url} in {backend.last_load_seconds:.2f}s")
+
+    async def _is_loaded(self, backend: BackendWarmState) -> bool:
+        """Check whether the backend currently has the model in memory"""
+        loaded = await get_loaded_models_async(backend.base_url)
+        set_backend_health(backend.base_url, True)
+        backend.loaded = self.model in loaded or f"{self.model}:latest" in loaded
+        return backend.loaded
+
+    async def get_status(self) -> Dict[str, Any]:
+        """Warm/cold state for the health endpoint"""
+        backends = self._backend_states()
+        for backend in backends:
+            try:
+                loaded = await self._is_loaded(backend)
+                if backend.state != "warming":
+                    backend.state = "warm" if loaded else "cold"
+            except Exception as e:
+                backend.loaded = False
+                backend.last_error = str(e)
+
+        states = {backend.state for backend in backends}
+        if states == {"warm"}:
+            state = "warm"
+        elif "warming" in states:
+            state = "warming"
+        elif "warm" in states:
+            state = "partial"
+        else:
+            state = "error" if "error" in states else "cold"
+
+        return {
+            "state": state,
+            "loaded": all(backend.loaded for backend in backends),
+            "backends": [backend.to_dict() for backend in backends]
+        }
+
+# Global model warmer
+model_warmer = ModelWarmer()
+
+def get_model_warmer() -> ModelWarmer:
+    """Get the model warmer instance"""
+    return model_warmer
@@ -0,0 +1,117 @@
+"""
+Benchmark: database round trips to persist one chat turn
+
+Compares the previous persistence path (each add_message selects the chat,
+commits and refreshes the message) with ChatService.add_message, which
+writes the message and the chats.updated_at change in one transaction and
+takes ids and timestamps from INSERT ... RETURNING. Both save the question
+before the LLM call and the answer after it, as process_query does.
+
+    python benchmarks/bench_add_message.py --turns 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.database.database import (  # noqa: E402
+    Base,
+    create_async_engines,
+    create_async_session_factory,
+    create_sync_engine,
+    track_queries,
+)
+from app.models.chat import Chat, Message, MessageRole  # noqa: E402
+from app.models.document import Document  # noqa: E402,F401
+from app.services.chat_service import ChatService  # noqa: E402
+
+
+async def legacy_add_message(db, chat_id: int, role: MessageRole, content: str, sources=None) -> Message:
+    """add_message as it was: INSERT, SELECT chat, commit, refresh"""
+    message = Message(chat_id=chat_id, role=role.value, content=content, sources=sources)
+    db.add(message)
+    chat = await db.get(Chat, chat_id, populate_existing=True)
+    if chat:
+        chat.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(message)
+    return message
+
+
+async def legacy_turn(db, chat_id: int):
+    await legacy_add_message(db, chat_id, MessageRole.USER, "question")
+    await legacy_add_message(db, chat_id, MessageRole.ASSISTANT, "answer", sources=[{"node_id": "0001"}])
+
+
+async def batched_turn(db, chat_id: int, chat: Chat):
+    service = ChatService.__new__(ChatService)  # без Ollama и PageIndex - нужен только db
+    service.db = db
+    await service._save_question(chat_id, chat, "question")
+    await service._save_answer(chat_id, chat, "answer", [{"node_id": "0001"}])
+
+
+async def measure(label: str, Session, chat_id: int, turns: int, batched: bool):
+    statements, commits, db_ms, wall_ms = [], [], [], []
+    async with Session() as db:
+        chat = await db.get(Chat, chat_id)  # маршрут уже загрузил чат
+        for _ in range(turns):
+            start = time.perf_counter()
+            with track_queries() as stats:
+                if batched:
+                    await batched_turn(db, chat_id, chat)
+                else:
+                    await legacy_turn(db, chat_id)
+            wall_ms.append((time.perf_counter() - start) * 1000)
+            statements.append(stats["statements"])
+            commits.append(stats["commits"])
+            db_ms.append(stats["seconds"] * 1000)
+
+    print(
+        f"{label:<10} {statistics.mean(statements):4.1f} statements   {statistics.mean(commits):3.1f} commits   "
+        f"DB {statistics.median(db_ms):6.2f} ms   wall p50 {statistics.median(wall_ms):6.2f} ms per turn"
+    )
+
+
+async def main_async(url: str, profile: str, turns: int):
+    sync_engine = create_sync_engine(url, profile)
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    read_engine, write_engine = create_async_engines(url, profile)
+    Session = create_async_session_factory(read_engine, write_engine)
+    async with Session() as db:
+        chat = Chat(title="bench")
+        db.add(chat)
+        await db.commit()
+        chat_id = chat.id
+
+    await measure("legacy", Session, chat_id, turns, batched=False)
+    await measure("current", Session, chat_id, turns, batched=True)
+
+    await read_engine.dispose()
+    if write_engine is not read_engine:
+        await write_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--profile", default="tuned", choices=["tuned", "default"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        print(f"SQLite ({args.profile} profile), {args.turns} turns (question + answer)\n")
+        asyncio.run(main_async(url, args.profile, args.turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Benchmark: end-to-end upload -> index -> query throughput of the FastAPI app
+
+Starts the fake Ollama server (configurable latency, tokens/sec, parallel
+slots and injected failures) and the real app under uvicorn on a temporary
+database, uploads generated PDFs, waits for indexing, then sends chat
+queries from concurrent clients. Questions repeat across chats, so the
+answer caches are exercised the way they are in production.
+
+Results (latency percentiles, throughput, errors, fake server counters,
+git commit and configuration) are written as JSON; with --baseline the run
+is compared to an earlier result and the exit code is 1 on a regression.
+
+    python benchmarks/bench_e2e.py --documents 4 --pages 20 --queries 200 --concurrency 8 \\
+        --output e2e.json --baseline e2e-main.json
+
+The same --seed gives the same documents, questions and injected failures.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_ollama import FakeOllama, pageindex_response  # noqa: E402
+
+QUESTIONS = [
+    "What are the main risks described in the document?",
+    "Summarize the section about revenue.",
+    "How long is the annual leave?",
+    "Who is responsible for data protection?",
+    "What does the document say about termination?",
+    "Which deadlines are mentioned?",
+    "What are the payment terms?",
+    "List the obligations of the contractor.",
+    "How are disputes resolved?",
+    "What is the scope of the agreement?",
+]
+
+# Метрики для сравнения с baseline: (путь в результатах, больше - лучше)
+COMPARED = [
+    ("indexing.latency_ms.p50", False),
+    ("indexing.latency_ms.p95", False),
+    ("indexing.pages_per_second", True),
+    ("query.latency_ms.p50", False),
+    ("query.latency_ms.p95", False),
+    ("query.latency_ms.p99", False),
+    ("query.throughput_qps", True),
+]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies_ms):
+    if not latencies_ms:
+        return None
+    return {
+        "p50": round(percentile(latencies_ms, 50), 1),
+        "p95": round(percentile(latencies_ms, 95), 1),
+        "p99": round(percentile(latencies_ms, 99), 1),
+        "mean": round(statistics.mean(latencies_ms), 1),
+        "max": round(max(latencies_ms), 1),
+    }
+
+
+def make_pdf(path: Path, pages: int, seed: int):
+    """PDF с одним разделом на странице и детерминированным текстом"""
+    import fitz  # PyMuPDF, как и сам PageIndex
+
+    rng = random.Random(seed)
+    words = "policy contract revenue risk employee leave payment audit data schedule obligation report".split()
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page()
+        body = " ".join(rng.choice(words) for _ in range(300))
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), f"Section {page_number}\n\n{body}", fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=backend_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def start_app(workdir: Path, fake: FakeOllama, args):
+    """Запускает приложение под uvicorn в отдельном потоке (настройки - через окружение, до импорта app)"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir / 'app.db'}",
+        "UPLOAD_DIR": str(workdir / "uploads"),
+        "INDEX_DIR": str(workdir / "indices"),
+        "OLLAMA_BASE_URL": fake.base_url + "/v1",
+        "OLLAMA_MODEL": "bench-model",
+        "OLLAMA_WARMUP_ENABLED": "false",
+        "TRACING_EXPORTER": args.tracing,
+    })
+    from app.core import logging_config
+
+    logging_config.LOG_DIR = workdir / "logs"
+    logging_config.LOG_FILE = logging_config.LOG_DIR / "backend.log"
+    logging_config.TRACE_FILE = logging_config.LOG_DIR / "traces.jsonl"
+
+    import uvicorn
+    from app.main import app
+
+    if not args.verbose and logging_config._listener is not None:
+        # Консоль не в терминал: backend.log пишется как обычно, во временный каталог
+        for handler in logging_config._listener.handlers:
+            if type(handler) is logging_config.logging.StreamHandler:
+                handler.setStream(open(os.devnull, "w"))
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn не запустился")
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def upload_and_index(client, path: Path, poll_interval: float, timeout: float):
+    """(время загрузки ms, время до ready ms или None, статус)"""
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        response = await client.post("/api/documents/upload", files={"file": (path.name, f.read(), "application/pdf")})
+    upload_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        return upload_ms, None, f"upload {response.status_code}", None
+    document_id = response.json()["id"]
+    uploaded = time.perf_counter()
+    while time.perf_counter() - uploaded < timeout:
+        status = (await client.get(f"/api/documents/{document_id}")).json()["status"]
+        if status in ("ready", "error"):
+            return upload_ms, (time.perf_counter() - uploaded) * 1000, status, document_id
+        await asyncio.sleep(poll_interval)
+    return upload_ms, None, "timeout", document_id
+
+
+async def query_worker(client, chat_id: int, document_id: int, questions, use_history: bool, results: list):
+    for question in questions:
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"/api/chats/{chat_id}/query",
+                json={"query": question, "document_id": document_id, "use_history": use_history}
+            )
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        results.append((ok, (time.perf_counter() - start) * 1000))
+
+
+async def drive(base_url: str, pdfs, args):
+    import httpx
+
+    rng = random.Random(args.seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        # 1. Загрузка и индексация
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(path):
+            async with semaphore:
+                return await upload_and_index(client, path, args.poll_interval, args.timeout)
+
+        start = time.perf_counter()
+        indexed = await asyncio.gather(*(one(path) for path in pdfs))
+        indexing_wall = time.perf_counter() - start
+        ready = [document_id for _, _, status, document_id in indexed if status == "ready"]
+        index_latencies = [latency for _, latency, status, _ in indexed if status == "ready"]
+
+        # 2. Запросы: по чату на клиента, документы по кругу
+        query_results = []
+        query_wall = 0.0
+        if ready and args.queries:
+            distinct = QUESTIONS[:max(1, min(args.distinct_questions, len(QUESTIONS)))]
+            workers = []
+            for i in range(args.concurrency):
+                document_id = ready[i % len(ready)]
+                chat = await client.post("/api/chats/", json={"document_id": document_id, "title": f"bench {i}"})
+                chat.raise_for_status()
+                count = args.queries // args.concurrency + (1 if i < args.queries % args.concurrency else 0)
+                questions = [rng.choice(distinct) for _ in range(count)]
+                workers.append(query_worker(client, chat.json()["id"], document_id, questions, args.use_history, query_results))
+            start = time.perf_counter()
+            await asyncio.gather(*workers)
+            query_wall = time.perf_counter() - start
+
+    query_latencies = [latency for ok, latency in query_results if ok]
+    return {
+        "upload": {
+            "count": len(indexed),
+            "errors": sum(1 for _, _, status, _ in indexed if status.startswith("upload")),
+            "latency_ms": summarize([upload_ms for upload_ms, _, _, _ in indexed]),
+        },
+        "indexing": {
+            "documents": len(indexed),
+            "ready": len(ready),
+            "failed": len(indexed) - len(ready),
+            "pages": len(ready) * args.pages,
+            "latency_ms": summarize(index_latencies),
+            "wall_s": round(indexing_wall, 3),
+            "pages_per_second": round(len(ready) * args.pages / indexing_wall, 3) if indexing_wall else None,
+        },
+        "query": {
+            "count": len(query_results),
+            "errors": len(query_results) - len(query_latencies),
+            "latency_ms": summarize(query_latencies),
+            "wall_s": round(query_wall, 3),
+            "throughput_qps": round(len(query_latencies) / query_wall, 3) if query_wall else None,
+        },
+    }
+
+
+def lookup(results: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(results, dict):
+            return None
+        results = results.get(key)
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    """Печатает изменения относительно baseline; True, если есть регрессия больше max_regression %"""
+    print(f"\nvs baseline {baseline.get('git_commit') or '?'} ({baseline.get('timestamp', '?')}):")
+    regressed = False
+    for path, higher_is_better in COMPARED:
+        old, new = lookup(baseline, path), lookup(results, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > max_regression else ""
+        regressed = regressed or bool(flag)
+        print(f"  {path:<28} {old:>10} -> {new:>10}  {change:+6.1f}%{flag}")
+    return regressed
+
+
+def print_results(results: dict):
+    for phase in ("upload", "indexing", "query"):
+        data = results[phase]
+        latency = data["latency_ms"] or {}
+        extra = ""
+        if phase == "indexing":
+            extra = f"   {data['ready']}/{data['documents']} ready, {data['pages_per_second']} pages/s"
+        elif phase == "query":
+            extra = f"   {data['count']} queries, {data['errors']} errors, {data['throughput_qps']} q/s"
+        print(
+            f"{phase:<9} p50 {latency.get('p50', '-'):>8} ms   p95 {latency.get('p95', '-'):>8} ms   "
+            f"p99 {latency.get('p99', '-'):>8} ms{extra}"
+        )
+    stats = results["fake_ollama"]
+    print(
+        f"fake ollama: {stats['requests']} LLM requests, {stats['failures']} injected failures, "
+        f"{stats['cached_tokens']}/{stats['prompt_tokens']} prompt tokens from prefix cache"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2, help="PDFs to upload")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF")
+    parser.add_argument("--queries", type=int, default=50, help="Chat queries in total")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (uploads and chats)")
+    parser.add_argument("--distinct-questions", type=int, default=5, help="Different questions to pick from")
+    parser.add_argument("--use-history", action="store_true", help="Send use_history=true (disables answer cache hits)")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Fake Ollama: network latency per request")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="Fake Ollama: generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=20, help="Fake Ollama: tokens per answer")
+    parser.add_argument("--prompt-eval-ms-per-token", type=float, default=0.02, help="Fake Ollama: prompt evaluation cost")
+    parser.add_argument("--num-parallel", type=int, default=1, help="Fake Ollama: parallel slots (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fake Ollama: share of requests failed with HTTP 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracing", default="none", help="TRACING_EXPORTER for the app (none, file, console)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between document status polls")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds per request and per document indexing")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier JSON result to compare with")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed regression vs baseline, %%")
+    parser.add_argument("--verbose", action="store_true", help="Show the app log on the console")
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        prompt_eval_ms_per_token=args.prompt_eval_ms_per_token,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        latency_ms=args.latency_ms,
+        num_parallel=args.num_parallel,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        response_fn=pageindex_response,
+    ).start()
+
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as tmp:
+        workdir = Path(tmp)
+        pdfs = []
+        for i in range(args.documents):
+            path = workdir / f"doc_{i + 1}.pdf"
+            make_pdf(path, args.pages, args.seed + i)
+            pdfs.append(path)
+
+        server, thread, base_url = start_app(workdir, fake, args)
+        try:
+            results = asyncio.run(drive(base_url, pdfs, args))
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            fake.stop()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "verbose")}
+    results = {
+        "benchmark": "e2e",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": config,
+        **results,
+        "fake_ollama": dict(fake.stats),
+    }
+    print_results(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"\nresults written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
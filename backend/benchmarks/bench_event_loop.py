@@ -0,0 +1,133 @@
+"""
+Benchmark: event-loop blocking by database access in async routes
+
+Runs the same request mix (load a chat's messages, insert a message)
+concurrently on one event loop, first through a sync Session (as the
+routes did before) and then through an AsyncSession. A ticker coroutine
+measures how late the event loop wakes it up: with the sync session every
+query stalls the loop, so LLM streaming, websockets and other requests
+wait; with the async session the loop stays responsive.
+
+    python benchmarks/bench_event_loop.py --messages 2000 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.database import Base, get_async_database_url  # noqa: E402
+from app.models.chat import Chat, Message  # noqa: E402
+from app.models.document import Document  # noqa: E402,F401
+
+TICK = 0.001
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def seed(url: str, messages: int) -> int:
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        chat = Chat(title="bench")
+        db.add(chat)
+        db.flush()
+        db.add_all(
+            Message(chat_id=chat.id, role="user" if i % 2 else "assistant", content=f"message {i} " * 20)
+            for i in range(messages)
+        )
+        db.commit()
+        chat_id = chat.id
+    engine.dispose()
+    return chat_id
+
+
+async def ticker(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+def sync_request(Session, chat_id: int):
+    with Session() as db:
+        db.scalars(select(Message).where(Message.chat_id == chat_id).order_by(Message.created_at)).all()
+        db.add(Message(chat_id=chat_id, role="user", content="new question"))
+        db.commit()
+
+
+async def async_request(Session, chat_id: int):
+    async with Session() as db:
+        (await db.scalars(select(Message).where(Message.chat_id == chat_id).order_by(Message.created_at))).all()
+        db.add(Message(chat_id=chat_id, role="user", content="new question"))
+        await db.commit()
+
+
+async def run(label: str, requests: int, concurrency: int, handler):
+    stop = asyncio.Event()
+    lags = []
+    tick_task = asyncio.create_task(ticker(stop, lags))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+
+    print(
+        f"{label:<14} {requests / elapsed:7.1f} req/s   loop lag p50 {statistics.median(lags):8.2f} ms   "
+        f"p99 {percentile(lags, 99):8.2f} ms   max {max(lags):8.2f} ms"
+    )
+
+
+async def main_async(args, url: str, chat_id: int):
+    sync_engine = create_engine(url, connect_args={"check_same_thread": False})
+    SyncSession = sessionmaker(bind=sync_engine)
+
+    async def sync_handler():
+        sync_request(SyncSession, chat_id)
+        await asyncio.sleep(0)
+
+    await run("sync Session", args.requests, args.concurrency, sync_handler)
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(get_async_database_url(url), connect_args={"timeout": 30})
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+    await run("AsyncSession", args.requests, args.concurrency, lambda: async_request(AsyncSessionLocal, chat_id))
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="messages in the chat")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        chat_id = seed(url, args.messages)
+        print(f"SQLite, chat with {args.messages} messages, {args.requests} requests, concurrency {args.concurrency}\n")
+        asyncio.run(main_async(args, url, chat_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark: cost of accounting LLM calls in the database
+
+Compares writing one llm_calls row per call in its own transaction (what a
+naive INSERT after every LLM request would do) with LlmAccounting:
+record() on the hot path only appends to a buffer, and flush() writes the
+buffer in multi-row INSERTs.
+
+    python benchmarks/bench_llm_accounting.py --calls 5000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+RECORD = {
+    "caller": "indexing", "document_id": 1, "model": "qwen2.5:14b", "backend": "http://localhost:11434/v1",
+    "prompt_tokens": 1800, "completion_tokens": 250, "latency_ms": 1450.0, "prompt_eval_ms": 420.0,
+    "eval_ms": 1010.0, "finish_reason": "stop", "retries": 0, "cache_hit": False,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000, help="LLM calls to account")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Настройки читаются при импорте app: временная БД до импорта
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        from app.database.database import Base, engine
+        from app.models.llm_call import LlmCall
+        from app.services.llm_accounting import LlmAccounting
+        Base.metadata.create_all(bind=engine)
+
+        timings = []
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            t = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(LlmCall.__table__.insert(), [RECORD])
+            timings.append((time.perf_counter() - t) * 1e6)
+        elapsed = time.perf_counter() - start
+        print(f"row per call     {statistics.median(timings):8.1f} us p50 in the calling thread   {elapsed * 1000:7.0f} ms total")
+
+        accounting = LlmAccounting(batch_size=500)
+        accounting._stopped = False  # без фонового потока: flush() ниже измеряется отдельно
+        timings = []
+        for _ in range(args.calls):
+            t = time.perf_counter()
+            accounting.record(RECORD)
+            timings.append((time.perf_counter() - t) * 1e6)
+        start = time.perf_counter()
+        written = accounting.flush()
+        flush = time.perf_counter() - start
+        print(
+            f"LlmAccounting    {statistics.median(timings):8.1f} us p50 in the calling thread   "
+            f"{flush * 1000:7.0f} ms to flush {written} records in the writer thread"
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
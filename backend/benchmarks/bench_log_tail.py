@@ -0,0 +1,71 @@
+"""
+Benchmark: last N lines of a large log file
+
+Compares the previous /api/health/logs implementation (readlines() of the
+whole file, then slice) with log_reader.tail_lines, which reads blocks
+backwards from the end. Reports time and peak Python memory.
+
+    python benchmarks/bench_log_tail.py --size-mb 200 --lines 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.log_reader import tail_lines  # noqa: E402
+
+LINE = "2025-01-20 10:00:00,000 - pageindex_ollama - INFO - 🤖 ChatGPT_API вызван, model=qwen2.5:14b, prompt_len={}\n"
+
+
+def write_log(path: str, size_mb: int):
+    target = size_mb * 1024 * 1024
+    written = 0
+    i = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            chunk = "".join(LINE.format(i + j) for j in range(10000))
+            f.write(chunk)
+            written += len(chunk.encode("utf-8"))
+            i += 10000
+
+
+def legacy_tail(path: str, lines: int):
+    with open(path, "r", encoding="utf-8") as f:
+        all_lines = f.readlines()
+        return all_lines[-lines:] if len(all_lines) > lines else all_lines
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {elapsed * 1000:9.1f} ms   peak memory {peak / 1024 / 1024:9.2f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "backend.log")
+        write_log(path, args.size_mb)
+        print(f"{os.path.getsize(path) / 1024 / 1024:.0f} MB log, last {args.lines} lines\n")
+        legacy = measure("readlines", lambda: legacy_tail(path, args.lines))
+        tail, _, _ = measure("tail_lines", lambda: tail_lines(path, args.lines))
+        assert tail == legacy
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: cost of logging calls on the LLM hot path
+
+Times the logging calls a patched PageIndex request makes (a repeated
+model-check warning, the request line and the per-call record), first
+with the previous setup (FileHandler + StreamHandler formatting and
+writing in the calling thread), then with setup_logging() (QueueHandler,
+JSON records written by a listener thread, repeated messages dropped).
+
+    python benchmarks/bench_logging.py --calls 20000
+"""
+import argparse
+import io
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core import logging_config  # noqa: E402
+
+MODEL = "qwen2.5:14b"
+
+
+def hot_path(log: logging.Logger, i: int):
+    log.warning(f"⚠️ Игнорируем переданную модель 'gpt-4o-2024-11-20', используем '{MODEL}' из настроек Ollama")
+    log.info(f"🔍 Отправка запроса в Ollama с моделью: '{MODEL}' (должна быть '{MODEL}')")
+    log.info(
+        f"LLM {MODEL}: {1200 + i % 300} ms, tokens 1800/250",
+        extra={"model": MODEL, "latency_ms": 1200 + i % 300, "prompt_tokens": 1800, "completion_tokens": 250}
+    )
+
+
+def run(label: str, calls: int):
+    log = logging.getLogger("pageindex_ollama")
+    timings = []
+    start = time.perf_counter()
+    for i in range(calls):
+        t = time.perf_counter()
+        hot_path(log, i)
+        timings.append((time.perf_counter() - t) * 1e6)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<16} {statistics.median(timings):7.1f} us p50   {sorted(timings)[int(0.99 * calls)]:8.1f} us p99   "
+        f"{elapsed * 1000:7.0f} ms total in the calling thread"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000, help="LLM requests to simulate")
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    console = io.StringIO()  # консоль не в терминал: не измеряем скорость терминала
+    with tempfile.TemporaryDirectory() as tmp:
+        root.handlers = [
+            logging.FileHandler(Path(tmp) / "sync.log", encoding="utf-8"),
+            logging.StreamHandler(console),
+        ]
+        for handler in root.handlers:
+            handler.setFormatter(logging.Formatter(logging_config.LOG_FORMAT))
+        root.setLevel(logging.INFO)
+        run("sync handlers", args.calls)
+        for handler in root.handlers:
+            handler.close()
+
+        logging_config.LOG_DIR = Path(tmp)
+        logging_config.LOG_FILE = Path(tmp) / "backend.log"
+        real_stderr, sys.stderr = sys.stderr, console
+        try:
+            logging_config.setup_logging()
+            run("queue + dedup", args.calls)
+            start = time.perf_counter()
+            logging_config.stop_logging()
+            drain = time.perf_counter() - start
+        finally:
+            sys.stderr = real_stderr
+        lines = sum(1 for _ in open(logging_config.LOG_FILE, encoding="utf-8"))
+        print(f"\nqueue drained in {drain * 1000:.0f} ms by the listener thread, {lines} records written for {args.calls * 3} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: cost of metrics on the LLM hot path
+
+Times what _record_call adds per LLM request (three histogram
+observations with the caller from llm_context), from several threads at
+once like concurrent indexing, and how long rendering /metrics takes.
+
+    python benchmarks/bench_metrics.py --calls 200000 --threads 4
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import llm_metrics  # noqa: E402
+
+CALLERS = ("indexing", "search", "answer", "summary")
+
+
+def record(i: int):
+    caller = llm_metrics.caller_label(CALLERS[i % len(CALLERS)])
+    llm_metrics.LLM_REQUEST_SECONDS.observe(0.5 + (i % 100) / 10, caller, "qwen2.5:14b")
+    llm_metrics.LLM_PROMPT_TOKENS.observe(1800 + i % 500, caller)
+    llm_metrics.LLM_COMPLETION_TOKENS.observe(250 + i % 100, caller)
+
+
+def run(calls: int, threads: int) -> float:
+    def worker():
+        for i in range(calls // threads):
+            record(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000, help="LLM requests to record")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    single = run(args.calls, 1)
+    print(f"1 thread:    {single / args.calls * 1e6:6.2f} us per LLM request")
+    parallel = run(args.calls, args.threads)
+    print(f"{args.threads} threads:   {parallel / args.calls * 1e6:6.2f} us per LLM request (wall time / requests)")
+
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        text = llm_metrics.render()
+        timings.append((time.perf_counter() - start) * 1000)
+    series = sum(1 for line in text.splitlines() if not line.startswith("#"))
+    print(f"render:      {statistics.median(timings):6.2f} ms p50 for {series} series")
+
+
+if __name__ == "__main__":
+    main()
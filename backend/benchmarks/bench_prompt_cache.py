@@ -0,0 +1,133 @@
+"""
+Benchmark: prompt-eval time of repeated tree-search queries on one document
+
+Compares the old prompt layout (question before the document tree) with the
+current one (tree first, question last) against the fake Ollama server,
+which reuses the KV cache for the common prefix of consecutive prompts.
+
+    python benchmarks/bench_prompt_cache.py --nodes 80 --queries 10
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.services.prompts import build_tree_search_prompt  # noqa: E402
+import pageindex_ollama  # noqa: E402
+from llm_provider import OllamaProvider  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+# Старый шаблон: вопрос перед деревом документа
+LEGACY_TREE_SEARCH_PROMPT = """
+You are given a question and a tree structure of a document.
+Each node contains a node id, node title, and a corresponding summary.
+Your task is to find all nodes that are likely to contain the answer to the question.
+
+Question: {query}
+
+Document tree structure:
+{tree_json}
+
+Please reply in the following JSON format:
+{{
+    "thinking": "<Your thinking process on which nodes are relevant to the question>",
+    "node_list": ["node_id_1", "node_id_2", ..., "node_id_n"]
+}}
+Directly return the final JSON structure. Do not output anything else.
+"""
+
+QUESTIONS = [
+    "Какова продолжительность ежегодного отпуска?",
+    "Как оформить командировку?",
+    "Какие документы нужны для приема на работу?",
+    "Кто утверждает график отпусков?",
+    "Как рассчитывается премия?",
+    "Какие правила пожарной безопасности действуют в офисе?",
+    "Как получить доступ к корпоративной почте?",
+    "Что делать при утере пропуска?",
+    "Каков порядок увольнения по собственному желанию?",
+    "Как компенсируются сверхурочные часы?",
+]
+
+
+def build_tree(node_count: int):
+    """Synthetic document tree with summaries"""
+    nodes = []
+    for i in range(node_count):
+        nodes.append({
+            "title": f"Раздел {i + 1}. Положение о порядке работы подразделения {i + 1}",
+            "node_id": f"{i:04d}",
+            "start_index": i * 3 + 1,
+            "end_index": i * 3 + 3,
+            "summary": " ".join(
+                f"Раздел описывает правила, сроки и ответственных за процесс номер {i + 1}, этап {j}."
+                for j in range(4)
+            ),
+        })
+    return nodes
+
+
+def run(server: FakeOllama, template, tree_json: str, queries):
+    server.reset_cache()
+    prompt_eval_ms = 0.0
+    evaluated_tokens = 0
+    start = time.perf_counter()
+    for query in queries:
+        prompt = template(tree_json, query)
+        result = pageindex_ollama.chat_completion(
+            [{"role": "user", "content": prompt}],
+            model="bench-model",
+            base_url=server.base_url,
+        )
+        prompt_eval_ms += result.prompt_eval_ms or 0
+        evaluated_tokens += result.prompt_tokens or 0
+    return {
+        "wall_s": time.perf_counter() - start,
+        "prompt_eval_ms": prompt_eval_ms,
+        "evaluated_tokens": evaluated_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=80, help="Количество узлов в дереве документа")
+    parser.add_argument("--queries", type=int, default=10, help="Количество вопросов к документу")
+    parser.add_argument("--prompt-eval-ms-per-token", type=float, default=0.2)
+    args = parser.parse_args()
+
+    pageindex_ollama.set_llm_provider(OllamaProvider())
+    tree_json = json.dumps(build_tree(args.nodes), indent=2, ensure_ascii=False)
+    queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+
+    layouts = {
+        "legacy (question first)": lambda tree, query: LEGACY_TREE_SEARCH_PROMPT.format(tree_json=tree, query=query),
+        "prefix-stable (tree first)": build_tree_search_prompt,
+    }
+
+    print("=" * 70)
+    print("PROMPT-EVAL ВРЕМЯ ПОВТОРНЫХ ЗАПРОСОВ К ОДНОМУ ДОКУМЕНТУ")
+    print("=" * 70)
+    print(f"Узлов в дереве: {args.nodes}, символов JSON: {len(tree_json)}, вопросов: {len(queries)}")
+
+    with FakeOllama(prompt_eval_ms_per_token=args.prompt_eval_ms_per_token, completion_tokens=1) as server:
+        results = {name: run(server, template, tree_json, queries) for name, template in layouts.items()}
+
+    print("-" * 70)
+    print(f"{'Layout':30} {'prompt-eval, ms':>16} {'eval tokens':>12} {'wall, s':>9}")
+    for name, result in results.items():
+        print(f"{name:30} {result['prompt_eval_ms']:16.1f} {result['evaluated_tokens']:12d} {result['wall_s']:9.2f}")
+
+    legacy, current = results.values()
+    if current["prompt_eval_ms"]:
+        print("-" * 70)
+        print(f"Ускорение prompt-eval: x{legacy['prompt_eval_ms'] / current['prompt_eval_ms']:.1f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
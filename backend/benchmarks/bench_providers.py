@@ -0,0 +1,114 @@
+"""
+Benchmark: LLM providers and the overhead of the PageIndex call path
+
+1. Overhead per call of ChatGPT_API as PageIndex sees it (pageindex_chat ->
+   chat_completion -> scheduler -> provider) over calling the provider
+   directly, with an in-process provider that answers immediately.
+2. Every provider (ollama, openai, llamacpp, vllm) against the fake server:
+   one sync and one async request, then N requests one by one vs the same
+   N requests sent concurrently through chat_completion_async (scheduler,
+   backend pool and accounting included).
+
+    python benchmarks/bench_providers.py --calls 20000 --batch 8
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import app.services  # noqa: E402,F401  (добавляет корень проекта в sys.path)
+import pageindex_ollama  # noqa: E402
+from llm_provider import ChatResult, LLMProvider, PROVIDERS  # noqa: E402
+from llm_scheduler import configure_scheduler  # noqa: E402
+from ollama_pool import configure_pools  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Does the text contain a table of contents? Answer yes or no."}]
+
+
+class NullProvider(LLMProvider):
+    """Answers without a server: what remains is the cost of the call path"""
+    name = "null"
+    RESULT = ChatResult(content="yes", prompt_tokens=12, completion_tokens=1)
+
+    def chat(self, messages, model, temperature=0.0, max_tokens=None, timeout=900, base_url="", keep_alive=None, num_ctx=None):
+        return self.RESULT
+
+    async def embed_async(self, texts, model, base_url, timeout=60, keep_alive=None):
+        return [[0.0] for _ in texts]
+
+
+def per_call_us(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def bench_overhead(calls: int):
+    provider = NullProvider()
+    pageindex_ollama.set_llm_provider(provider)
+    pageindex_ollama.set_ollama_options(coalesce_requests=False)
+    configure_pools(["http://null"])
+    configure_scheduler(4, {})
+    direct = per_call_us(lambda: provider.chat(MESSAGES, "model", base_url="http://null"), calls)
+    adapter = per_call_us(lambda: pageindex_ollama.pageindex_chat(model="gpt-4o-2024-11-20", prompt=MESSAGES[0]["content"]), calls)
+    print(f"provider.chat directly          {direct:8.2f} us/call")
+    print(f"ChatGPT_API (pageindex_chat)    {adapter:8.2f} us/call (+{adapter - direct:.2f} us: context, scheduler, metrics)")
+
+
+async def bench_provider_async(provider: LLMProvider, base_url: str, batch: int):
+    start = time.perf_counter()
+    await provider.chat_async(MESSAGES, "bench", base_url=base_url)
+    async_ms = (time.perf_counter() - start) * 1000
+
+    # Разные промпты: одинаковые одновременные запросы объединились бы в один
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        pageindex_ollama.chat_completion_async([{"role": "user", "content": f"{MESSAGES[0]['content']} #{i}"}], model="bench")
+        for i in range(batch)
+    ))
+    concurrent_ms = (time.perf_counter() - start) * 1000
+    assert len(results) == batch
+    return async_ms, concurrent_ms
+
+
+def bench_providers(batch: int, num_parallel: int):
+    with FakeOllama(tokens_per_second=400, completion_tokens=40, num_parallel=num_parallel) as fake:
+        configure_pools([fake.base_url])
+        configure_scheduler(num_parallel, {})
+        print(f"\nfake server: 40 tokens at 400 tok/s per request, {num_parallel} parallel slots, {batch} requests")
+        print(f"{'provider':<10} {'sync ms':>8} {'async ms':>9} {'sequential ms':>14} {'concurrent ms':>14}")
+        for name, provider_class in PROVIDERS.items():
+            provider = provider_class()
+            pageindex_ollama.set_llm_provider(provider)
+            start = time.perf_counter()
+            provider.chat(MESSAGES, "bench", base_url=fake.base_url)
+            sync_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for _ in range(batch):
+                provider.chat(MESSAGES, "bench", base_url=fake.base_url)
+            sequential_ms = (time.perf_counter() - start) * 1000
+            async_ms, concurrent_ms = asyncio.run(bench_provider_async(provider, fake.base_url, batch))
+            print(f"{name:<10} {sync_ms:8.1f} {async_ms:9.1f} {sequential_ms:14.1f} {concurrent_ms:14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000, help="calls for the overhead measurement")
+    parser.add_argument("--batch", type=int, default=8, help="requests sent one by one and concurrently")
+    parser.add_argument("--num-parallel", type=int, default=4, help="parallel slots of the fake server")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for _ in range(args.repeat):
+        bench_overhead(args.calls)
+    bench_providers(args.batch, args.num_parallel)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: chat latency while a document is being indexed
+
+Indexing workers send LLM requests back to back (like PageIndex generating
+node summaries), while a chat client sends one question at a time. The run
+is repeated without the LLM scheduler and with it, against the fake Ollama
+server, which processes one request at a time like Ollama with
+OLLAMA_NUM_PARALLEL=1.
+
+    python benchmarks/bench_scheduler.py --indexing-workers 8 --chat-queries 20
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import app.services  # noqa: E402,F401  (добавляет корень проекта в sys.path)
+import pageindex_ollama  # noqa: E402
+from llm_provider import OllamaProvider  # noqa: E402
+from llm_scheduler import configure_scheduler, get_scheduler, INDEXING  # noqa: E402
+from ollama_pool import configure_pools  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def indexing_worker(stop: threading.Event, counter: list, worker_id: int):
+    with pageindex_ollama.llm_context(caller="indexing", document_id="bench"):
+        i = 0
+        while not stop.is_set():
+            messages = [{"role": "user", "content": f"Summarize section {worker_id}.{i} of the document."}]
+            pageindex_ollama.chat_completion(messages)
+            counter[0] += 1
+            i += 1
+
+
+async def chat_client(queries: int, think_time: float):
+    latencies = []
+    for i in range(queries):
+        await asyncio.sleep(think_time)
+        messages = [{"role": "user", "content": f"Question {i}: how long is the annual leave?"}]
+        start = time.perf_counter()
+        with pageindex_ollama.llm_context(caller="answer", sticky_key="chat:bench"):
+            await pageindex_ollama.chat_completion_async(messages)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(label: str, args, scheduler_limits):
+    if scheduler_limits is None:
+        configure_scheduler(0)
+    else:
+        configure_scheduler(args.max_concurrency, {INDEXING: args.indexing_concurrency})
+
+    stop = threading.Event()
+    counter = [0]
+    workers = [
+        threading.Thread(target=indexing_worker, args=(stop, counter, i), daemon=True)
+        for i in range(args.indexing_workers)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    time.sleep(0.2)  # индексация уже идет, когда приходит первый вопрос
+
+    latencies = asyncio.run(chat_client(args.chat_queries, args.think_time))
+
+    stop.set()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{label:<22} chat p50 {statistics.median(latencies):7.0f} ms   "
+        f"p95 {percentile(latencies, 95):7.0f} ms   max {max(latencies):7.0f} ms   "
+        f"indexing {counter[0] / elapsed:5.1f} req/s"
+    )
+    scheduler = get_scheduler()
+    if scheduler:
+        stats = scheduler.status()["stats"]
+        for name, item in stats.items():
+            if item["requests"]:
+                print(f"    {name:<12} requests {item['requests']:4d}   avg wait {item['wait_seconds'] / item['requests'] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indexing-workers", type=int, default=8)
+    parser.add_argument("--chat-queries", type=int, default=20)
+    parser.add_argument("--think-time", type=float, default=0.05, help="pause between chat questions, s")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--completion-tokens", type=int, default=20)
+    parser.add_argument("--max-concurrency", type=int, default=1)
+    parser.add_argument("--indexing-concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    with FakeOllama(
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        prefix_cache=False,
+    ) as fake:
+        pageindex_ollama.set_llm_provider(OllamaProvider())
+        configure_pools([fake.base_url])
+        request_ms = args.completion_tokens / args.tokens_per_second * 1000
+        print(f"Fake Ollama: ~{request_ms:.0f} ms per request, {args.indexing_workers} indexing workers\n")
+
+        run("without scheduler", args, None)
+        run(f"scheduler ({args.max_concurrency}/{args.indexing_concurrency})", args, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: SQLite profiles under concurrent writers
+
+Indexing workers (threads with their own sync engine, like extra indexing
+processes) keep updating document status, while chat requests on the event
+loop read a chat's messages and insert new ones. Compares the default
+SQLite setup (rollback journal, every connection writes) with the tuned
+profile (WAL, synchronous=NORMAL, mmap, one writer connection).
+
+    python benchmarks/bench_sqlite_profiles.py --indexing-workers 4 --requests 300
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import select, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.database.database import (  # noqa: E402
+    Base,
+    create_async_engines,
+    create_async_session_factory,
+    create_sync_engine,
+)
+from app.models.chat import Chat, Message  # noqa: E402
+from app.models.document import Document, DocumentStatus  # noqa: E402
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def seed(url: str, profile: str, messages: int):
+    engine = create_sync_engine(url, profile)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        documents = [Document(filename=f"doc{i}.pdf", file_path=f"/tmp/doc{i}.pdf") for i in range(8)]
+        db.add_all(documents)
+        chat = Chat(title="bench")
+        db.add(chat)
+        db.flush()
+        db.add_all(Message(chat_id=chat.id, role="user", content=f"message {i} " * 20) for i in range(messages))
+        db.commit()
+        ids = [d.id for d in documents], chat.id
+    engine.dispose()
+    return ids
+
+
+def indexing_worker(url: str, profile: str, document_id: int, stop: threading.Event, stats: dict):
+    engine = create_sync_engine(url, profile)
+    Session = sessionmaker(bind=engine)
+    statuses = [DocumentStatus.INDEXING, DocumentStatus.READY]
+    i = 0
+    while not stop.is_set():
+        try:
+            with Session() as db:
+                db.execute(update(Document).where(Document.id == document_id).values(status=statuses[i % 2]))
+                db.commit()
+            stats["updates"] += 1
+        except Exception:
+            stats["errors"] += 1
+        i += 1
+        time.sleep(0.005)
+    engine.dispose()
+
+
+async def chat_requests(AsyncSessionLocal, chat_id: int, requests: int, concurrency: int):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    (await db.scalars(select(Message).where(Message.chat_id == chat_id).limit(50))).all()
+                    db.add(Message(chat_id=chat_id, role="user", content="question"))
+                    await db.commit()
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(profile: str, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        document_ids, chat_id = seed(url, profile, args.messages)
+
+        stop = threading.Event()
+        stats = {"updates": 0, "errors": 0}
+        workers = [
+            threading.Thread(target=indexing_worker, args=(url, profile, document_ids[i % len(document_ids)], stop, stats))
+            for i in range(args.indexing_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        async def main():
+            read_engine, write_engine = create_async_engines(url, profile)
+            try:
+                return await chat_requests(
+                    create_async_session_factory(read_engine, write_engine),
+                    chat_id,
+                    args.requests,
+                    args.concurrency
+                )
+            finally:
+                await read_engine.dispose()
+                if write_engine is not read_engine:
+                    await write_engine.dispose()
+
+        latencies, errors, elapsed = asyncio.run(main())
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    print(
+        f"{profile:<8} chat {len(latencies) / elapsed:6.1f} req/s   p50 {statistics.median(latencies):7.1f} ms   "
+        f"p95 {percentile(latencies, 95):7.1f} ms   errors {errors:3d}   "
+        f"indexing updates {stats['updates'] / elapsed:6.1f}/s   errors {stats['errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indexing-workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--busy-timeout", type=int, default=5000, help="ms, 5000 is the sqlite3 default")
+    args = parser.parse_args()
+
+    settings.SQLITE_BUSY_TIMEOUT = args.busy_timeout
+    print(f"{args.indexing_workers} indexing workers, {args.requests} chat requests, concurrency {args.concurrency}, busy timeout {args.busy_timeout} ms\n")
+    for profile in ("default", "tuned"):
+        run(profile, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: cold start of the API
+
+Two measurements, each in a fresh interpreter:
+  - import time of app.main (python -X importtime), with the heaviest
+    modules and whether PageIndex, tiktoken, PyMuPDF and openai were
+    imported on the startup path;
+  - time from launching uvicorn until /api/health answers.
+
+By default Ollama points at a local socket that accepts connections and
+never answers, so connection checks on the startup path wait for their
+timeout, as with a hung or overloaded Ollama.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --ollama-url http://localhost:11434/v1
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+backend_dir = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("PageIndex", "pageindex", "tiktoken", "fitz", "openai")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def app_env(tmp: str, ollama_url: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=f"sqlite:///{Path(tmp) / 'bench.db'}",
+        UPLOAD_DIR=str(Path(tmp) / "uploads"),
+        INDEX_DIR=str(Path(tmp) / "indices"),
+        OLLAMA_BASE_URL=ollama_url,
+    )
+    return env
+
+
+def measure_import(env: dict):
+    """Cumulative import time of app.main (ms) and per-module import times"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=backend_dir, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import app.main failed:\n{proc.stderr[-2000:]}")
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return modules["app.main"][1], modules
+
+
+def silent_ollama() -> socket.socket:
+    """Listening socket that never responds: the kernel completes the connect, nobody reads"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(128)
+    return sock
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_health(env: dict, timeout: float) -> float:
+    """Seconds from launching uvicorn until GET /api/health/ returns 200"""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/health/", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"/api/health did not answer within {timeout} s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--ollama-url", help="OLLAMA_BASE_URL for the app (default: a socket that never answers)")
+    parser.add_argument("--top", type=int, default=10, help="heaviest modules to list")
+    parser.add_argument("--health-timeout", type=float, default=120)
+    parser.add_argument("--skip-health", action="store_true", help="only measure import time")
+    args = parser.parse_args()
+
+    silent = None
+    if not args.ollama_url:
+        silent = silent_ollama()
+        args.ollama_url = f"http://127.0.0.1:{silent.getsockname()[1]}/v1"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = app_env(tmp, args.ollama_url)
+        totals = []
+        for _ in range(args.runs):
+            total, modules = measure_import(env)
+            totals.append(total)
+        print(f"import app.main   {statistics.median(totals):8.0f} ms p50 of {args.runs} runs (Ollama: {args.ollama_url})")
+
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+        print(f"heavy modules on the startup path: {', '.join(heavy) or 'none'}")
+        print(f"{'module':<45} {'self ms':>9} {'cumulative ms':>14}")
+        for name, (self_ms, _) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+            print(f"{name:<45} {self_ms:9.1f} {modules[name][1]:14.1f}")
+
+        if not args.skip_health:
+            health = [measure_health(env, args.health_timeout) for _ in range(args.runs)]
+            print(f"first /api/health {statistics.median(health) * 1000:8.0f} ms p50 after launching uvicorn")
+    if silent is not None:
+        silent.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Fake Ollama server for benchmarks
+
+Implements the parts of the Ollama API the backend uses (/api/tags,
+/api/ps, /api/generate, /api/chat, /api/embed) on top of the standard
+library HTTP server, and the OpenAI-compatible API (/v1/chat/completions,
+/v1/embeddings, /v1/models, /health) with llama.cpp-style timings, so the
+same server stands in for llama.cpp and vLLM. Both chat endpoints stream
+when the request asks for it.
+Prompt evaluation time is simulated per token, and like Ollama the server
+keeps the KV cache of the previous prompt of each model: tokens of the
+common prefix with the previous prompt are not evaluated again.
+Network latency, the number of parallel slots and a rate of injected
+failures (HTTP 500, like Ollama running out of memory) are configurable;
+with a seed the injected failures are reproducible.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+DEFAULT_RESPONSE = '{"thinking": "stub", "node_list": ["0001"]}'
+
+
+def tokenize(messages: List[Dict[str, str]]) -> List[str]:
+    """Rough tokenization of a rendered chat prompt"""
+    tokens = []
+    for message in messages:
+        tokens.append(f"<|{message.get('role', 'user')}|>")
+        tokens.extend(TOKEN_RE.findall(message.get("content") or ""))
+    return tokens
+
+
+def embed(text: str, dimensions: int = 64) -> List[float]:
+    """Deterministic bag-of-words embedding: texts sharing words are close"""
+    vector = [0.0] * dimensions
+    for word in TOKEN_RE.findall(text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[digest[0] % dimensions] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+PHYSICAL_INDEX_RE = re.compile(r"<physical_index_(\d+)>")
+
+
+def pageindex_response(messages: List[Dict[str, str]]) -> str:
+    """
+    Plausible answers to the prompts PageIndex and the chat send, so that a
+    whole document can be indexed and queried against the fake server: no
+    table of contents, one section per page, every check passes.
+    """
+    prompt = (messages[-1].get("content") or "") if messages else ""
+    lowered = prompt.lower()
+    if "toc_detected" in lowered or "table of content" in lowered and "detect" in lowered:
+        return '{"thinking": "no table of contents", "toc_detected": "no"}'
+    if "start_begin" in lowered:
+        return '{"thinking": "section starts at the top", "start_begin": "yes"}'
+    if "appear_start" in lowered or '"answer"' in lowered:
+        return '{"thinking": "title found on the page", "answer": "yes"}'
+    if "completed" in lowered and "toc" in lowered:
+        return '{"thinking": "complete", "completed": "yes"}'
+    if "physical_index" in lowered:
+        pages = sorted({int(n) for n in PHYSICAL_INDEX_RE.findall(prompt)})
+        return json.dumps([
+            {"structure": str(i + 1), "title": f"Section {page}", "physical_index": f"<physical_index_{page}>"}
+            for i, page in enumerate(pages)
+        ])
+    if "node_list" in lowered:
+        return '{"thinking": "the first sections are relevant", "node_list": ["0000", "0001"]}'
+    return "This part of the document describes the section topic in a few sentences."
+
+
+def common_prefix_length(a: List[str], b: List[str]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class FakeOllama:
+    """Threaded fake Ollama server with simulated prefix caching"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        prompt_eval_ms_per_token: float = 0.2,
+        tokens_per_second: float = 200.0,
+        completion_tokens: int = 20,
+        prefix_cache: bool = True,
+        load_ms: float = 0.0,
+        response_fn: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        latency_ms: float = 0.0,
+        num_parallel: int = 1,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.prompt_eval_ms_per_token = prompt_eval_ms_per_token
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.prefix_cache = prefix_cache
+        self.load_ms = load_ms
+        self.loaded_models = set()
+        self.response_fn = response_fn or (lambda messages: DEFAULT_RESPONSE)
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        # Слоты генерации, как OLLAMA_NUM_PARALLEL: сверх них запросы ждут
+        self.slots = threading.BoundedSemaphore(num_parallel)
+        self.last_prompt: Dict[str, List[str]] = {}
+        self.stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "failures": 0}
+
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_cache(self):
+        with self.lock:
+            self.last_prompt.clear()
+
+    def load(self, model: str) -> float:
+        """Simulate loading a model into memory, returns load time in seconds"""
+        if model in self.loaded_models:
+            return 0.0
+        time.sleep(self.load_ms / 1000)
+        self.loaded_models.add(model)
+        return self.load_ms / 1000
+
+    def should_fail(self) -> bool:
+        """Decide whether to inject a failure into this request (counted in stats)"""
+        time.sleep(self.latency_ms / 1000)
+        with self.lock:
+            failed = self.failure_rate > 0 and self.random.random() < self.failure_rate
+            if failed:
+                self.stats["failures"] += 1
+            return failed
+
+    def complete(self, model: str, messages: List[Dict[str, str]]) -> Dict:
+        """Simulate one generation and return native /api/chat response fields"""
+        tokens = tokenize(messages)
+        with self.slots:
+            with self.lock:
+                load_s = self.load(model)
+                cached = 0
+                if self.prefix_cache:
+                    cached = common_prefix_length(self.last_prompt.get(model, []), tokens)
+                self.last_prompt[model] = tokens
+                evaluated = len(tokens) - cached
+                self.stats["requests"] += 1
+                self.stats["prompt_tokens"] += len(tokens)
+                self.stats["cached_tokens"] += cached
+
+            # Слот обрабатывает запрос целиком, как Ollama с OLLAMA_NUM_PARALLEL=num_parallel
+            prompt_eval_s = evaluated * self.prompt_eval_ms_per_token / 1000
+            eval_s = self.completion_tokens / self.tokens_per_second
+            time.sleep(prompt_eval_s + eval_s)
+
+        return {
+            "model": model,
+            "message": {"role": "assistant", "content": self.response_fn(messages)},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(prompt_eval_s * 1e9),
+            "eval_count": self.completion_tokens,
+            "eval_duration": int(eval_s * 1e9),
+            "load_duration": int(load_s * 1e9),
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, data, status=200):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, content_type: str, lines: List[str]):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.end_headers()
+                for line in lines:
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def _stream_native(self, result: Dict):
+                # NDJSON: фрагменты ответа по словам, затем done=true со статистикой
+                words = re.findall(r"\S+\s*", result["message"]["content"])
+                lines = [
+                    json.dumps({"model": result["model"], "message": {"role": "assistant", "content": word}, "done": False}) + "\n"
+                    for word in words
+                ]
+                lines.append(json.dumps({**result, "message": {"role": "assistant", "content": ""}}) + "\n")
+                self._send_stream("application/x-ndjson", lines)
+
+            def _stream_openai(self, response: Dict):
+                # Server-sent events: delta по словам, finish_reason, usage и timings, [DONE]
+                choice = response["choices"][0]
+                chunk = {"id": response["id"], "object": "chat.completion.chunk", "model": response["model"]}
+                lines = [
+                    "data: " + json.dumps({**chunk, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}) + "\n\n"
+                    for word in re.findall(r"\S+\s*", choice["message"]["content"])
+                ]
+                lines.append("data: " + json.dumps({
+                    **chunk,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}],
+                    "usage": response["usage"],
+                    "timings": response["timings"],
+                }) + "\n\n")
+                lines.append("data: [DONE]\n\n")
+                self._send_stream("text/event-stream", lines)
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": model, "size": 0} for model in fake.last_prompt]})
+                elif self.path == "/api/ps":
+                    self._send_json({"models": [{"name": model, "model": model} for model in fake.loaded_models]})
+                elif self.path == "/health":
+                    self._send_json({"status": "ok"})
+                elif self.path == "/v1/models":
+                    self._send_json({"object": "list", "data": [{"id": model, "object": "model"} for model in fake.last_prompt]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                request = self._read_json()
+                model = request.get("model", "")
+                if self.path in ("/api/chat", "/api/embed", "/v1/chat/completions", "/v1/embeddings") and fake.should_fail():
+                    self._send_json({"error": "injected failure: model runner has unexpectedly stopped"}, status=500)
+                elif self.path == "/api/generate" and not request.get("prompt"):
+                    with fake.lock:
+                        load_s = fake.load(model)
+                    self._send_json({"model": model, "response": "", "done": True, "load_duration": int(load_s * 1e9)})
+                elif self.path == "/api/embed":
+                    texts = request.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    self._send_json({"model": model, "embeddings": [embed(text) for text in texts]})
+                elif self.path == "/v1/embeddings":
+                    texts = request.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    self._send_json({
+                        "object": "list",
+                        "data": [{"object": "embedding", "index": i, "embedding": embed(text)} for i, text in enumerate(texts)],
+                    })
+                elif self.path == "/api/chat":
+                    result = fake.complete(model, request.get("messages", []))
+                    if request.get("stream", True):  # как у Ollama: stream по умолчанию
+                        self._stream_native(result)
+                    else:
+                        self._send_json(result)
+                elif self.path == "/v1/chat/completions":
+                    result = fake.complete(model, request.get("messages", []))
+                    response = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": result["message"],
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {
+                            "prompt_tokens": result["prompt_eval_count"],
+                            "completion_tokens": result["eval_count"],
+                            "total_tokens": result["prompt_eval_count"] + result["eval_count"],
+                        },
+                        "timings": {
+                            "prompt_n": result["prompt_eval_count"],
+                            "prompt_ms": result["prompt_eval_duration"] / 1e6,
+                            "predicted_n": result["eval_count"],
+                            "predicted_ms": result["eval_duration"] / 1e6,
+                        },
+                    }
+                    if request.get("stream"):
+                        self._stream_openai(response)
+                    else:
+                        self._send_json(response)
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--prompt-eval-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--num-parallel", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        port=args.port,
+        prompt_eval_ms_per_token=args.prompt_eval_ms_per_token,
+        tokens_per_second=args.tokens_per_second,
+        latency_ms=args.latency_ms,
+        num_parallel=args.num_parallel,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        response_fn=pageindex_response,
+    )
+    print(f"Fake Ollama listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
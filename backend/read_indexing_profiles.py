@@ -0,0 +1,72 @@
+"""
+Script to summarize indexing profiles (*_index.profile.json in INDEX_DIR)
+
+Profiles are written when PAGEINDEX_PROFILE=true. The summary adds up all
+documents: per PageIndex stage the share of indexing time, LLM calls and
+tokens, so it shows which stage is worth optimizing for the documents
+actually indexed. With a path to one profile prints just that document.
+
+    python read_indexing_profiles.py
+    python read_indexing_profiles.py --index-dir /data/indices
+    python read_indexing_profiles.py indices/document_7_index.profile.json
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+STAGE_FIELDS = ("seconds", "calls", "llm_calls", "llm_seconds", "prompt_tokens", "completion_tokens")
+
+
+def load_profiles(paths):
+    profiles = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"skip {path}: {e}", file=sys.stderr)
+    return profiles
+
+
+def print_summary(profiles):
+    total_seconds = sum(p.get("total_seconds") or 0 for p in profiles)
+    pages = sum(p.get("pages") or 0 for p in profiles)
+    stages = defaultdict(lambda: dict.fromkeys(STAGE_FIELDS, 0))
+    for profile in profiles:
+        for name, values in profile.get("stages", {}).items():
+            for field in STAGE_FIELDS:
+                stages[name][field] += values.get(field) or 0
+
+    print(
+        f"{len(profiles)} documents, {pages} pages, {total_seconds:.1f} s indexing"
+        + (f", {total_seconds / pages:.2f} s/page" if pages else "")
+    )
+    print(f"{'stage':<20} {'time s':>9} {'share':>6} {'LLM calls':>10} {'LLM s':>9} {'prompt tok':>11} {'compl tok':>10}")
+    for name, values in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        share = values["seconds"] / total_seconds if total_seconds else 0
+        print(
+            f"{name:<20} {values['seconds']:9.1f} {share:6.0%} {values['llm_calls']:10d} "
+            f"{values['llm_seconds']:9.1f} {values['prompt_tokens']:11d} {values['completion_tokens']:10d}"
+        )
+    print("(stages are nested: tree_building includes TOC detection and verification, LLM calls are counted once)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("profiles", nargs="*", help="profile files (default: all in --index-dir)")
+    parser.add_argument("--index-dir", default=os.environ.get("INDEX_DIR", str(Path(__file__).parent / "indices")))
+    args = parser.parse_args()
+
+    paths = args.profiles or sorted(Path(args.index_dir).glob("*.profile.json"))
+    profiles = load_profiles(paths)
+    if not profiles:
+        print("No indexing profiles found (set PAGEINDEX_PROFILE=true and index a document)")
+        return
+    print_summary(profiles)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,92 @@
 """
 Script to read backend logs
+
+backend.log is JSON Lines (LOG_JSON=true), so records can be filtered by
+field instead of by text:
+
+    python read_logs.py                          # last 50 records
+    python read_logs.py --level ERROR --lines 20
+    python read_logs.py --document-id 2 --stage indexing
+    python read_logs.py --chat-id 5 --json       # raw JSON records
 """
+import argparse
+import json
 import sys
+from collections import deque
 from pathlib import Path
 
 log_file = Path(__file__).parent / "logs" / "backend.log"
 
-if not log_file.exists():
-    print("Log file not found:", log_file)
-    sys.exit(1)
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+
+def parse(line: str):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None  # строка в старом текстовом формате
+
+
+def matches(record, args) -> bool:
+    if record is None:
+        return not (args.level or args.document_id or args.chat_id or args.stage or args.logger)
+    if args.level and LEVELS.index(record.get("level", "INFO")) < LEVELS.index(args.level):
+        return False
+    if args.document_id is not None and record.get("document_id") != args.document_id:
+        return False
+    if args.chat_id is not None and record.get("chat_id") != args.chat_id:
+        return False
+    if args.stage and record.get("stage") != args.stage:
+        return False
+    if args.logger and not record.get("logger", "").startswith(args.logger):
+        return False
+    return True
+
+
+def render(line: str, record) -> str:
+    if record is None:
+        return line.rstrip()
+    fields = {k: v for k, v in record.items() if k not in ("ts", "level", "logger", "message", "exc")}
+    text = f"{record['ts']} - {record['logger']} - {record['level']} - {record['message']}"
+    if fields:
+        text += "  " + " ".join(f"{k}={v}" for k, v in fields.items())
+    if record.get("exc"):
+        text += "\n" + record["exc"]
+    return text
 
-try:
-    with open(log_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-        print(f"Total log lines: {len(lines)}")
-        print("\n" + "="*80)
-        print("RECENT LOGS (last 50 lines):")
-        print("="*80 + "\n")
-        for line in lines[-50:]:
-            print(line.rstrip())
-except Exception as e:
-    print(f"Error reading logs: {e}")
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=50, help="how many matching records to show")
+    parser.add_argument("--level", choices=LEVELS, help="minimum level")
+    parser.add_argument("--document-id", type=int)
+    parser.add_argument("--chat-id", type=int)
+    parser.add_argument("--stage", help="indexing, chat, ...")
+    parser.add_argument("--logger", help="logger name prefix, e.g. pageindex_ollama")
+    parser.add_argument("--json", action="store_true", help="print raw JSON records")
+    args = parser.parse_args()
 
+    if not log_file.exists():
+        print("Log file not found:", log_file)
+        sys.exit(1)
 
+    # Файл читается построчно: в памяти только последние --lines совпадений
+    recent = deque(maxlen=args.lines)
+    total = 0
+    with open(log_file, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            total += 1
+            record = parse(line)
+            if matches(record, args):
+                recent.append((line, record))
 
+    print(f"Total log lines: {total}")
+    print("\n" + "="*80)
+    print(f"RECENT LOGS (last {len(recent)} matching records):")
+    print("="*80 + "\n")
+    for line, record in recent:
+        print(line.rstrip() if args.json else render(line, record))
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Script to read request traces (logs/traces.jsonl)
+
+Without arguments prints where the time of traced requests goes: per span
+name count, p50, p95 and max duration. --slowest lists the slowest
+requests, --trace-id prints one request as a tree of spans.
+
+    python read_traces.py --root "POST /api/chats/{chat_id}/query"
+    python read_traces.py --slowest 10
+    python read_traces.py --trace-id 89285eea9808762f7d9e31b915988c7d
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+trace_file = Path(__file__).parent / "logs" / "traces.jsonl"
+
+
+def load_spans(path: Path):
+    spans = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def print_breakdown(spans, roots):
+    trace_ids = {root["trace_id"] for root in roots}
+    durations = defaultdict(list)
+    for span in spans:
+        if span["trace_id"] in trace_ids:
+            durations[span["name"]].append(span["duration_ms"])
+    print(f"{len(trace_ids)} traces\n")
+    print(f"{'span':<45} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total s':>9}")
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        print(
+            f"{name[:45]:<45} {len(values):>7} {percentile(values, 0.5):>10.1f} "
+            f"{percentile(values, 0.95):>10.1f} {max(values):>10.1f} {sum(values) / 1000:>9.2f}"
+        )
+
+
+def print_tree(spans, trace_id: str):
+    trace = [span for span in spans if span["trace_id"] == trace_id]
+    if not trace:
+        print("Trace not found:", trace_id)
+        sys.exit(1)
+    children = defaultdict(list)
+    ids = {span["span_id"] for span in trace}
+    for span in trace:
+        parent = span["parent_span_id"] if span["parent_span_id"] in ids else None
+        children[parent].append(span)
+    start = min(span["start_time_unix_nano"] for span in trace)
+
+    def walk(parent, depth):
+        for span in sorted(children[parent], key=lambda s: s["start_time_unix_nano"]):
+            offset = (span["start_time_unix_nano"] - start) / 1e6
+            attributes = " ".join(f"{k}={' '.join(str(v).split())}" for k, v in span["attributes"].items())
+            status = " ERROR " + span["status"].get("message", "") if span["status"]["code"] == "ERROR" else ""
+            print(f"{offset:>9.1f} ms {span['duration_ms']:>9.1f} ms  {'  ' * depth}{span['name']}  {attributes}{status}")
+            walk(span["span_id"], depth + 1)
+
+    print(f"{'start':>12} {'duration':>12}  span")
+    walk(None, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace-id", help="print one trace as a tree")
+    parser.add_argument("--slowest", type=int, help="list the N slowest requests")
+    parser.add_argument("--root", help="only requests with this root span name")
+    parser.add_argument("--last", type=int, default=1000, help="use the last N requests")
+    args = parser.parse_args()
+
+    if not trace_file.exists():
+        print("Trace file not found:", trace_file, "(TRACING_EXPORTER=file)")
+        sys.exit(1)
+
+    spans = load_spans(trace_file)
+    if args.trace_id:
+        print_tree(spans, args.trace_id)
+        return
+
+    # Корневой спан запроса: без родителя или с родителем на стороне клиента (traceparent)
+    span_ids = {span["span_id"] for span in spans}
+    roots = [span for span in spans if span["parent_span_id"] not in span_ids]
+    if args.root:
+        roots = [span for span in roots if span["name"] == args.root]
+    roots = roots[-args.last:]
+    if args.slowest:
+        for root in sorted(roots, key=lambda s: -s["duration_ms"])[:args.slowest]:
+            print(f"{root['duration_ms']:>10.1f} ms  {root['trace_id']}  {root['name']}")
+        return
+    print_breakdown(spans, roots)
+
+
+if __name__ == "__main__":
+    main()
@@ -71,7 +71,8 @@ export const chatsApi = {
   getAll: (documentId?: number) =>
     api.get<Chat[]>('/api/chats', { params: documentId ? { document_id: documentId } : {} }),
   getById: (id: number) => api.get<Chat>(`/api/chats/${id}`),
-  getMessages: (id: number) => api.get<Message[]>(`/api/chats/${id}/messages`),
+  getMessages: (id: number) =>
+    api.get<Message[]>(`/api/chats/${id}/messages`, { params: { include_sources: true } }),
   query: (chatId: number, query: string, documentId?: number) =>
     api.post<Message>(`/api/chats/${chatId}/query`, {
       query,
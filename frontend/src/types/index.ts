@@ -13,6 +13,7 @@ export interface Chat {
   document_id: number | null
   title: string | null
   created_at: string
+  updated_at?: string | null
 }
 
 export interface Message {
@@ -0,0 +1,190 @@
+"""
+Метрики в текстовом формате Prometheus без сторонних зависимостей
+
+Счетчики и гистограммы обновляются в горячем пути (один lock и bisect на
+наблюдение, единицы микросекунд), а значения, которые уже считаются в
+других модулях (очередь планировщика, статистика кэшей, объединение
+запросов), снимаются колбэками только в момент чтения /metrics.
+
+    LLM_REQUEST_SECONDS.observe(1.7, "search", "qwen2.5:14b")
+    LLM_RETRIES.inc("ChatGPT_API")
+    print(render())
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Длительности LLM-запросов: от быстрых ответов из KV-кэша до summary больших разделов
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_metrics: List = []
+_metrics_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _register(metric):
+    # Метрика с тем же именем заменяется (повторный импорт модуля, importlib.reload)
+    with _metrics_lock:
+        _metrics[:] = [m for m in _metrics if m.name != metric.name]
+        _metrics.append(metric)
+    return metric
+
+
+class Counter:
+    """Монотонный счетчик с метками (значения меток - позиционно)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (в выводе - накопительные, как в Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            values = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(names, labels + (_format_value(float(bound)),)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), count
+
+
+class CallbackMetric:
+    """
+    Значения, снимаемые при чтении метрик: callback возвращает пары
+    (значения меток, значение). Ничего не стоит в горячем пути.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str], callback: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        _register(self)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for labels, value in self.callback() or ():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+def register_callback(name: str, documentation: str, kind: str, labelnames: Sequence[str], callback) -> CallbackMetric:
+    """Регистрирует gauge/counter, значение которого вычисляется при чтении метрик"""
+    return CallbackMetric(name, documentation, kind, labelnames, callback)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4"""
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        try:
+            samples = list(metric.samples())
+        except Exception as e:  # упавший колбэк не должен ломать весь /metrics
+            lines.append(f"# {metric.name}: {type(e).__name__}: {_escape(e)}")
+            continue
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def caller_label(caller: Optional[str]) -> str:
+    return caller or "other"
+
+
+# ---------------------------------------------------------------------------
+# Метрики LLM-запросов, поиска и индексации
+# ---------------------------------------------------------------------------
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Время запроса к модели (без ожидания в планировщике) по caller: indexing, search, answer, summary",
+    ("caller", "model")
+)
+LLM_PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Токенов промпта на запрос", ("caller",), TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = Histogram("llm_completion_tokens", "Токенов ответа на запрос", ("caller",), TOKEN_BUCKETS)
+LLM_FAILURES = Counter("llm_request_failures_total", "Запросы к модели, завершившиеся ошибкой", ("caller",))
+LLM_RETRIES = Counter("llm_retries_total", "Повторы в патченных функциях PageIndex", ("function",))
+
+TREE_SEARCH_PROMPT_TOKENS = Histogram(
+    "tree_search_prompt_tokens",
+    "Размер промпта tree search (приближенно, ~4 символа на токен)",
+    buckets=TOKEN_BUCKETS
+)
+TREE_SEARCH_TRUNCATED = Counter("tree_search_truncated_total", "Деревья, обрезанные до верхних уровней для промпта")
+INDEX_LOAD_SECONDS = Histogram("index_load_duration_seconds", "Загрузка JSON-индекса документа с диска", buckets=FAST_BUCKETS)
+
+INDEXING_SECONDS = Histogram("indexing_duration_seconds", "Полное время индексации документа", ("status",))
+INDEXING_SECONDS_PER_PAGE = Histogram(
+    "indexing_seconds_per_page",
+    "Время индексации, деленное на число страниц документа",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
@@ -0,0 +1,259 @@
+"""
+Провайдеры LLM: часть запроса к модели, зависящая от сервера
+
+pageindex_ollama делает все вокруг запроса - планировщик, пулы бэкендов,
+объединение запросов, метрики и учет - и передает сам запрос текущему
+провайдеру (pageindex_ollama.set_llm_provider). Провайдер превращает
+сообщения и параметры в один HTTP-запрос к своему серверу:
+
+    ollama    OllamaProvider            нативный API Ollama (/api/chat, /api/embed)
+    openai    OpenAICompatibleProvider  /v1/chat/completions (Ollama /v1, LM Studio, ...)
+    llamacpp  LlamaCppProvider          llama.cpp server: OpenAI API, кэш промпта и timings
+    vllm      VllmProvider              OpenAI-совместимый сервер vLLM
+
+Провайдер умеет синхронный и асинхронный запрос и эмбеддинги. Вызывать
+его нужно через pageindex_ollama (chat_completion, chat_completion_async,
+embed_async): прямой вызов минует планировщик, пулы и учет. Параметры,
+которых сервер не понимает (keep_alive, num_ctx), игнорируются.
+"""
+import asyncio
+import weakref
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+Messages = List[Dict[str, str]]
+
+
+@dataclass
+class ChatResult:
+    """Результат одного запроса к модели"""
+    content: str
+    finish_reason: Optional[str] = "stop"
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Время работы модели по данным сервера (в миллисекундах)
+    load_ms: Optional[float] = None
+    prompt_eval_ms: Optional[float] = None
+    eval_ms: Optional[float] = None
+
+
+def root_url(base_url: str) -> str:
+    """URL сервера без суффикса /v1 OpenAI-совместимого API"""
+    url = base_url.rstrip('/')
+    return url[:-3] if url.endswith('/v1') else url
+
+
+# HTTP-клиенты переиспользуются между запросами (keep-alive соединения).
+# Асинхронный клиент привязан к event loop, поэтому храним по клиенту на loop.
+_http_client = None
+_http_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(timeout=None)
+    return _http_client
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _http_async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=None)
+        _http_async_clients[loop] = client
+    return client
+
+
+class LLMProvider(ABC):
+    """
+    Базовый провайдер. Наследники реализуют chat() и embed_async() и обычно
+    chat_async(); аргументы запроса уже подготовлены вызывающей стороной,
+    поэтому своих проверок провайдер не делает.
+    """
+    name = "base"
+    health_path = "/"  # GET-запрос проверки доступности сервера
+    loads_models = False  # True - модель загружается в память запросом (preload, warm-up Ollama)
+
+    @abstractmethod
+    def chat(
+        self, messages: Messages, model: str, temperature: float = 0.0, max_tokens: Optional[int] = None,
+        timeout: float = 900, base_url: str = "", keep_alive: Optional[str] = None, num_ctx: Optional[int] = None
+    ) -> ChatResult:
+        """Один запрос к серверу"""
+
+    async def chat_async(
+        self, messages: Messages, model: str, temperature: float = 0.0, max_tokens: Optional[int] = None,
+        timeout: float = 900, base_url: str = "", keep_alive: Optional[str] = None, num_ctx: Optional[int] = None
+    ) -> ChatResult:
+        """Асинхронный запрос; по умолчанию - chat() в потоке"""
+        return await asyncio.to_thread(
+            self.chat, messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx
+        )
+
+    @abstractmethod
+    async def embed_async(
+        self, texts: List[str], model: str, base_url: str, timeout: float = 60, keep_alive: Optional[str] = None
+    ) -> List[List[float]]:
+        """Эмбеддинги текстов, по вектору на текст"""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class OllamaProvider(LLMProvider):
+    """Нативный API Ollama: keep_alive, num_ctx и время модели по данным сервера"""
+    name = "ollama"
+    health_path = "/api/tags"
+    loads_models = True
+
+    @staticmethod
+    def payload(messages, model, temperature, max_tokens, keep_alive, num_ctx) -> Dict[str, Any]:
+        """Тело запроса для POST /api/chat"""
+        options = {"temperature": temperature}
+        if num_ctx:
+            options["num_ctx"] = num_ctx
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        payload = {"model": model, "messages": messages, "stream": False, "options": options}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    @staticmethod
+    def parse(data: Dict[str, Any]) -> ChatResult:
+        """Разбор ответа /api/chat (длительности Ollama возвращает в наносекундах)"""
+        def ms(key):
+            value = data.get(key)
+            return value / 1e6 if value is not None else None
+
+        return ChatResult(
+            content=(data.get("message") or {}).get("content", ""),
+            finish_reason=data.get("done_reason") or "stop",
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            load_ms=ms("load_duration"),
+            prompt_eval_ms=ms("prompt_eval_duration"),
+            eval_ms=ms("eval_duration"),
+        )
+
+    def chat(self, messages, model, temperature=0.0, max_tokens=None, timeout=900, base_url="", keep_alive=None, num_ctx=None):
+        response = get_http_client().post(
+            f"{root_url(base_url)}/api/chat",
+            json=self.payload(messages, model, temperature, max_tokens, keep_alive, num_ctx),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    async def chat_async(self, messages, model, temperature=0.0, max_tokens=None, timeout=900, base_url="", keep_alive=None, num_ctx=None):
+        response = await get_http_async_client().post(
+            f"{root_url(base_url)}/api/chat",
+            json=self.payload(messages, model, temperature, max_tokens, keep_alive, num_ctx),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    async def embed_async(self, texts, model, base_url, timeout=60, keep_alive=None):
+        payload = {"model": model, "input": texts}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        response = await get_http_async_client().post(f"{root_url(base_url)}/api/embed", json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Любой сервер с /v1/chat/completions; токены - из usage"""
+    name = "openai"
+    health_path = "/v1/models"
+
+    def payload(self, messages, model, temperature, max_tokens) -> Dict[str, Any]:
+        payload = {"model": model, "messages": messages, "temperature": temperature, "stream": False}
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        return payload
+
+    def parse(self, data: Dict[str, Any]) -> ChatResult:
+        choice = data["choices"][0]
+        usage = data.get("usage") or {}
+        return ChatResult(
+            content=(choice.get("message") or {}).get("content") or "",
+            finish_reason=choice.get("finish_reason") or "stop",
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def chat(self, messages, model, temperature=0.0, max_tokens=None, timeout=900, base_url="", keep_alive=None, num_ctx=None):
+        response = get_http_client().post(
+            f"{root_url(base_url)}/v1/chat/completions",
+            json=self.payload(messages, model, temperature, max_tokens),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    async def chat_async(self, messages, model, temperature=0.0, max_tokens=None, timeout=900, base_url="", keep_alive=None, num_ctx=None):
+        response = await get_http_async_client().post(
+            f"{root_url(base_url)}/v1/chat/completions",
+            json=self.payload(messages, model, temperature, max_tokens),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    async def embed_async(self, texts, model, base_url, timeout=60, keep_alive=None):
+        response = await get_http_async_client().post(
+            f"{root_url(base_url)}/v1/embeddings",
+            json={"model": model, "input": texts},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+
+class LlamaCppProvider(OpenAICompatibleProvider):
+    """
+    llama.cpp server (llama-server). cache_prompt сохраняет в слоте KV-кэш
+    общего префикса промпта, как это делает Ollama; timings дают время
+    обработки промпта и генерации.
+    """
+    name = "llamacpp"
+    health_path = "/health"
+
+    def payload(self, messages, model, temperature, max_tokens):
+        payload = super().payload(messages, model, temperature, max_tokens)
+        payload["cache_prompt"] = True
+        return payload
+
+    def parse(self, data):
+        result = super().parse(data)
+        timings = data.get("timings")
+        if timings:
+            result.prompt_eval_ms = timings.get("prompt_ms")
+            result.eval_ms = timings.get("predicted_ms")
+        return result
+
+
+class VllmProvider(OpenAICompatibleProvider):
+    """OpenAI-совместимый сервер vLLM (continuous batching: запросы выгодно слать одновременно)"""
+    name = "vllm"
+    health_path = "/health"
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (OllamaProvider, OpenAICompatibleProvider, LlamaCppProvider, VllmProvider)
+}
+
+
+def create_provider(name: str) -> LLMProvider:
+    """Провайдер по имени (LLM_PROVIDER)"""
+    try:
+        return PROVIDERS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider '{name}' (allowed: {', '.join(PROVIDERS)})") from None
@@ -0,0 +1,242 @@
+"""
+Планировщик LLM-запросов с классами приоритета
+
+Индексация отправляет в Ollama длинные серии запросов, и без координации
+запрос пользователя в чате ждет за десятками промптов summary. Планировщик
+ограничивает общее число одновременных запросов и число запросов каждого
+класса, а освободившийся слот отдает ожидающему запросу с наивысшим
+приоритетом: interactive > search > indexing. Индексация не прерывается
+посреди запроса, но следующий слот при наличии чата получит чат.
+
+Работает и из потоков (синхронные вызовы PageIndex), и из разных event loop.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+SEARCH = "search"
+INDEXING = "indexing"
+
+# Меньше - важнее
+PRIORITIES = {INTERACTIVE: 0, SEARCH: 1, INDEXING: 2}
+
+# caller из llm_context -> класс приоритета (неизвестные вызовы считаем интерактивными)
+CALLER_CLASSES = {
+    "answer": INTERACTIVE,
+    "summary": INTERACTIVE,
+    "search": SEARCH,
+    "indexing": INDEXING,
+}
+
+
+def priority_class(caller: Optional[str]) -> str:
+    return CALLER_CLASSES.get(caller, INTERACTIVE)
+
+
+class _Waiter:
+    """Запрос, ожидающий слот: threading.Event для потоков или Future для asyncio"""
+
+    __slots__ = ("request_class", "event", "future", "loop", "granted", "enqueued_at")
+
+    def __init__(self, request_class: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.request_class = request_class
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class LLMScheduler:
+    """
+    Слоты для LLM-запросов с приоритетами.
+
+    max_concurrency - сколько запросов одновременно отправляется в Ollama
+    (имеет смысл ставить близко к OLLAMA_NUM_PARALLEL x число хостов: лишние
+    запросы все равно ждут в очереди Ollama, где приоритетов нет).
+    class_limits - максимум одновременных запросов каждого класса; лимит
+    индексации меньше общего оставляет слоты чату даже посреди индексации.
+    """
+
+    def __init__(self, max_concurrency: int, class_limits: Optional[Dict[str, int]] = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency должен быть >= 1")
+        self.max_concurrency = max_concurrency
+        self.class_limits = {name: max_concurrency for name in PRIORITIES}
+        for name, limit in (class_limits or {}).items():
+            if limit and limit > 0:
+                self.class_limits[name] = min(limit, max_concurrency)
+        self.active = {name: 0 for name in PRIORITIES}
+        self.total_active = 0
+        self._queue: List = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {name: {"requests": 0, "queued": 0, "wait_seconds": 0.0} for name in PRIORITIES}
+
+    def _can_start(self, request_class: str) -> bool:
+        return (
+            self.total_active < self.max_concurrency
+            and self.active[request_class] < self.class_limits[request_class]
+        )
+
+    def _start(self, waiter: _Waiter):
+        waiter.granted = True
+        self.active[waiter.request_class] += 1
+        self.total_active += 1
+        stats = self.stats[waiter.request_class]
+        stats["requests"] += 1
+        stats["wait_seconds"] += time.monotonic() - waiter.enqueued_at
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Ставит запрос в очередь; True, если слот выдан сразу"""
+        with self._lock:
+            heapq.heappush(self._queue, (PRIORITIES[waiter.request_class], next(self._seq), waiter))
+            self._dispatch()
+            if not waiter.granted:
+                self.stats[waiter.request_class]["queued"] += 1
+            return waiter.granted
+
+    def _dispatch(self):
+        """Раздает свободные слоты ожидающим в порядке приоритета (под self._lock)"""
+        if not self._queue or self.total_active >= self.max_concurrency:
+            return
+        skipped = []
+        while self._queue and self.total_active < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if self._can_start(waiter.request_class):
+                self._start(waiter)
+                waiter.wake()
+            else:
+                # Класс уперся в свой лимит - слот может взять менее приоритетный класс
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        """Убирает ожидающий запрос из очереди; False, если слот уже выдан"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+            heapq.heapify(self._queue)
+            return True
+
+    def acquire(self, request_class: str = INTERACTIVE):
+        """Блокирующее ожидание слота (для потоков)"""
+        waiter = _Waiter(request_class)
+        if not self._enqueue(waiter):
+            waiter.event.wait()
+
+    async def acquire_async(self, request_class: str = INTERACTIVE):
+        """Ожидание слота без блокировки event loop"""
+        waiter = _Waiter(request_class, asyncio.get_running_loop())
+        if self._enqueue(waiter):
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not self._remove(waiter):
+                # Слот выдали одновременно с отменой - возвращаем его
+                self.release(request_class)
+            raise
+
+    def release(self, request_class: str = INTERACTIVE):
+        with self._lock:
+            self.active[request_class] = max(0, self.active[request_class] - 1)
+            self.total_active = max(0, self.total_active - 1)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, request_class: str = INTERACTIVE):
+        self.acquire(request_class)
+        try:
+            yield
+        finally:
+            self.release(request_class)
+
+    @asynccontextmanager
+    async def slot_async(self, request_class: str = INTERACTIVE):
+        await self.acquire_async(request_class)
+        try:
+            yield
+        finally:
+            self.release(request_class)
+
+    def status(self) -> Dict:
+        with self._lock:
+            waiting = {name: 0 for name in PRIORITIES}
+            for _, _, waiter in self._queue:
+                waiting[waiter.request_class] += 1
+            return {
+                "max_concurrency": self.max_concurrency,
+                "class_limits": dict(self.class_limits),
+                "active": dict(self.active),
+                "waiting": waiting,
+                "stats": {name: dict(stats) for name, stats in self.stats.items()},
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def configure_scheduler(max_concurrency: int, class_limits: Optional[Dict[str, int]] = None):
+    """Включает планировщик (max_concurrency <= 0 - выключает)"""
+    global _scheduler
+    if max_concurrency <= 0:
+        _scheduler = None
+        logger.info("Планировщик LLM-запросов выключен")
+        return
+    _scheduler = LLMScheduler(max_concurrency, class_limits)
+    logger.info(f"Планировщик LLM-запросов: всего {max_concurrency}, лимиты классов {_scheduler.class_limits}")
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    return _scheduler
+
+
+def scheduler_status() -> Optional[Dict]:
+    return _scheduler.status() if _scheduler else None
+
+
+def _class_samples(key: str):
+    status = scheduler_status()
+    if status is None:
+        return []
+    if key == "wait_seconds":
+        return [((name,), stats["wait_seconds"]) for name, stats in status["stats"].items()]
+    return [((name,), value) for name, value in status[key].items()]
+
+
+llm_metrics.register_callback(
+    "llm_scheduler_queue_depth", "Запросы, ожидающие слот в планировщике", "gauge",
+    ("request_class",), lambda: _class_samples("waiting")
+)
+llm_metrics.register_callback(
+    "llm_scheduler_active", "Запросы, занимающие слот сейчас", "gauge",
+    ("request_class",), lambda: _class_samples("active")
+)
+llm_metrics.register_callback(
+    "llm_scheduler_wait_seconds_total", "Суммарное ожидание слота", "counter",
+    ("request_class",), lambda: _class_samples("wait_seconds")
+)
@@ -0,0 +1,297 @@
+"""
+Легковесная трассировка запросов: спаны в модели OpenTelemetry
+
+Спан - именованный интервал с trace_id/span_id/parent_span_id, атрибутами и
+статусом, как в OpenTelemetry; текущий спан хранится в contextvar и
+наследуется asyncio-задачами и asyncio.to_thread. Готовые спаны пишутся
+фоновым потоком пачками в JSON Lines (поля как в OTLP/JSON:
+start_time_unix_nano, end_time_unix_nano, attributes, status) или в консоль.
+
+    with span("chat.process_query", chat_id=1) as s:
+        ...
+        s.set_attribute("cache_hit", True)
+
+Входящий заголовок W3C traceparent продолжает трассу вызывающей стороны.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FILE_EXPORTER = "file"
+CONSOLE_EXPORTER = "console"
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Один интервал трассы (атрибуты - плоский словарь скалярных значений)"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "sampled", "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], sampled: bool, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "UNSET"
+        self.status_message: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_exception(self, error: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        status = {"code": self.status}
+        if self.status_message:
+            status["message"] = self.status_message
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": status,
+            "service.name": _config["service_name"],
+        }
+
+
+class _BatchExporter:
+    """Копит завершенные спаны и пишет их пачками из фонового потока"""
+
+    def __init__(self, kind: str, path: Optional[Path], max_bytes: int, backup_count: int = 5, flush_interval: float = 1.0):
+        self.kind = kind
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self._pending: List[Span] = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        with self._condition:
+            self._pending.append(span)
+            if len(self._pending) >= 512:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._pending and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+                stopped = self._stopped
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.warning(f"Не удалось записать {len(batch)} спанов: {e}")
+            if stopped:
+                return
+
+    def _write(self, batch: List[Span]):
+        lines = "".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in batch)
+        if self.kind == CONSOLE_EXPORTER:
+            sys.stderr.write(lines)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.max_bytes and self.path.exists() and self.path.stat().st_size > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _rotate(self):
+        """Как RotatingFileHandler: traces.jsonl -> .1 -> ... -> .backup_count (самая старая удаляется)"""
+        if self.backup_count <= 0:
+            self.path.unlink(missing_ok=True)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+
+    def shutdown(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout=5)
+
+
+_config = {"service_name": "pageindex-chat", "sample_rate": 1.0}
+_exporter: Optional[_BatchExporter] = None
+
+
+def configure_tracing(
+    exporter: Optional[str] = FILE_EXPORTER,
+    path: Optional[str] = None,
+    sample_rate: float = 1.0,
+    service_name: str = "pageindex-chat",
+    max_bytes: int = 0,
+    backup_count: int = 5
+):
+    """Включает трассировку (exporter: file, console; None - выключает)"""
+    global _exporter
+    shutdown_tracing()
+    _config.update(service_name=service_name, sample_rate=sample_rate)
+    if exporter not in (FILE_EXPORTER, CONSOLE_EXPORTER):
+        return
+    if exporter == FILE_EXPORTER and not path:
+        raise ValueError("Для файлового экспорта нужен path")
+    _exporter = _BatchExporter(exporter, Path(path) if path else None, max_bytes, backup_count)
+    logger.info(f"Трассировка: {exporter}{' ' + str(path) if path else ''}, sample_rate={sample_rate}")
+
+
+def shutdown_tracing():
+    """Записывает накопленные спаны и останавливает экспорт"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+atexit.register(shutdown_tracing)
+
+
+def is_enabled() -> bool:
+    return _exporter is not None
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent_span_id, sampled) из заголовка W3C traceparent или None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+def _new_span(name: str, traceparent: Optional[str], new_trace: bool, attributes: Dict[str, Any]) -> Span:
+    parent = None if new_trace else _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        return Span(name, remote[0], remote[1], remote[2], attributes)
+    sampled = _config["sample_rate"] >= 1 or random.random() < _config["sample_rate"]
+    return Span(name, f"{random.getrandbits(128):032x}", None, sampled, attributes)
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """
+    Дочерний спан текущего, не становящийся текущим - для интервалов, у которых
+    начало и конец в разных колбэках (события SQLAlchemy). Закрывается end_span().
+    """
+    if _exporter is None or _current_span.get() is None:
+        return None
+    return _new_span(name, None, False, attributes)
+
+
+def end_span(current: Optional[Span], error: Optional[BaseException] = None):
+    if current is None:
+        return
+    if error is not None:
+        current.record_exception(error)
+    current.end_ns = time.time_ns()
+    exporter = _exporter
+    if current.sampled and exporter is not None:
+        exporter.export(current)
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, new_trace: bool = False, **attributes):
+    """
+    Спан вокруг блока; без активной трассировки отдает None.
+    traceparent - продолжить трассу из входящего заголовка,
+    new_trace - начать новую трассу даже внутри текущей (фоновые задачи).
+    """
+    if _exporter is None:
+        yield None
+        return
+    current = _new_span(name, traceparent, new_trace, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(current)
+
+
+def traced(name: str):
+    """Декоратор: спан вокруг каждого вызова функции (sync или async)"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes):
+    """Атрибуты текущего спана (ничего не делает без трассировки)"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
@@ -0,0 +1,257 @@
+"""
+Пул бэкендов Ollama: учет здоровья, маршрутизация по наименьшему числу
+активных запросов и "липкая" маршрутизация по документу
+"""
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_POOL = "interactive"
+INDEXING_POOL = "indexing"
+
+
+def is_backend_error(error: BaseException) -> bool:
+    """Говорит ли ошибка о проблеме хоста: таймаут, сетевая ошибка или 5xx"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return False
+
+
+class OllamaBackend:
+    """Один хост Ollama и его текущее состояние"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.unhealthy_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """
+    Пул бэкендов Ollama.
+
+    Запрос без ключа уходит на здоровый бэкенд с наименьшим числом активных
+    запросов. Запрос с ключом (например, id документа) уходит на бэкенд,
+    выбранный rendezvous-хешированием ключа, чтобы повторные запросы по
+    одному документу попадали туда, где уже прогрет KV-кэш его промпта.
+    Если "свой" бэкенд перегружен (на sticky_max_extra запросов больше, чем
+    наименее загруженный), запрос уходит на наименее загруженный.
+
+    Бэкенд помечается нездоровым после failure_threshold ошибок подряд (или
+    сразу при ошибке соединения) и снова получает запросы через retry_after
+    секунд либо после успешной активной проверки (set_health). Ошибками
+    бэкенда считаются только таймауты, сетевые ошибки и ответы 5xx: ответ 4xx
+    (нет модели, слишком длинный промпт) - ошибка запроса, а не хоста.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_urls: List[str],
+        failure_threshold: int = 3,
+        retry_after: float = 30.0,
+        sticky_max_extra: int = 4
+    ):
+        if not base_urls:
+            raise ValueError(f"Пул Ollama '{name}' не содержит ни одного бэкенда")
+        self.name = name
+        self.backends = [OllamaBackend(url) for url in dict.fromkeys(base_urls)]
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.sticky_max_extra = sticky_max_extra
+        self._lock = threading.Lock()
+
+    def _usable(self, backend: OllamaBackend, now: float) -> bool:
+        """Здоров или истек retry_after после пометки нездоровым"""
+        return backend.healthy or (
+            backend.unhealthy_since is not None and now - backend.unhealthy_since >= self.retry_after
+        )
+
+    def _available(self) -> List[OllamaBackend]:
+        now = time.monotonic()
+        available = [b for b in self.backends if self._usable(b, now)]
+        # Если все бэкенды нездоровы, пробуем все - лучше, чем отказать сразу
+        return available or self.backends
+
+    def is_available(self) -> bool:
+        """Есть ли бэкенд, на который acquire() отправит запрос не наугад"""
+        with self._lock:
+            now = time.monotonic()
+            return any(self._usable(b, now) for b in self.backends)
+
+    @staticmethod
+    def _score(key: str, backend: OllamaBackend) -> bytes:
+        return hashlib.blake2b(f"{key}|{backend.base_url}".encode("utf-8"), digest_size=8).digest()
+
+    def acquire(self, sticky_key: Optional[str] = None) -> OllamaBackend:
+        """Выбирает бэкенд и учитывает запрос как активный"""
+        with self._lock:
+            available = self._available()
+            least_loaded = min(available, key=lambda b: b.outstanding)
+            backend = least_loaded
+            if sticky_key is not None and len(available) > 1:
+                preferred = max(available, key=lambda b: self._score(str(sticky_key), b))
+                if preferred.outstanding - least_loaded.outstanding <= self.sticky_max_extra:
+                    backend = preferred
+            backend.outstanding += 1
+            backend.total_requests += 1
+            return backend
+
+    def release(self, backend: OllamaBackend, error: Optional[BaseException] = None, track_health: bool = True):
+        """Завершает запрос и обновляет состояние бэкенда (track_health=False - только счетчик активных)"""
+        with self._lock:
+            backend.outstanding = max(0, backend.outstanding - 1)
+            if not track_health:
+                return
+            if error is None:
+                self._mark_healthy(backend)
+                return
+
+            backend.total_failures += 1
+            backend.last_error = str(error)
+            if not is_backend_error(error):
+                return
+            backend.consecutive_failures += 1
+            connection_error = isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+            if backend.healthy and (connection_error or backend.consecutive_failures >= self.failure_threshold):
+                backend.healthy = False
+                backend.unhealthy_since = time.monotonic()
+                logger.warning(f"Бэкенд Ollama {backend.base_url} (пул '{self.name}') помечен нездоровым: {error}")
+            elif not backend.healthy:
+                backend.unhealthy_since = time.monotonic()
+
+    def _mark_healthy(self, backend: OllamaBackend):
+        if not backend.healthy:
+            logger.info(f"Бэкенд Ollama {backend.base_url} (пул '{self.name}') снова доступен")
+        backend.healthy = True
+        backend.consecutive_failures = 0
+        backend.unhealthy_since = None
+
+    @contextmanager
+    def lease(self, sticky_key: Optional[str] = None, track_health: bool = True):
+        """
+        with pool.lease(key) as backend: ... - выбор бэкенда на время запроса.
+
+        track_health=False - исход запроса не влияет на здоровье бэкенда
+        (вспомогательные запросы, например эмбеддинги другой моделью).
+        """
+        backend = self.acquire(sticky_key)
+        try:
+            yield backend
+        except Exception as e:
+            self.release(backend, e, track_health)
+            raise
+        except BaseException:
+            # Отмена запроса (CancelledError, KeyboardInterrupt) - не ошибка бэкенда
+            self.release(backend, track_health=track_health)
+            raise
+        else:
+            self.release(backend, track_health=track_health)
+
+    def set_health(self, base_url: str, healthy: bool, error: Optional[str] = None):
+        """Результат активной проверки здоровья бэкенда"""
+        with self._lock:
+            for backend in self.backends:
+                if backend.base_url != base_url.rstrip('/'):
+                    continue
+                if healthy:
+                    self._mark_healthy(backend)
+                elif backend.healthy:
+                    backend.healthy = False
+                    backend.unhealthy_since = time.monotonic()
+                    backend.last_error = error
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            return [b.to_dict() for b in self.backends]
+
+
+# Пулы по назначению: интерактивный чат и фоновая индексация
+_pools: Dict[str, OllamaPool] = {}
+
+
+def configure_pools(
+    interactive_urls: List[str],
+    indexing_urls: Optional[List[str]] = None,
+    **pool_options
+):
+    """Создает пулы для чата и индексации (индексация по умолчанию использует те же хосты)"""
+    _pools[INTERACTIVE_POOL] = OllamaPool(INTERACTIVE_POOL, interactive_urls, **pool_options)
+    _pools[INDEXING_POOL] = OllamaPool(INDEXING_POOL, indexing_urls or interactive_urls, **pool_options)
+    logger.info(
+        f"Пулы Ollama: {INTERACTIVE_POOL}={[b.base_url for b in _pools[INTERACTIVE_POOL].backends]}, "
+        f"{INDEXING_POOL}={[b.base_url for b in _pools[INDEXING_POOL].backends]}"
+    )
+
+
+def get_pool(name: str = INTERACTIVE_POOL) -> Optional[OllamaPool]:
+    """Пул по имени (None, если пулы не настроены)"""
+    return _pools.get(name)
+
+
+def get_all_backend_urls() -> List[str]:
+    """Уникальные URL всех бэкендов из всех пулов"""
+    urls = []
+    for pool in _pools.values():
+        urls.extend(b.base_url for b in pool.backends)
+    return list(dict.fromkeys(urls))
+
+
+def set_backend_health(base_url: str, healthy: bool, error: Optional[str] = None):
+    """Результат активной проверки бэкенда - применяется ко всем пулам"""
+    for pool in _pools.values():
+        pool.set_health(base_url, healthy, error)
+
+
+def is_pool_available(name: str = INTERACTIVE_POOL) -> bool:
+    """Есть ли в пуле здоровый бэкенд или бэкенд, которому пора дать еще попытку (без сетевых запросов)"""
+    pool = _pools.get(name)
+    return pool is None or pool.is_available()
+
+
+def pools_status() -> Dict[str, List[Dict]]:
+    return {name: pool.status() for name, pool in _pools.items()}
+
+
+def _backend_samples(attr: str):
+    return [
+        ((name, backend.base_url), float(getattr(backend, attr)))
+        for name, pool in _pools.items()
+        for backend in pool.backends
+    ]
+
+
+llm_metrics.register_callback(
+    "ollama_backend_outstanding", "Активные запросы на бэкенде", "gauge",
+    ("pool", "backend"), lambda: _backend_samples("outstanding")
+)
+llm_metrics.register_callback(
+    "ollama_backend_healthy", "1 - бэкенд получает запросы, 0 - исключен из пула", "gauge",
+    ("pool", "backend"), lambda: _backend_samples("healthy")
+)
@@ -1,498 +1,786 @@
 """
-Патчинг PageIndex для работы с Ollama вместо OpenAI
+Запросы PageIndex и приложения к локальной модели (Ollama, llama.cpp, vLLM)
+вместо OpenAI: планировщик, пулы бэкендов, объединение запросов, метрики и
+учет вокруг запроса; сам запрос выполняет провайдер (llm_provider.py)
 """
 import os
 import sys
-import openai
+import json
+import hashlib
+import importlib
+import concurrent.futures
 import asyncio
 import logging
-from typing import Optional
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional
 import httpx
+from ollama_pool import get_pool, INDEXING_POOL, INTERACTIVE_POOL
+from llm_scheduler import get_scheduler, priority_class
+import llm_metrics
+import llm_tracing
+import pageindex_profiler
+from llm_provider import (
+    ChatResult, LLMProvider, OpenAICompatibleProvider, create_provider, root_url,
+    get_http_client as _get_http_client, get_http_async_client as _get_http_async_client
+)
 
 logger = logging.getLogger(__name__)
 
 # Настройки Ollama по умолчанию
 DEFAULT_OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
 DEFAULT_OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+DEFAULT_FAST_TOKEN_COUNT = os.getenv("PAGEINDEX_FAST_TOKEN_COUNT", "").lower() in ("1", "true", "yes")
+DEFAULT_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Сколько держать модель в памяти после запроса
+DEFAULT_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))  # 0 = размер контекста по умолчанию модели
+DEFAULT_USE_NATIVE_API = os.getenv("OLLAMA_USE_NATIVE_API", "true").lower() in ("1", "true", "yes")
+DEFAULT_LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")
+DEFAULT_COALESCE_REQUESTS = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
 
 # Глобальные переменные для хранения настроек
 _ollama_base_url = DEFAULT_OLLAMA_BASE_URL
 _ollama_model = DEFAULT_OLLAMA_MODEL
-_patched = False
-_ollama_client = None
-_ollama_async_client = None
+_fast_token_count = DEFAULT_FAST_TOKEN_COUNT
+_keep_alive = DEFAULT_KEEP_ALIVE
+_num_ctx = DEFAULT_NUM_CTX
+_coalesce_requests = DEFAULT_COALESCE_REQUESTS
+_call_recorder = None  # см. set_call_recorder
+_pageindex_bound = False  # см. bind_pageindex
+
+
+# ---------------------------------------------------------------------------
+# Подсчет токенов
+# ---------------------------------------------------------------------------
+
+# Кодировка tiktoken по префиксу имени модели. Модели Ollama (llama, qwen,
+# mistral, ...) tiktoken не знает, для них используется DEFAULT_ENCODING -
+# это приближение, но достаточное для бюджетов PageIndex.
+MODEL_ENCODINGS = {
+    "gpt-4o": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "gpt-5": "o200k_base",
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o4": "o200k_base",
+    "gpt-4": "cl100k_base",
+    "gpt-3.5": "cl100k_base",
+    "text-embedding-3": "cl100k_base",
+}
+DEFAULT_ENCODING = "cl100k_base"
+
+# Кэш энкодеров: имя кодировки -> Encoding или None, если кодировка
+# недоступна (например, нет сети для загрузки BPE-файла). Неудача тоже
+# кэшируется, чтобы не повторять загрузку на каждом вызове.
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+@lru_cache(maxsize=256)
+def resolve_encoding_name(model: Optional[str] = None) -> str:
+    """Имя кодировки tiktoken для модели (самый длинный совпавший префикс)"""
+    if not model:
+        return DEFAULT_ENCODING
+    name = model.lower()
+    for prefix in sorted(MODEL_ENCODINGS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_ENCODINGS[prefix]
+    return DEFAULT_ENCODING
+
+
+def get_encoder(model: Optional[str] = None):
+    """Кэшированный энкодер tiktoken для модели (None, если недоступен)"""
+    encoding_name = resolve_encoding_name(model)
+    try:
+        return _encoders[encoding_name]
+    except KeyError:
+        pass
+
+    with _encoders_lock:
+        if encoding_name not in _encoders:
+            try:
+                import tiktoken
+                _encoders[encoding_name] = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"Кодировка tiktoken '{encoding_name}' недоступна, используем приближенный подсчет: {e}")
+                _encoders[encoding_name] = None
+        return _encoders[encoding_name]
+
+
+def approx_count_tokens(text: Optional[str]) -> int:
+    """Быстрая оценка количества токенов (~4 символа = 1 токен) для проверок бюджета"""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def count_tokens(text: Optional[str], model: Optional[str] = None) -> int:
+    """Подсчет токенов с кэшированным энкодером"""
+    if not text:
+        return 0
+    if _fast_token_count:
+        return approx_count_tokens(text)
+    enc = get_encoder(model)
+    if enc is None:
+        return approx_count_tokens(text)
+    return len(enc.encode_ordinary(text))
+
+
+def encode_batch(texts: Iterable[str], model: Optional[str] = None, num_threads: int = 8) -> List[List[int]]:
+    """Кодирует набор текстов (например, всех страниц PDF) за один вызов"""
+    texts = [text or "" for text in texts]
+    enc = get_encoder(model)
+    if enc is None:
+        raise RuntimeError(f"Кодировка '{resolve_encoding_name(model)}' недоступна")
+    return enc.encode_ordinary_batch(texts, num_threads=num_threads)
+
+
+def count_tokens_batch(texts: Iterable[str], model: Optional[str] = None, num_threads: int = 8) -> List[int]:
+    """Количество токенов для каждого текста из набора"""
+    texts = list(texts)
+    if _fast_token_count or get_encoder(model) is None:
+        return [approx_count_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encode_batch(texts, model, num_threads=num_threads)]
+
+
+# ---------------------------------------------------------------------------
+# Запросы к Ollama
+# ---------------------------------------------------------------------------
+
+# Атрибуты текущих LLM-запросов: caller ("indexing", "search", "answer", ...),
+# document_id, sticky_key и т.д. Задаются через llm_context() и наследуются asyncio-задачами.
+_llm_context: contextvars.ContextVar = contextvars.ContextVar("llm_context", default={})
+
+
+@contextmanager
+def llm_context(**fields):
+    """with llm_context(caller="indexing", document_id=1): ... - атрибуты LLM-запросов в блоке"""
+    token = _llm_context.set({**_llm_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _llm_context.reset(token)
+
+
+def get_llm_context() -> Dict[str, Any]:
+    return _llm_context.get()
+
+
+def make_provider(name: str = DEFAULT_LLM_PROVIDER, use_native_api: bool = DEFAULT_USE_NATIVE_API) -> LLMProvider:
+    """Провайдер по имени (LLM_PROVIDER); OLLAMA_USE_NATIVE_API=false переводит Ollama на /v1"""
+    if name.lower() == "ollama" and not use_native_api:
+        return OpenAICompatibleProvider()
+    return create_provider(name)
+
+
+_provider: LLMProvider = make_provider()
+
+
+def set_llm_provider(provider: LLMProvider):
+    """
+    Провайдер всех LLM-запросов. Функции, подключенные к PageIndex
+    (bind_pageindex), берут его при каждом вызове, поэтому замена не требует
+    повторной привязки.
+    """
+    global _provider
+    _provider = provider
+    logger.info(f"LLM-провайдер: {provider.name}")
+
+
+def get_llm_provider() -> LLMProvider:
+    return _provider
+
+
+def set_ollama_options(
+    keep_alive: Optional[str] = None,
+    num_ctx: Optional[int] = None,
+    coalesce_requests: Optional[bool] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    fast_token_count: Optional[bool] = None
+):
+    """Сервер и модель по умолчанию и настройки, передаваемые Ollama с каждым запросом"""
+    global _keep_alive, _num_ctx, _coalesce_requests, _ollama_base_url, _ollama_model, _fast_token_count
+    if keep_alive is not None:
+        _keep_alive = keep_alive
+    if num_ctx is not None:
+        _num_ctx = num_ctx
+    if coalesce_requests is not None:
+        _coalesce_requests = coalesce_requests
+    if base_url:
+        _ollama_base_url = base_url
+    if model:
+        _ollama_model = model
+    if fast_token_count is not None:
+        _fast_token_count = fast_token_count
+
+
+def native_base_url(base_url: Optional[str] = None) -> str:
+    """URL сервера без суффикса /v1 OpenAI-совместимого API"""
+    return root_url(base_url or _ollama_base_url)
+
+
+def _select_pool():
+    """Пул бэкендов для текущего контекста: индексация или интерактивные запросы"""
+    caller = get_llm_context().get("caller")
+    return get_pool(INDEXING_POOL if caller == "indexing" else INTERACTIVE_POOL)
+
+
+def _sticky_key() -> Optional[str]:
+    """Ключ привязки к бэкенду: явный sticky_key или документ"""
+    context = get_llm_context()
+    key = context.get("sticky_key", context.get("document_id"))
+    return None if key is None else str(key)
+
+
+# ---------------------------------------------------------------------------
+# Объединение одинаковых одновременных запросов (single-flight)
+# ---------------------------------------------------------------------------
+
+# Ключ запроса -> concurrent.futures.Future первого ("ведущего") запроса.
+# concurrent.futures.Future, а не asyncio.Future: ждать результат могут
+# и потоки индексации, и корутины из разных event loop.
+_in_flight: Dict[str, concurrent.futures.Future] = {}
+_in_flight_lock = threading.Lock()
+coalesce_stats = {"upstream": 0, "coalesced": 0}
+llm_metrics.register_callback(
+    "llm_coalesced_requests_total",
+    "Запросы по результату объединения: upstream - ушли в Ollama, coalesced - дождались чужого",
+    "counter",
+    ("result",),
+    lambda: [((name,), value) for name, value in coalesce_stats.items()]
+)
+
+
+class _FlightAborted(Exception):
+    """Ведущий запрос отменен - ожидающие повторяют запрос сами"""
+
+
+def _request_key(messages, model, temperature, max_tokens, base_url, keep_alive, num_ctx) -> str:
+    payload = json.dumps(
+        [model, messages, temperature, max_tokens, base_url, keep_alive, num_ctx],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _join_flight(key: str):
+    """(future, is_leader): future уже идущего запроса или новый, если ведущий - мы"""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            coalesce_stats["coalesced"] += 1
+            return future, False
+        future = concurrent.futures.Future()
+        _in_flight[key] = future
+        coalesce_stats["upstream"] += 1
+        return future, True
+
+
+def _finish_flight(key: str, future: concurrent.futures.Future, result=None, error: Optional[BaseException] = None):
+    with _in_flight_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+
+
+def chat_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    temperature: float = 0.0,
+    max_tokens: Optional[int] = None,
+    timeout: float = 900,
+    base_url: Optional[str] = None,
+    keep_alive: Optional[str] = None,
+    num_ctx: Optional[int] = None
+) -> ChatResult:
+    """
+    Синхронный запрос к модели (нативный API Ollama или OpenAI-совместимый).
+    Одинаковые (модель, сообщения, опции) одновременные запросы разделяют
+    один запрос к Ollama. Запрос ждет слот в планировщике (см. llm_scheduler)
+    по приоритету caller из llm_context. Без base_url бэкенд выбирается из
+    пула (см. ollama_pool) с привязкой к sticky_key или документу из llm_context.
+    """
+    model = model or _ollama_model
+    with llm_tracing.span("llm.chat", caller=get_llm_context().get("caller"), model=model):
+        args = (messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+        if not _coalesce_requests:
+            return _schedule_chat(*args)
+
+        key = _request_key(messages, model, temperature, max_tokens, base_url, keep_alive, num_ctx)
+        while True:
+            future, is_leader = _join_flight(key)
+            if not is_leader:
+                llm_tracing.set_attributes(coalesced=True)
+                waited_from = time.perf_counter()
+                try:
+                    result = future.result()
+                except _FlightAborted:
+                    continue
+                _account_call(model, None, waited_from, result, cache_hit=True)
+                return result
+            try:
+                result = _schedule_chat(*args)
+            except Exception as e:
+                _finish_flight(key, future, error=e)
+                raise
+            except BaseException:
+                _finish_flight(key, future, error=_FlightAborted())
+                raise
+            _finish_flight(key, future, result)
+            return result
+
+
+async def chat_completion_async(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    temperature: float = 0.0,
+    max_tokens: Optional[int] = None,
+    timeout: float = 900,
+    base_url: Optional[str] = None,
+    keep_alive: Optional[str] = None,
+    num_ctx: Optional[int] = None
+) -> ChatResult:
+    """Асинхронный вариант chat_completion"""
+    model = model or _ollama_model
+    with llm_tracing.span("llm.chat", caller=get_llm_context().get("caller"), model=model):
+        args = (messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+        if not _coalesce_requests:
+            return await _schedule_chat_async(*args)
+
+        key = _request_key(messages, model, temperature, max_tokens, base_url, keep_alive, num_ctx)
+        while True:
+            future, is_leader = _join_flight(key)
+            if not is_leader:
+                llm_tracing.set_attributes(coalesced=True)
+                waited_from = time.perf_counter()
+                try:
+                    # shield: отмена одного ожидающего не должна отменять общий future
+                    result = await asyncio.shield(asyncio.wrap_future(future))
+                except _FlightAborted:
+                    continue
+                _account_call(model, None, waited_from, result, cache_hit=True)
+                return result
+            try:
+                result = await _schedule_chat_async(*args)
+            except Exception as e:
+                _finish_flight(key, future, error=e)
+                raise
+            except BaseException:
+                # Ведущий отменен (клиент закрыл соединение) - остальные повторят запрос
+                _finish_flight(key, future, error=_FlightAborted())
+                raise
+            _finish_flight(key, future, result)
+            return result
+
+
+def _schedule_chat(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx) -> ChatResult:
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return _route_chat(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+    queued_at = time.perf_counter()
+    with scheduler.slot(priority_class(get_llm_context().get("caller"))):
+        llm_tracing.set_attributes(queue_wait_ms=round((time.perf_counter() - queued_at) * 1000, 3))
+        return _route_chat(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+
+
+def _record_call(model: str, base_url: Optional[str], start: float, result: ChatResult):
+    """
+    Метрики и одна структурная запись лога на запрос к Ollama
+    (caller и document_id добавляет логгер из llm_context)
+    """
+    seconds = time.perf_counter() - start
+    caller = llm_metrics.caller_label(get_llm_context().get("caller"))
+    llm_metrics.LLM_REQUEST_SECONDS.observe(seconds, caller, model)
+    pageindex_profiler.record_llm_call(seconds, result.prompt_tokens, result.completion_tokens)
+    if result.prompt_tokens is not None:
+        llm_metrics.LLM_PROMPT_TOKENS.observe(result.prompt_tokens, caller)
+    if result.completion_tokens is not None:
+        llm_metrics.LLM_COMPLETION_TOKENS.observe(result.completion_tokens, caller)
+    _account_call(model, base_url, start, result)
+    latency_ms = round(seconds * 1000, 1)
+    llm_tracing.set_attributes(
+        backend=base_url or _ollama_base_url,
+        latency_ms=latency_ms,
+        prompt_tokens=result.prompt_tokens,
+        completion_tokens=result.completion_tokens,
+        finish_reason=result.finish_reason
+    )
+    logger.info(
+        f"LLM {model}: {latency_ms:.0f} ms, tokens {result.prompt_tokens}/{result.completion_tokens}",
+        extra={
+            "model": model,
+            "backend": base_url or _ollama_base_url,
+            "latency_ms": latency_ms,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "finish_reason": result.finish_reason
+        }
+    )
+
+
+def set_call_recorder(recorder: Optional[Callable[[Dict[str, Any]], None]]):
+    """
+    Получатель записи о каждом LLM-запросе (учет в БД, см. app/services/llm_accounting.py).
+    Вызывается в потоке запроса, поэтому должен только ставить запись в очередь.
+    """
+    global _call_recorder
+    _call_recorder = recorder
+
+
+def _document_id(value) -> Optional[int]:
+    # При индексации без id документа в llm_context лежит путь к PDF
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def _account_call(model: str, base_url: Optional[str], start: float, result: Optional[ChatResult], cache_hit: bool = False):
+    """Запись для учета LLM-запросов: result=None - запрос завершился ошибкой"""
+    recorder = _call_recorder
+    if recorder is None:
+        return
+    context = get_llm_context()
+    record = {
+        "caller": llm_metrics.caller_label(context.get("caller")),
+        "document_id": _document_id(context.get("document_id")),
+        "model": model,
+        "backend": base_url or _ollama_base_url,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "retries": context.get("retries", 0),
+        "cache_hit": cache_hit,
+        "finish_reason": "error",
+    }
+    # Объединенный запрос не нагружал модель: токены и время GPU учтены у ведущего
+    if result is not None and not cache_hit:
+        record.update(
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens,
+            prompt_eval_ms=result.prompt_eval_ms,
+            eval_ms=result.eval_ms,
+        )
+    if result is not None:
+        record["finish_reason"] = result.finish_reason
+    try:
+        recorder(record)
+    except Exception as e:
+        logger.debug(f"Учет LLM-запроса не записан: {e}")
+
+
+def _request_options(keep_alive, num_ctx):
+    """keep_alive и num_ctx запроса с подстановкой значений по умолчанию"""
+    return (_keep_alive if keep_alive is None else keep_alive, _num_ctx if num_ctx is None else num_ctx)
+
+
+def _route_chat(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx) -> ChatResult:
+    args = (messages, model, temperature, max_tokens, timeout)
+    options = _request_options(keep_alive, num_ctx)
+    pool = None if base_url else _select_pool()
+    start = time.perf_counter()
+    try:
+        if pool is None:
+            base_url = base_url or _ollama_base_url
+            result = _provider.chat(*args, base_url, *options)
+        else:
+            with pool.lease(_sticky_key()) as backend:
+                base_url = backend.base_url
+                result = _provider.chat(*args, base_url, *options)
+    except Exception:
+        llm_metrics.LLM_FAILURES.inc(llm_metrics.caller_label(get_llm_context().get("caller")))
+        _account_call(model, base_url, start, None)
+        raise
+    _record_call(model, base_url, start, result)
+    return result
+
+
+async def _schedule_chat_async(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx) -> ChatResult:
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return await _route_chat_async(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+    queued_at = time.perf_counter()
+    async with scheduler.slot_async(priority_class(get_llm_context().get("caller"))):
+        llm_tracing.set_attributes(queue_wait_ms=round((time.perf_counter() - queued_at) * 1000, 3))
+        return await _route_chat_async(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx)
+
+
+async def _route_chat_async(messages, model, temperature, max_tokens, timeout, base_url, keep_alive, num_ctx) -> ChatResult:
+    args = (messages, model, temperature, max_tokens, timeout)
+    options = _request_options(keep_alive, num_ctx)
+    pool = None if base_url else _select_pool()
+    start = time.perf_counter()
+    try:
+        if pool is None:
+            base_url = base_url or _ollama_base_url
+            result = await _provider.chat_async(*args, base_url, *options)
+        else:
+            with pool.lease(_sticky_key()) as backend:
+                base_url = backend.base_url
+                result = await _provider.chat_async(*args, base_url, *options)
+    except Exception:
+        llm_metrics.LLM_FAILURES.inc(llm_metrics.caller_label(get_llm_context().get("caller")))
+        _account_call(model, base_url, start, None)
+        raise
+    _record_call(model, base_url, start, result)
+    return result
+
+
+async def embed_async(
+    texts: List[str],
+    model: str,
+    base_url: Optional[str] = None,
+    timeout: float = 60
+) -> List[List[float]]:
+    """
+    Эмбеддинги текстов через текущего провайдера.
+
+    Хост выбирается из пула чата, но ошибки не учитываются в его здоровье:
+    отсутствие модели эмбеддингов не должно исключать хост из пула чата.
+    """
+    pool = None if base_url else get_pool(INTERACTIVE_POOL)
+    if pool is None:
+        return await _provider.embed_async(texts, model, base_url or _ollama_base_url, timeout, _keep_alive)
+    with pool.lease(track_health=False) as backend:
+        return await _provider.embed_async(texts, model, backend.base_url, timeout, _keep_alive)
 
 
 def check_ollama_connection(base_url: Optional[str] = None) -> bool:
-    """Проверка подключения к Ollama"""
+    """Проверка подключения к серверу модели (путь проверки зависит от провайдера)"""
     try:
-        url = (base_url or _ollama_base_url).replace('/v1', '')
-        response = httpx.get(f"{url}/api/tags", timeout=5.0)
+        response = httpx.get(f"{native_base_url(base_url)}{_provider.health_path}", timeout=5.0)
         return response.status_code == 200
     except Exception as e:
-        logger.warning(f"Ollama connection check failed: {e}")
+        logger.warning(f"LLM server connection check failed: {e}")
         return False
 
 
-def patch_pageindex_for_ollama(
+def _preload_payload(model: Optional[str], keep_alive: Optional[str]) -> Dict[str, Any]:
+    # Запрос /api/generate без prompt только загружает модель в память
+    payload = {"model": model or _ollama_model}
+    keep_alive = _keep_alive if keep_alive is None else keep_alive
+    if keep_alive:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def preload_model(
+    model: Optional[str] = None,
     base_url: Optional[str] = None,
-    model: Optional[str] = None
+    keep_alive: Optional[str] = None,
+    timeout: float = 300
 ) -> bool:
+    """Загружает модель в память Ollama (блокирует до окончания загрузки)"""
+    if not _provider.loads_models:
+        return True  # llama.cpp и vLLM загружают модель при запуске сервера
+    try:
+        response = _get_http_client().post(
+            f"{native_base_url(base_url)}/api/generate",
+            json=_preload_payload(model, keep_alive),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить модель '{model or _ollama_model}' в Ollama: {e}")
+        return False
+
+
+async def preload_model_async(
+    model: Optional[str] = None,
+    base_url: Optional[str] = None,
+    keep_alive: Optional[str] = None,
+    timeout: float = 300
+):
+    """Асинхронная загрузка модели в память Ollama (исключения пробрасываются)"""
+    if not _provider.loads_models:
+        return
+    response = await _get_http_async_client().post(
+        f"{native_base_url(base_url)}/api/generate",
+        json=_preload_payload(model, keep_alive),
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+
+async def get_loaded_models_async(base_url: Optional[str] = None, timeout: float = 5.0) -> List[str]:
+    """Имена моделей, загруженных в память Ollama сейчас (GET /api/ps)"""
+    if not _provider.loads_models:
+        # Модель загружена с запуска сервера: достаточно проверить, что он отвечает
+        response = await _get_http_async_client().get(f"{native_base_url(base_url)}{_provider.health_path}", timeout=timeout)
+        response.raise_for_status()
+        return [_ollama_model]
+    response = await _get_http_async_client().get(f"{native_base_url(base_url)}/api/ps", timeout=timeout)
+    response.raise_for_status()
+    return [m.get("name") or m.get("model") for m in response.json().get("models", [])]
+
+
+# ---------------------------------------------------------------------------
+# Подключение PageIndex
+# ---------------------------------------------------------------------------
+
+PAGEINDEX_MAX_RETRIES = 10
+PAGEINDEX_RETRY_DELAY = 1  # секунд между попытками
+PAGEINDEX_TIMEOUT = 900  # 15 минут timeout для больших документов
+# utils и модули, которые копируют его функции через "from .utils import *"
+PAGEINDEX_MODULES = ("utils", "page_index", "page_index_md")
+
+
+def _pageindex_messages(prompt, chat_history) -> List[Dict[str, str]]:
+    if chat_history:
+        return [*chat_history, {"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+def _retry_failed(name: str, attempt: int, error: Exception, prompt) -> bool:
+    """Лог и метрика неудачной попытки; False - попытки исчерпаны"""
+    logger.warning(f'************* Retrying {name} ({attempt + 1}/{PAGEINDEX_MAX_RETRIES}) *************')
+    logger.error(f"Error: {error}")
+    if attempt < PAGEINDEX_MAX_RETRIES - 1:
+        llm_metrics.LLM_RETRIES.inc(name)
+        return True
+    logger.error('Max retries reached for prompt: ' + str(prompt)[:100])
+    return False
+
+
+def pageindex_chat(model=None, prompt=None, api_key=None, chat_history=None) -> str:
     """
-    Патчит функции PageIndex для работы с Ollama
-    
-    Args:
-        base_url: URL Ollama API (по умолчанию http://localhost:11434/v1)
-        model: Модель Ollama (по умолчанию llama3.2)
-    
-    Returns:
-        True если патчинг успешен
+    ChatGPT_API для PageIndex: запрос к модели из настроек через текущего
+    провайдера, с повторами. model и api_key от PageIndex не используются.
     """
-    global _ollama_base_url, _ollama_model, _patched, _ollama_client, _ollama_async_client
-    
-    # Устанавливаем настройки
-    new_base_url = base_url or DEFAULT_OLLAMA_BASE_URL
-    new_model = model or DEFAULT_OLLAMA_MODEL
-    
-    # Если патчинг уже выполнен, но модель или URL изменились, сбрасываем патчинг
-    if _patched:
-        if _ollama_base_url != new_base_url or _ollama_model != new_model:
-            logger.info(f"Настройки Ollama изменились (было: {_ollama_model}, стало: {new_model}), перепатчиваем...")
-            _patched = False
-            _ollama_client = None
-            _ollama_async_client = None
-        else:
-            logger.info(f"PageIndex уже патчен для Ollama (model={_ollama_model})")
-            return True
-    
-    # Устанавливаем настройки
-    _ollama_base_url = new_base_url
-    _ollama_model = new_model
-    
-    # Проверяем подключение
-    if not check_ollama_connection(_ollama_base_url):
-        logger.warning("⚠️  Ollama недоступен, но продолжаем патчинг...")
-    
-    try:
-        import sys
-        from pathlib import Path
-        
-        # Добавляем путь к PageIndex в sys.path если его там нет
-        pageindex_path = Path(__file__).parent / "PageIndex"
-        if str(pageindex_path.parent) not in sys.path:
-            sys.path.insert(0, str(pageindex_path.parent))
-        
-        # Импортируем модуль utils
-        # Пробуем разные варианты импорта
-        utils = None
-        utils_module_name = None
-        
-        # Пробуем импортировать из PageIndex.pageindex
-        try:
-            from PageIndex.pageindex import utils
-            utils_module_name = 'PageIndex.pageindex.utils'
-        except ImportError:
-            # Пробуем прямой импорт
+    messages = _pageindex_messages(prompt, chat_history)
+    with llm_tracing.span("pageindex.ChatGPT_API", prompt_chars=len(str(prompt))):
+        for i in range(PAGEINDEX_MAX_RETRIES):
+            llm_tracing.set_attributes(retries=i)
             try:
-                from pageindex import utils
-                utils_module_name = 'pageindex.utils'
-            except ImportError:
-                # Ищем в sys.modules
-                for module_name in list(sys.modules.keys()):
-                    if module_name.endswith('.utils') and 'pageindex' in module_name:
-                        utils = sys.modules[module_name]
-                        utils_module_name = module_name
-                        break
-        
-        # Если не нашли, пробуем импортировать напрямую
-        if utils is None:
+                with llm_context(retries=i):
+                    return chat_completion(messages, timeout=PAGEINDEX_TIMEOUT).content
+            except Exception as e:
+                if not _retry_failed("ChatGPT_API", i, e, prompt):
+                    return "Error"
+                time.sleep(PAGEINDEX_RETRY_DELAY)
+
+
+def pageindex_chat_with_finish_reason(model=None, prompt=None, api_key=None, chat_history=None):
+    """ChatGPT_API_with_finish_reason для PageIndex: (ответ, "finished" | "max_output_reached" | "error")"""
+    messages = _pageindex_messages(prompt, chat_history)
+    with llm_tracing.span("pageindex.ChatGPT_API_with_finish_reason", prompt_chars=len(str(prompt))):
+        for i in range(PAGEINDEX_MAX_RETRIES):
+            llm_tracing.set_attributes(retries=i)
             try:
-                import importlib
-                # Пробуем разные варианты имени модуля
-                for module_name in ['PageIndex.pageindex.utils', 'pageindex.utils', 'PageIndex.pageindex.utils']:
-                    try:
-                        utils = importlib.import_module(module_name)
-                        utils_module_name = module_name
-                        break
-                    except ImportError:
-                        continue
+                with llm_context(retries=i):
+                    result = chat_completion(messages, timeout=PAGEINDEX_TIMEOUT)
             except Exception as e:
-                logger.error(f"Ошибка при импорте utils: {e}")
-        
-        if utils is None:
-            raise ImportError("Не удалось найти модуль utils из PageIndex")
-        
-        logger.info(f"Найден модуль utils: {utils_module_name}")
-        
-        # Создаем клиент OpenAI-совместимый для Ollama
-        # ВАЖНО: api_key должен быть строкой, не None
-        ollama_client = openai.OpenAI(
-            api_key="ollama",  # Не используется, но требуется для совместимости
-            base_url=_ollama_base_url
-        )
-        
-        ollama_async_client = openai.AsyncOpenAI(
-            api_key="ollama",
-            base_url=_ollama_base_url
-        )
-        
-        # Сохраняем клиенты в глобальной области для использования в патченных функциях
-        _ollama_client = ollama_client
-        _ollama_async_client = ollama_async_client
-        
-        # Патчим ChatGPT_API
-        def patched_ChatGPT_API(model=None, prompt=None, api_key=None, chat_history=None):
-            """Патченая версия ChatGPT_API для Ollama"""
-            max_retries = 10
-            # КРИТИЧНО: Всегда используем модель из настроек Ollama, игнорируя переданную модель
-            original_model = model
-            final_model = _ollama_model
-            
-            # Проверяем, не является ли переданная модель OpenAI моделью
-            if model and (model.startswith("gpt-") or model.startswith("claude-") or "openai" in model.lower()):
-                logger.warning(f"🚫 Обнаружена OpenAI модель '{model}', принудительно заменяем на '{final_model}'")
-                model = final_model
-            elif model and model != _ollama_model:
-                logger.warning(f"⚠️ Игнорируем переданную модель '{model}', используем '{final_model}' из настроек Ollama")
-                model = final_model
-            elif model is None:
-                model = final_model
-                logger.debug(f"Используется модель из настроек: '{model}'")
-            
-            # Дополнительная проверка перед запросом
-            if model != _ollama_model:
-                logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: модель '{model}' не совпадает с настройкой '{_ollama_model}'! Принудительно заменяем.")
-                model = _ollama_model
-            
-            # Используем глобальный клиент Ollama
-            client = _ollama_client
-            
-            for i in range(max_retries):
-                try:
-                    if chat_history:
-                        messages = chat_history.copy()
-                        messages.append({"role": "user", "content": prompt})
-                    else:
-                        messages = [{"role": "user", "content": prompt}]
-                    
-                    # КРИТИЧНО: Финальная проверка перед запросом
-                    if model != _ollama_model:
-                        logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: модель '{model}' не совпадает с '{_ollama_model}'! Принудительно заменяем.")
-                        model = _ollama_model
-                    
-                    # КРИТИЧНО: Логируем модель перед запросом для отладки
-                    logger.info(f"🔍 Отправка запроса в Ollama с моделью: '{model}' (должна быть '{_ollama_model}')")
-                    logger.debug(f"📝 Промпт (первые 100 символов): {str(prompt)[:100]}")
-                    
-                    # Дополнительная проверка: убеждаемся что модель точно правильная
-                    assert model == _ollama_model, f"Модель должна быть '{_ollama_model}', но получили '{model}'"
-                    
-                    # КРИТИЧНО: Логируем детали запроса
-                    logger.debug(f"📤 Запрос к Ollama: model='{model}', messages_count={len(messages)}")
-                    
-                    try:
-                        response = client.chat.completions.create(
-                            model=model,
-                            messages=messages,
-                            temperature=0,
-                            timeout=900  # 15 минут timeout для больших документов
-                        )
-                        
-                        # Проверяем, какая модель реально использовалась (если доступно)
-                        if hasattr(response, 'model'):
-                            logger.debug(f"📥 Ответ от Ollama: использована модель '{response.model}'")
-                            
-                    except Exception as api_error:
-                        # Логируем детали ошибки
-                        error_str = str(api_error)
-                        logger.error(f"❌ Ошибка API Ollama: {error_str}")
-                        if "46.9" in error_str or "memory" in error_str.lower():
-                            logger.error(f"🚨 КРИТИЧЕСКАЯ ПРОБЛЕМА: Ollama пытается загрузить большую модель!")
-                            logger.error(f"🚨 Переданная модель: '{model}', ожидаемая: '{_ollama_model}'")
-                            # Проверяем, может быть проблема в имени модели
-                            if ":" in model:
-                                logger.warning(f"⚠️ Имя модели содержит ':', возможно Ollama интерпретирует его неправильно")
-                        raise
-                    
-                    return response.choices[0].message.content
-                except Exception as e:
-                    logger.warning(f'************* Retrying ({i+1}/{max_retries}) *************')
-                    logger.error(f"Error: {e}")
-                    if i < max_retries - 1:
-                        import time
-                        time.sleep(1)
-                    else:
-                        logger.error('Max retries reached for prompt: ' + str(prompt)[:100])
-                        return "Error"
-        
-        # Патчим ChatGPT_API_with_finish_reason
-        def patched_ChatGPT_API_with_finish_reason(model=None, prompt=None, api_key=None, chat_history=None):
-            """Патченая версия ChatGPT_API_with_finish_reason для Ollama"""
-            max_retries = 10
-            # КРИТИЧНО: Всегда используем модель из настроек Ollama, игнорируя переданную модель
-            # так как переданная модель может быть "gpt-4o-2024-11-20" или другой OpenAI моделью
-            original_model = model
-            final_model = _ollama_model
-            
-            # Проверяем, не является ли переданная модель OpenAI моделью
-            if model and (model.startswith("gpt-") or model.startswith("claude-") or "openai" in model.lower()):
-                logger.warning(f"🚫 Обнаружена OpenAI модель '{model}', принудительно заменяем на '{final_model}'")
-                model = final_model
-            elif model and model != _ollama_model:
-                logger.warning(f"⚠️ Игнорируем переданную модель '{model}', используем '{final_model}' из настроек Ollama")
-                model = final_model
-            elif model is None:
-                model = final_model
-                logger.debug(f"Используется модель из настроек: '{model}'")
-            
-            # Дополнительная проверка перед запросом
-            if model != _ollama_model:
-                logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: модель '{model}' не совпадает с настройкой '{_ollama_model}'! Принудительно заменяем.")
-                model = _ollama_model
-            
-            # Используем глобальный клиент Ollama
-            client = _ollama_client
-            
-            for i in range(max_retries):
-                try:
-                    if chat_history:
-                        messages = chat_history.copy()
-                        messages.append({"role": "user", "content": prompt})
-                    else:
-                        messages = [{"role": "user", "content": prompt}]
-                    
-                    # КРИТИЧНО: Финальная проверка перед запросом
-                    if model != _ollama_model:
-                        logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: модель '{model}' не совпадает с '{_ollama_model}'! Принудительно заменяем.")
-                        model = _ollama_model
-                    
-                    # КРИТИЧНО: Логируем модель перед запросом для отладки
-                    logger.info(f"🔍 Отправка запроса в Ollama с моделью: '{model}' (должна быть '{_ollama_model}')")
-                    logger.debug(f"📝 Промпт (первые 100 символов): {str(prompt)[:100]}")
-                    
-                    # Дополнительная проверка: убеждаемся что модель точно правильная
-                    assert model == _ollama_model, f"Модель должна быть '{_ollama_model}', но получили '{model}'"
-                    
-                    # КРИТИЧНО: Логируем детали запроса
-                    logger.debug(f"📤 Запрос к Ollama: model='{model}', messages_count={len(messages)}")
-                    
-                    try:
-                        response = client.chat.completions.create(
-                            model=model,
-                            messages=messages,
-                            temperature=0,
-                            timeout=900  # 15 минут timeout для больших документов
-                        )
-                        
-                        # Проверяем, какая модель реально использовалась (если доступно)
-                        if hasattr(response, 'model'):
-                            logger.debug(f"📥 Ответ от Ollama: использована модель '{response.model}'")
-                        if hasattr(response, 'usage'):
-                            logger.debug(f"📊 Использовано токенов: {response.usage}")
-                            
-                    except Exception as api_error:
-                        # Логируем детали ошибки
-                        error_str = str(api_error)
-                        logger.error(f"❌ Ошибка API Ollama: {error_str}")
-                        if "46.9" in error_str or "memory" in error_str.lower():
-                            logger.error(f"🚨 КРИТИЧЕСКАЯ ПРОБЛЕМА: Ollama пытается загрузить большую модель!")
-                            logger.error(f"🚨 Переданная модель: '{model}', ожидаемая: '{_ollama_model}'")
-                            # Проверяем, может быть проблема в имени модели
-                            if ":" in model:
-                                logger.warning(f"⚠️ Имя модели содержит ':', возможно Ollama интерпретирует его неправильно")
-                        raise
-                    
-                    finish_reason = response.choices[0].finish_reason
-                    if finish_reason == "length":
-                        return response.choices[0].message.content, "max_output_reached"
-                    elif finish_reason == "error":
-                        # Если finish_reason == "error", пробуем повторить запрос
-                        logger.warning(f"Ollama вернул finish_reason='error', повторяю запрос ({i+1}/{max_retries})")
-                        if i < max_retries - 1:
-                            import time
-                            time.sleep(1)
-                            continue
-                        else:
-                            logger.error("Max retries reached, finish_reason='error'")
-                            return "Error", "error"
-                    else:
-                        return response.choices[0].message.content, "finished"
-                except Exception as e:
-                    logger.warning(f'************* Retrying ({i+1}/{max_retries}) *************')
-                    logger.error(f"Error: {e}")
-                    if i < max_retries - 1:
-                        import time
-                        time.sleep(1)
-                    else:
-                        logger.error('Max retries reached for prompt: ' + str(prompt)[:100])
-                        return "Error", "error"
-        
-        # Патчим ChatGPT_API_async
-        async def patched_ChatGPT_API_async(model=None, prompt=None, api_key=None, chat_history=None):
-            """Патченая версия ChatGPT_API_async для Ollama"""
-            max_retries = 10
-            # ВАЖНО: Всегда используем модель из настроек Ollama, игнорируя переданную модель
-            final_model = _ollama_model
-            if model and model != _ollama_model:
-                logger.warning(f"Игнорируем переданную модель '{model}', используем '{final_model}' из настроек Ollama")
-            model = final_model
-            
-            # Используем глобальный асинхронный клиент Ollama
-            if _ollama_async_client is None:
-                logger.error("Ollama async client не инициализирован! Патчинг не был выполнен.")
-                return "Error"
-            client = _ollama_async_client
-            
-            # Подготовка сообщений
-            if chat_history:
-                messages = chat_history.copy()
-                messages.append({"role": "user", "content": prompt})
-            else:
-                messages = [{"role": "user", "content": prompt}]
-            
-            for i in range(max_retries):
-                try:
-                    # КРИТИЧНО: Логируем модель перед запросом для отладки
-                    logger.info(f"🔍 Отправка async запроса в Ollama с моделью: '{model}' (должна быть '{_ollama_model}')")
-                    
-                    response = await client.chat.completions.create(
-                        model=model,
-                        messages=messages,
-                        temperature=0,
-                        timeout=900  # 15 минут timeout для больших документов
-                    )
-                    return response.choices[0].message.content
-                except Exception as e:
-                    logger.warning(f'************* Retrying async ({i+1}/{max_retries}) *************')
-                    logger.error(f"Error: {e}")
-                    if i < max_retries - 1:
-                        await asyncio.sleep(1)
-                    else:
-                        logger.error('Max retries reached for prompt: ' + str(prompt)[:100])
-                        return "Error"
-        
-        # Патчим count_tokens для работы с моделями Ollama
-        original_count_tokens = utils.count_tokens
-        
-        def patched_count_tokens(text, model=None):
-            """Патченая версия count_tokens для Ollama"""
-            if not text:
-                return 0
+                if not _retry_failed("ChatGPT_API_with_finish_reason", i, e, prompt):
+                    return "Error", "error"
+                time.sleep(PAGEINDEX_RETRY_DELAY)
+                continue
+
+            if result.finish_reason == "length":
+                return result.content, "max_output_reached"
+            if result.finish_reason != "error":
+                return result.content, "finished"
+            # Модель вернула finish_reason == "error" - повторяем запрос
+            logger.warning(f"Модель вернула finish_reason='error', повторяю запрос ({i + 1}/{PAGEINDEX_MAX_RETRIES})")
+            if i == PAGEINDEX_MAX_RETRIES - 1:
+                logger.error("Max retries reached, finish_reason='error'")
+                return "Error", "error"
+            llm_metrics.LLM_RETRIES.inc("ChatGPT_API_with_finish_reason")
+            time.sleep(PAGEINDEX_RETRY_DELAY)
+
+
+async def pageindex_chat_async(model=None, prompt=None, api_key=None, chat_history=None) -> str:
+    """ChatGPT_API_async для PageIndex: ожидание слота планировщика не блокирует event loop"""
+    messages = _pageindex_messages(prompt, chat_history)
+    with llm_tracing.span("pageindex.ChatGPT_API_async", prompt_chars=len(str(prompt))):
+        for i in range(PAGEINDEX_MAX_RETRIES):
+            llm_tracing.set_attributes(retries=i)
             try:
-                # Пробуем использовать оригинальную функцию
-                return original_count_tokens(text, model)
-            except Exception:
-                # Если не получилось (например, модель Ollama не известна tiktoken),
-                # используем универсальный энкодер cl100k_base (используется в GPT-4)
-                import tiktoken
-                try:
-                    enc = tiktoken.get_encoding("cl100k_base")
-                    return len(enc.encode(text))
-                except Exception:
-                    # Если и это не работает, используем простое приближение
-                    # ~4 символа = 1 токен
-                    return len(text) // 4
-        
-        # Заменяем функции в модуле
-        utils.ChatGPT_API = patched_ChatGPT_API
-        utils.ChatGPT_API_with_finish_reason = patched_ChatGPT_API_with_finish_reason
-        utils.ChatGPT_API_async = patched_ChatGPT_API_async
-        utils.count_tokens = patched_count_tokens
-        
-        # Проверяем, что патчинг применился
-        if hasattr(utils, 'ChatGPT_API') and utils.ChatGPT_API == patched_ChatGPT_API:
-            logger.info("Патчинг ChatGPT_API применен успешно")
-        else:
-            logger.warning("Патчинг ChatGPT_API не применен!")
-        
-        # Также патчим в sys.modules на случай, если модуль уже закэширован
-        if utils_module_name and utils_module_name in sys.modules:
-            sys.modules[utils_module_name].ChatGPT_API = patched_ChatGPT_API
-            sys.modules[utils_module_name].ChatGPT_API_with_finish_reason = patched_ChatGPT_API_with_finish_reason
-            sys.modules[utils_module_name].ChatGPT_API_async = patched_ChatGPT_API_async
-            sys.modules[utils_module_name].count_tokens = patched_count_tokens
-            logger.info(f"Патчинг применен к sys.modules['{utils_module_name}']")
-        
-        # КРИТИЧНО: Патчим также в page_index, так как он использует "from .utils import *"
-        # Это означает, что функции копируются в пространство имен page_index
-        # Нужно патчить ВСЕ модули, которые импортировали функции через "from .utils import *"
-        try:
-            # Список модулей для патчинга
-            modules_to_patch = []
-            
-            # Пробуем найти все модули pageindex в sys.modules
-            for module_name in list(sys.modules.keys()):
-                if 'pageindex' in module_name.lower() or 'page_index' in module_name.lower():
-                    if not module_name.endswith('.page_index_md'):
-                        module = sys.modules[module_name]
-                        if hasattr(module, 'ChatGPT_API') or hasattr(module, 'ChatGPT_API_with_finish_reason'):
-                            modules_to_patch.append((module_name, module))
-            
-            # Если не нашли, пробуем импортировать напрямую
-            if not modules_to_patch:
-                try:
-                    import PageIndex.pageindex.page_index as page_index_module
-                    modules_to_patch.append(('PageIndex.pageindex.page_index', page_index_module))
-                except ImportError:
-                    try:
-                        import pageindex.page_index as page_index_module
-                        modules_to_patch.append(('pageindex.page_index', page_index_module))
-                    except ImportError:
-                        pass
-            
-            # Патчим все найденные модули
-            for module_name, module in modules_to_patch:
-                patched_count = 0
-                if hasattr(module, 'ChatGPT_API'):
-                    module.ChatGPT_API = patched_ChatGPT_API
-                    patched_count += 1
-                if hasattr(module, 'ChatGPT_API_with_finish_reason'):
-                    module.ChatGPT_API_with_finish_reason = patched_ChatGPT_API_with_finish_reason
-                    patched_count += 1
-                if hasattr(module, 'ChatGPT_API_async'):
-                    module.ChatGPT_API_async = patched_ChatGPT_API_async
-                    patched_count += 1
-                if hasattr(module, 'count_tokens'):
-                    module.count_tokens = patched_count_tokens
-                    patched_count += 1
-                
-                if patched_count > 0:
-                    logger.info(f"✅ Патчинг применен к {module_name} ({patched_count} функций)")
-                else:
-                    logger.debug(f"Модуль {module_name} не содержит функций для патчинга")
-                    
-        except Exception as e:
-            logger.warning(f"⚠️ Не удалось патчить page_index модули: {e}")
-            import traceback
-            logger.debug(traceback.format_exc())
-        
-        _patched = True
-        
-        # Обновляем настройки для get_ollama_settings
-        global _ollama_settings
-        _ollama_settings = {
-            'base_url': _ollama_base_url,
-            'model': _ollama_model,
-            'patched': True
-        }
-        
-        logger.info(f"✅ PageIndex успешно патчен для Ollama (base_url={_ollama_base_url}, model={_ollama_model})")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при патчинге PageIndex: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return False
+                with llm_context(retries=i):
+                    result = await chat_completion_async(messages, timeout=PAGEINDEX_TIMEOUT)
+                return result.content
+            except Exception as e:
+                if not _retry_failed("ChatGPT_API_async", i, e, prompt):
+                    return "Error"
+                await asyncio.sleep(PAGEINDEX_RETRY_DELAY)
+
+
+def _pdf_page_texts(pdf_path, pdf_parser: str) -> List[str]:
+    """Текст каждой страницы PDF (путь или BytesIO) тем же парсером, что выбрал PageIndex"""
+    if pdf_parser == "PyMuPDF":
+        import fitz
+        doc = fitz.open(stream=pdf_path.getvalue(), filetype="pdf") if hasattr(pdf_path, "getvalue") else fitz.open(pdf_path)
+        with doc:
+            return [page.get_text() for page in doc]
+    if pdf_parser == "PyPDF2":
+        import PyPDF2
+        return [page.extract_text() or "" for page in PyPDF2.PdfReader(pdf_path).pages]
+    raise ValueError(f"Unsupported PDF parser: {pdf_parser}")
+
+
+def pageindex_get_page_tokens(pdf_path, model=None, pdf_parser="PyPDF2"):
+    """
+    get_page_tokens для PageIndex: [(текст страницы, токены), ...]. Токены
+    всех страниц считаются одним вызовом count_tokens_batch, а не по
+    странице за раз.
+    """
+    texts = _pdf_page_texts(pdf_path, pdf_parser)
+    return list(zip(texts, count_tokens_batch(texts, model)))
+
+
+# Функции PageIndex -> функции этого модуля. count_tokens заменяется всегда: свой
+# подсчет PageIndex создает энкодер на каждый вызов и не знает имен моделей Ollama;
+# PAGEINDEX_FAST_TOKEN_COUNT только переключает count_tokens на приближенный подсчет
+PAGEINDEX_FUNCTIONS = {
+    "ChatGPT_API": pageindex_chat,
+    "ChatGPT_API_with_finish_reason": pageindex_chat_with_finish_reason,
+    "ChatGPT_API_async": pageindex_chat_async,
+    "count_tokens": count_tokens,
+    "get_page_tokens": pageindex_get_page_tokens,
+}
+
+
+def bind_pageindex(package: str = "PageIndex.pageindex") -> int:
+    """
+    Подключает PageIndex: его функции LLM-запросов заменяются функциями этого
+    модуля один раз, при загрузке PageIndex. Модули PageIndex, импортированные
+    позже, получают их из utils. Провайдер, сервер и модель читаются при
+    каждом вызове, поэтому их замена не требует повторной привязки.
+    Возвращает число замененных функций.
+    """
+    global _pageindex_bound
+    # Подмодуль PageIndex лежит рядом с этим файлом
+    root = os.path.dirname(os.path.abspath(__file__))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    utils = importlib.import_module(f"{package}.utils")
+    bound = 0
+    for name in PAGEINDEX_MODULES:
+        module = utils if name == "utils" else sys.modules.get(f"{package}.{name}")
+        if module is None:
+            continue
+        for attr, function in PAGEINDEX_FUNCTIONS.items():
+            if hasattr(module, attr):
+                setattr(module, attr, function)
+                bound += 1
+    _pageindex_bound = True
+    logger.info(f"PageIndex ({package}) подключен: функций {bound}, провайдер {_provider.name}, модель {_ollama_model}")
+    return bound
 
 
 def get_ollama_settings():
-    """Получить текущие настройки Ollama"""
-    global _ollama_settings
-    if not _ollama_settings:
-        _ollama_settings = {
-            "base_url": _ollama_base_url,
-            "model": _ollama_model,
-            "patched": _patched
-        }
-    return _ollama_settings
+    """Получить текущие настройки сервера модели"""
+    return {
+        "base_url": _ollama_base_url,
+        "model": _ollama_model,
+        "provider": _provider.name,
+        "pageindex_bound": _pageindex_bound
+    }
@@ -0,0 +1,205 @@
+"""
+Профиль индексации PageIndex по этапам
+
+instrument_pageindex() оборачивает функции этапов в модуле page_index
+(разбор PDF, поиск и преобразование оглавления, проверка страниц,
+построение дерева, summary узлов). Внутри profile_indexing() для каждого
+этапа копятся время и LLM-запросы с токенами; без активного профиля обертка
+только читает contextvar.
+
+    with profile_indexing() as profile:
+        result = page_index_main(pdf_path, opt)
+    report = profile.report(pages=42)
+
+Этапы вложены (проверка и поиск оглавления идут внутри построения дерева):
+seconds этапа включает вложенные, а LLM-запрос относится к самому
+внутреннему этапу, поэтому llm_calls по этапам в сумме дают все запросы.
+"""
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PDF_PARSE = "pdf_parse"
+TOC_DETECTION = "toc_detection"
+TOC_TRANSFORMATION = "toc_transformation"
+VERIFICATION = "verification"
+TREE_BUILDING = "tree_building"
+SUMMARY = "summary"
+OTHER = "other"
+
+# Этап -> функции модуля page_index (отсутствующие в установленной версии PageIndex пропускаются)
+STAGE_FUNCTIONS = {
+    PDF_PARSE: ("get_page_tokens",),
+    TOC_DETECTION: ("check_toc", "find_toc_pages", "toc_detector_single_page", "toc_extractor"),
+    TOC_TRANSFORMATION: ("toc_transformer", "toc_index_extractor"),
+    VERIFICATION: ("verify_toc", "check_title_appearance_in_start_concurrent", "fix_incorrect_toc_with_retries"),
+    TREE_BUILDING: ("tree_parser", "meta_processor", "process_large_node_recursively"),
+    SUMMARY: ("generate_summaries_for_structure",),
+}
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("indexing_profile", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("indexing_stage", default=None)
+
+
+class IndexingProfile:
+    """Время и LLM-запросы по этапам индексации одного документа"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # Сколько вызовов этапа сейчас выполняется: время считается от первого входа до последнего выхода
+        self._active: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> Dict[str, float]:
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {
+                "seconds": 0.0, "calls": 0, "llm_calls": 0, "llm_seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            }
+        return entry
+
+    def enter(self, name: str):
+        with self._lock:
+            self._stage(name)["calls"] += 1
+            active = self._active.setdefault(name, [0, 0.0])
+            if active[0] == 0:
+                active[1] = time.perf_counter()
+            active[0] += 1
+
+    def exit(self, name: str):
+        with self._lock:
+            active = self._active[name]
+            active[0] -= 1
+            # Рекурсивные и параллельные (asyncio.gather) вызовы этапа не суммируют время
+            if active[0] == 0:
+                self._stage(name)["seconds"] += time.perf_counter() - active[1]
+
+    def add_llm_call(self, stage: Optional[str], seconds: float, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        with self._lock:
+            entry = self._stage(stage or OTHER)
+            entry["llm_calls"] += 1
+            entry["llm_seconds"] += seconds
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["completion_tokens"] += completion_tokens or 0
+
+    def report(self, pages: Optional[int] = None) -> Dict[str, Any]:
+        """Отчет: этапы в порядке конвейера, итоги, доля времени этапа от всей индексации"""
+        total = (self.finished or time.perf_counter()) - self.started
+        with self._lock:
+            stages = {name: dict(values) for name, values in self.stages.items()}
+        order = list(STAGE_FUNCTIONS) + [OTHER]
+        report_stages = {}
+        for name in sorted(stages, key=lambda n: order.index(n) if n in order else len(order)):
+            values = stages[name]
+            values["seconds"] = round(values["seconds"], 3)
+            values["llm_seconds"] = round(values["llm_seconds"], 3)
+            values["share"] = round(values["seconds"] / total, 3) if total else 0.0
+            report_stages[name] = values
+        llm_calls = sum(v["llm_calls"] for v in stages.values())
+        return {
+            "total_seconds": round(total, 3),
+            "pages": pages,
+            "seconds_per_page": round(total / pages, 3) if pages else None,
+            "pdf_parse_seconds": report_stages.get(PDF_PARSE, {}).get("seconds", 0.0),
+            "llm_calls": llm_calls,
+            "llm_seconds": round(sum(v["llm_seconds"] for v in stages.values()), 3),
+            "prompt_tokens": sum(v["prompt_tokens"] for v in stages.values()),
+            "completion_tokens": sum(v["completion_tokens"] for v in stages.values()),
+            "stages": report_stages,
+        }
+
+
+@contextmanager
+def profile_indexing():
+    """Профиль для индексации внутри блока (наследуется asyncio-задачами и asyncio.to_thread)"""
+    profile = IndexingProfile()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        profile.finished = time.perf_counter()
+        _current_profile.reset(token)
+
+
+def current_profile() -> Optional[IndexingProfile]:
+    return _current_profile.get()
+
+
+def record_llm_call(seconds: float, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Вызывается для каждого LLM-запроса (см. pageindex_ollama); без профиля ничего не делает"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_llm_call(_current_stage.get(), seconds, prompt_tokens, completion_tokens)
+
+
+@contextmanager
+def stage(name: str):
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        profile.exit(name)
+
+
+def _wrap(func, name: str):
+    if getattr(func, "_profiled_stage", None):
+        return func
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        wrapper = async_wrapper
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+    wrapper._profiled_stage = name
+    return wrapper
+
+
+def instrument_pageindex(module) -> int:
+    """Оборачивает функции этапов в модуле page_index; возвращает число обернутых функций"""
+    wrapped = 0
+    for name, functions in STAGE_FUNCTIONS.items():
+        for function_name in functions:
+            func = getattr(module, function_name, None)
+            if callable(func):
+                setattr(module, function_name, _wrap(func, name))
+                wrapped += 1
+            else:
+                logger.debug(f"PageIndex без функции {function_name}: этап {name} профилируется без нее")
+    return wrapped
+
+
+def report_path(index_path) -> Path:
+    """Отчет рядом с индексом: document_1_index.json -> document_1_index.profile.json"""
+    index_path = Path(index_path)
+    return index_path.with_name(f"{index_path.stem}.profile.json")
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Однострочная сводка для лога: этап время/запросы"""
+    parts = [
+        f"{name} {values['seconds']:.1f}s/{values['llm_calls']} LLM"
+        for name, values in report["stages"].items()
+    ]
+    return f"{report['total_seconds']:.1f}s, {report['llm_calls']} LLM calls: " + ", ".join(parts)